@@ -0,0 +1,80 @@
+"""
+file: benchmarks/cli_startup.py
+brief: wall clock time of short `bench` invocations
+
+Each case runs bin/bench in a fresh interpreter. The bare interpreter start
+is reported as the baseline. Commands which configure the testbench only run
+inside the venv, so pass its interpreter with --python.
+
+Usage:
+```sh
+python benchmarks/cli_startup.py --python venv/bin/python --runs 20 --max-ms 150
+```
+"""
+
+import click
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH = pathlib.Path(__file__).parent.parent / "bin" / "bench"
+
+CASES = [
+    ("help", ["--help"], {}),
+    ("version", ["--version"], {}),
+    ("complete command", [], {"_BENCH_COMPLETE": "bash_complete", "COMP_WORDS": "bench ", "COMP_CWORD": "1"}),
+    ("complete option", [], {"_BENCH_COMPLETE": "bash_complete", "COMP_WORDS": "bench replay --", "COMP_CWORD": "2"}),
+    ("config --example", ["--no-config", "config", "--example"], {}),
+]
+
+
+def measure(command, env, runs):
+    """
+    Wall clock times in ms, after one untimed run to warm the caches.
+    """
+    times = []
+    for run in range(runs + 1):
+        start = time.perf_counter()
+        result = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result.returncode != 0:
+            return None
+        if run:
+            times.append(elapsed)
+    return times
+
+
+@click.command()
+@click.option("--python", "python", default=sys.executable, help="Interpreter to run bench with.")
+@click.option("--runs", default=10, help="Timed runs per case.")
+@click.option("--max-ms", default=None, type=float, help="Exit with an error if the median of a case minus the baseline exceeds this.")
+def main(python, runs, max_ms):
+    """
+    Measure bench startup time.
+    """
+    env = dict(os.environ)
+    baseline = statistics.median(measure([python, "-c", "pass"], env, runs))
+    print(f"{'case':<20} {'median ms':>10} {'min ms':>8} {'- baseline':>11}")
+    print(f"{'interpreter':<20} {baseline:>10.1f}")
+
+    failed = False
+    for name, args, extra_env in CASES:
+        times = measure([python, str(BENCH), *args], {**env, **extra_env}, runs)
+        if times is None:
+            print(f"{name:<20} {'failed':>10}")
+            continue
+        median = statistics.median(times)
+        overhead = median - baseline
+        slow = max_ms is not None and overhead > max_ms
+        failed |= slow
+        print(f"{name:<20} {median:>10.1f} {min(times):>8.1f} {overhead:>11.1f}{'  SLOW' if slow else ''}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
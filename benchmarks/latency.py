@@ -0,0 +1,325 @@
+"""
+file: benchmarks/latency.py
+brief: end-to-end latency of the control.py server, from HTTP request to CAN frame
+
+With the virtual interface the server runs on a thread of this process,
+python-can virtual channels do not cross processes. With any other
+interface (e.g. socketcan on a vcan device) control.py is started as a
+subprocess. Either way a second bus on the same channel observes the frames.
+
+Measured:
+- /set_axis and /enter_mode: request sent to the matching frame on the bus
+- periodic mode frame period and jitter while idle
+- /set_axis requests per second several clients sustain without errors
+
+Usage:
+```sh
+python benchmarks/latency.py --samples 200 --output latency.json
+sudo ip link add dev vcan0 type vcan && sudo ip link set up vcan0
+python benchmarks/latency.py --interface socketcan --channel vcan0
+```
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.tcan_codec import AXIS_COMMAND, SYSTEM_MODE_COMMAND
+from src.tcan_commands import SystemMode
+
+import can
+import click
+import json
+import pathlib
+import platform
+import requests
+import socket
+import statistics
+import subprocess
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+CONTROL = pathlib.Path(__file__).parent.parent / "control.py"
+
+# Nominal period of the mode and axis refresh in control.py
+REFRESH_PERIOD_S = 0.1
+
+# Longest wait for the frame of one request
+FRAME_TIMEOUT_S = 1.0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def summarize(samples, scale=1000.0) -> dict:
+    """
+    Distribution of samples, in ms by default.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] * scale
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered) * scale,
+        "stdev": statistics.pstdev(ordered) * scale,
+        "min": ordered[0] * scale,
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p99": percentile(99),
+        "max": ordered[-1] * scale,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=CONTROL.parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Server:
+    """
+    control.py serving on interface/channel, in process for the virtual
+    interface and as a subprocess otherwise.
+    """
+
+    def __init__(self, interface, channel, jtecu_id, port):
+        self._args = [
+            "--interface", interface,
+            "--channel", channel,
+            "--jtecu_id", str(jtecu_id),
+            "--port", str(port),
+            "serve",
+            # There are no JTECU heartbeats to watch, the watchdog would
+            # switch to EMERGENCY during the measurements
+            "--watchdog-action", "off",
+        ]
+        self._in_process = interface == "virtual"
+        self._url = f"http://localhost:{port}"
+        self._process = None
+
+    @property
+    def url(self):
+        return self._url
+
+    def start(self, timeout=10.0):
+        if self._in_process:
+            import control
+            # Daemon thread: the server has no shutdown route and exits with us
+            threading.Thread(
+                target=control.main,
+                args=(self._args,),
+                kwargs={"standalone_mode": False},
+                name="control",
+                daemon=True,
+            ).start()
+        else:
+            self._process = subprocess.Popen(
+                [sys.executable, str(CONTROL), *self._args],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                requests.get(f"{self._url}/scheduler", timeout=0.5)
+                return self
+            except requests.ConnectionError:
+                time.sleep(0.05)
+        raise RuntimeError("control.py did not start")
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+
+
+def wait_for(bus, arbitration_id, data, since):
+    """
+    Timestamp of the first frame with this ID and payload sent after since,
+    None on timeout.
+    """
+    deadline = time.monotonic() + FRAME_TIMEOUT_S
+    while (remaining := deadline - time.monotonic()) > 0:
+        msg = bus.recv(remaining)
+        if msg is None:
+            break
+        if msg.arbitration_id == arbitration_id and msg.timestamp >= since and bytes(msg.data) == data:
+            return msg.timestamp
+    return None
+
+
+def drain(bus):
+    while bus.recv(0) is not None:
+        pass
+
+
+def request_latency(session, bus, samples, request, frame):
+    """
+    For each sample, post request(i) and wait for the (id, payload) frame(i).
+    Returns the request to frame and HTTP round trip times and the misses.
+    """
+    to_frame = []
+    round_trip = []
+    missed = 0
+    for i in range(samples):
+        drain(bus)
+        url, body = request(i)
+        arbitration_id, data = frame(i)
+        start = time.time()
+        response = session.post(url, json=body)
+        round_trip.append(time.time() - start)
+        response.raise_for_status()
+        timestamp = wait_for(bus, arbitration_id, data, start)
+        if timestamp is None:
+            missed += 1
+        else:
+            to_frame.append(timestamp - start)
+    return {
+        "frame": summarize(to_frame),
+        "http_round_trip": summarize(round_trip),
+        "missed": missed,
+    }
+
+
+def periodic_jitter(bus, arbitration_id, duration):
+    drain(bus)
+    timestamps = []
+    stop = time.monotonic() + duration
+    while (remaining := stop - time.monotonic()) > 0:
+        msg = bus.recv(remaining)
+        if msg is not None and msg.arbitration_id == arbitration_id:
+            timestamps.append(msg.timestamp)
+    periods = [b - a for a, b in zip(timestamps, timestamps[1:])]
+    return {
+        "nominal_ms": REFRESH_PERIOD_S * 1000,
+        "period": summarize(periods),
+        "jitter": summarize([abs(period - REFRESH_PERIOD_S) for period in periods]),
+    }
+
+
+def command_rate(url, bus, arbitration_id, clients, duration):
+    """
+    /set_axis requests per second from several clients posting back to back,
+    and the axis frames per second they turn into.
+    """
+    stop = time.monotonic() + duration
+    frames = 0
+
+    def client(number):
+        session = requests.Session()
+        sent = errors = 0
+        while time.monotonic() < stop:
+            try:
+                response = session.post(f"{url}/set_axis", json=[number, sent & 0xFF, 0, 0, 0, 0, 0, 0])
+                if response.ok:
+                    sent += 1
+                else:
+                    errors += 1
+            except requests.RequestException:
+                errors += 1
+        return sent, errors
+
+    drain(bus)
+    start = time.monotonic()
+    with ThreadPoolExecutor(clients) as pool:
+        results = [pool.submit(client, number) for number in range(clients)]
+        while time.monotonic() < stop:
+            msg = bus.recv(max(0.0, stop - time.monotonic()))
+            if msg is not None and msg.arbitration_id == arbitration_id:
+                frames += 1
+        sent, errors = map(sum, zip(*(result.result() for result in results)))
+    elapsed = time.monotonic() - start
+    return {
+        "clients": clients,
+        "duration_s": elapsed,
+        "requests": sent,
+        "errors": errors,
+        "requests_per_s": sent / elapsed,
+        "axis_frames_per_s": frames / elapsed,
+    }
+
+
+@click.command()
+@click.option("--interface", default="virtual", help="python-can interface of the server and the observer.")
+@click.option("--channel", default="bench-latency", help="Channel, e.g. vcan0 with socketcan.")
+@click.option("--jtecu-id", default=1, help="JTECU number the server commands.")
+@click.option("--samples", default=100, help="Requests per latency measurement.")
+@click.option("--jitter-s", default=5.0, help="Seconds of periodic frames to measure.")
+@click.option("--rate-s", default=5.0, help="Seconds of the command rate measurement.")
+@click.option("--clients", default=4, help="Concurrent clients of the command rate measurement.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), default=None, help="Write the results as JSON here.")
+def main(interface, channel, jtecu_id, samples, jitter_s, rate_s, clients, output):
+    """
+    Measure HTTP to CAN latency of control.py.
+    """
+    # The request logging of the server would be measured too
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    observer = can.interface.Bus(interface=interface, channel=channel)
+    server = Server(interface, channel, jtecu_id, free_port()).start()
+    axis_id = AXIS_COMMAND.arbitration_id(jtecu_id)
+    mode_id = SYSTEM_MODE_COMMAND.arbitration_id(jtecu_id)
+    modes = (SystemMode.REMOTE, SystemMode.MANUAL)
+
+    try:
+        session = requests.Session()
+        results = {
+            "meta": {
+                "revision": git_revision(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "python_can": can.__version__,
+                "platform": platform.platform(),
+                "interface": interface,
+                "channel": channel,
+                "samples": samples,
+            },
+            "set_axis": request_latency(
+                session,
+                observer,
+                samples,
+                lambda i: (f"{server.url}/set_axis", list((i + 1).to_bytes(8, "big"))),
+                lambda i: (axis_id, (i + 1).to_bytes(8, "big")),
+            ),
+            "enter_mode": request_latency(
+                session,
+                observer,
+                samples,
+                lambda i: (f"{server.url}/enter_mode/{int(modes[i % 2])}", None),
+                lambda i: (mode_id, SYSTEM_MODE_COMMAND.pack(modes[i % 2])),
+            ),
+            "periodic": periodic_jitter(observer, mode_id, jitter_s),
+            "command_rate": command_rate(server.url, observer, axis_id, clients, rate_s),
+            "scheduler": session.get(f"{server.url}/scheduler").json(),
+        }
+    finally:
+        server.stop()
+        observer.shutdown()
+
+    text = json.dumps(results, indent=2)
+    if output:
+        pathlib.Path(output).write_text(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+file: benchmarks/queue_throughput.py
+brief: items/sec of src.queue.Queue against the previous implementation
+
+A producer thread puts N items which a coroutine on the event loop gets.
+The control server does not use this queue (its commands go through
+src.dispatch.CommandQueue), so these numbers say nothing about the server.
+
+Usage:
+```sh
+python benchmarks/queue_throughput.py --items 100000 --batch 256
+```
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.queue import Queue
+
+import asyncio
+import click
+import threading
+import time
+
+
+class LegacyQueue:
+    """
+    The implementation src.queue.Queue replaced: one coroutine scheduled and
+    one future waited on per item.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def sync_put(self, item):
+        asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+
+    async def async_get(self):
+        return await self._queue.get()
+
+
+def measure(make_queue, produce, consume, items):
+    async def main():
+        q = make_queue(asyncio.get_running_loop())
+        producer = threading.Thread(target=produce, args=(q, items))
+        start = time.perf_counter()
+        producer.start()
+        await consume(q, items)
+        elapsed = time.perf_counter() - start
+        # The legacy producer needs the loop to complete its last put
+        await asyncio.to_thread(producer.join)
+        return elapsed
+
+    return items / asyncio.run(main())
+
+
+def scenarios(batch):
+    def put_each(q, items):
+        for i in range(items):
+            q.sync_put(i)
+
+    def put_batches(q, items):
+        for start in range(0, items, batch):
+            q.sync_put_many(range(start, min(start + batch, items)))
+
+    async def get_each(q, items):
+        for _ in range(items):
+            await q.async_get()
+
+    async def get_batches(q, items):
+        received = 0
+        while received < items:
+            received += len(await q.async_get_many(batch))
+
+    return [
+        ("legacy sync_put / async_get", LegacyQueue, put_each, get_each),
+        ("sync_put / async_get", Queue, put_each, get_each),
+        (f"sync_put_many / async_get_many ({batch})", Queue, put_batches, get_batches),
+        (f"bounded {batch * 4}, sync_put_many / async_get_many ({batch})",
+            lambda loop: Queue(loop, maxsize=batch * 4), put_batches, get_batches),
+    ]
+
+
+@click.command()
+@click.option("--items", default=100000, help="Number of items per run.")
+@click.option("--batch", default=256, help="Batch size of the *_many operations.")
+@click.option("--repeat", default=3, help="Runs per scenario, the best is reported.")
+def main(items, batch, repeat):
+    """
+    Compare queue throughput.
+    """
+    baseline = None
+    for name, make_queue, produce, consume in scenarios(batch):
+        rate = max(measure(make_queue, produce, consume, items) for _ in range(repeat))
+        baseline = baseline or rate
+        print(f"{name:<52} {rate:>12,.0f} items/s  {rate / baseline:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,45 @@ file: control.py
 brief: control JTECU
 """
 
-from src.queue import Queue
+from src.axis_tracker import AxisTracker
+from src.bus import BusRegistry, SharedBus
+from src.configuration.v1 import CanBusSpec
+from src.dispatch import (
+    AxisCommand,
+    COMMAND_IDS,
+    CommandQueue,
+    Dispatcher,
+    SystemModeCommand,
+    autocal as autocal_command,
+    is_priority,
+    to_message,
+)
+from src.filters import tcan_ids
+from src.metrics import CONTENT_TYPE, FAST_BUCKETS_S, Metrics
+from src.scheduler import Scheduler
+from src.tcan_codec import AXIS_COMMAND, STATUS_LAYOUTS, SYSTEM_MODE_COMMAND
+from src.telemetry import TelemetryCache, TelemetryDecoder
+from src.transport import AsyncBus, TransportFull
 
 from src.tcan_commands import SystemMode
+from src.watchdog import DEFAULT_HEARTBEAT_TIMEOUT_S, DEFAULT_RESOLUTION_S, HeartbeatWatchdog
+
+from src.wsclient import WebSocketClient
 
 import asyncio
 import can
 import click
 import requests
+import struct
+import threading
+import time
 
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from loguru import logger
 from microdot import Microdot
+from microdot.websocket import WebSocketError, with_websocket
 
 class Context:
     def __init__(
@@ -33,12 +60,77 @@ class Context:
 
         self._loop = asyncio.new_event_loop()
 
-        self._command_queue = Queue(self._loop)
+        # Only the status frames of our JTECU are received
+        self._busses = BusRegistry()
+        self._busses.subscribe(tcan_ids(STATUS_LAYOUTS, [jtecu_id]))
+
+        # Instrumentation, served on /metrics
+        self._metrics = Metrics()
+        self._request_time = self._metrics.timing(
+            "bench_http_request_seconds", "Duration of the HTTP handlers.", ("handler",),
+        )
+        encode_time = self._metrics.timing(
+            "bench_frame_encode_seconds", "Duration of encoding a frame.", ("frame",), FAST_BUCKETS_S,
+        )
+        self._encode_mode_time = encode_time.get("mode")
+        self._encode_axis_time = encode_time.get("axis")
+        self._encode_command_time = encode_time.get("command")
+
+        self._command_queue = CommandQueue(wait=self._metrics.timing(
+            "bench_command_queue_wait_seconds", "Time from queueing a command to sending it.",
+        ).get())
+        self._dispatcher = Dispatcher(self._command_queue)
+
+        self._scheduler = Scheduler()
+
+        self._transport = None
+
+        self._telemetry = TelemetryCache()
+
+        # Commanded vs reported axis values
+        self._axis_tracker = AxisTracker()
 
         self._teleo_mode = SystemMode.MANUAL
 
         self._axis_data = bytearray(8)
 
+        # The mode and axis frames, updated in place and sent every refresh
+        self._mode_frame = SYSTEM_MODE_COMMAND.encoder(jtecu_id)
+        self._mode_frame.encode(self._teleo_mode)
+        self._axis_frame = AXIS_COMMAND.encoder(jtecu_id)
+
+        # Cyclic transmissions, only registered in cyclic mode
+        self._cyclic_bus = None
+        self._cyclic_period = None
+        self._mode_task = None
+        self._axis_task = None
+
+        # Set when the watchdog stopped the axis frames, until the next setpoint
+        self._axis_stopped = False
+        self._watchdog = None
+
+        self._register_gauges()
+
+    def _register_gauges(self):
+        queue = self._command_queue
+        self._metrics.gauge("bench_command_queue_depth", "Commands waiting to be sent.", queue.qsize)
+        self._metrics.gauge("bench_commands_coalesced_total", "Commands superseded while queued.", lambda: queue.coalesced, kind="counter")
+        self._metrics.gauge("bench_commands_rejected_total", "Commands refused by a full queue.", lambda: queue.rejected, kind="counter")
+
+        def transport(key):
+            return lambda: {(self._channel,): self._transport.stats[key]} if self._transport is not None else {}
+
+        self._metrics.gauge("bench_can_tx_pending", "Frames waiting in the transmit queue.", transport("pending"), ("bus",))
+        self._metrics.gauge("bench_can_tx_dropped_total", "Frames dropped by a full transmit queue.", transport("dropped"), ("bus",), kind="counter")
+        self._metrics.gauge("bench_can_enobufs_total", "Sends retried after ENOBUFS.", transport("enobufs"), ("bus",), kind="counter")
+        self._metrics.gauge(
+            "bench_scheduler_missed_total",
+            "Periodic deadlines missed.",
+            lambda: {(name,): stats.missed for name, stats in self._scheduler.stats.items()},
+            ("task",),
+            kind="counter",
+        )
+
     @property
     def loop(self):
         return self._loop
@@ -51,6 +143,14 @@ class Context:
     def channel(self):
         return self._channel
     
+    @property
+    def bus_spec(self):
+        return CanBusSpec(self._interface, self._channel)
+
+    @property
+    def busses(self):
+        return self._busses
+
     @property
     def jtecu_id(self):
         return self._jtecu_id
@@ -66,7 +166,43 @@ class Context:
     @property
     def command_queue(self):
         return self._command_queue
+
+    @property
+    def dispatcher(self):
+        return self._dispatcher
     
+    @property
+    def transport(self):
+        return self._transport
+
+    @property
+    def telemetry(self):
+        return self._telemetry
+
+    @property
+    def axis_tracker(self):
+        return self._axis_tracker
+
+    @property
+    def watchdog(self):
+        return self._watchdog
+
+    @property
+    def axis_stopped(self):
+        return self._axis_stopped
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def request_time(self):
+        return self._request_time
+
     @property
     def teleo_mode(self):
         return self._teleo_mode
@@ -74,20 +210,111 @@ class Context:
     @property
     def axis_data(self):
         return self._axis_data
+
+    @property
+    def mode_frame(self) -> can.Message:
+        return self._mode_frame.message
+
+    @property
+    def axis_frame(self) -> can.Message:
+        return self._axis_frame.message
+
+    def mode_message(self) -> can.Message:
+        """
+        A copy of the mode frame to queue. mode_frame is rewritten in place.
+        """
+        return self._mode_frame.snapshot()
+
+    def axis_message(self) -> can.Message:
+        """
+        A copy of the axis frame to queue. axis_frame is rewritten in place.
+        """
+        return self._axis_frame.snapshot()
     
     def set_teleo_mode(self, mode: SystemMode):
-        if mode in SystemMode:
+        if mode in tuple(SystemMode):
             self._teleo_mode = mode
+            start = time.perf_counter()
+            self._mode_frame.encode(mode)
+            self._encode_mode_time.observe(time.perf_counter() - start)
+            if self._mode_task is not None:
+                self._mode_task.modify_data()
 
     def set_axis_data(self, data: bytearray):
         self._axis_data = data
+        start = time.perf_counter()
+        self._axis_frame.assign(data)
+        self._encode_axis_time.observe(time.perf_counter() - start)
+        if self._axis_stopped:
+            self._axis_stopped = False
+            if self._cyclic_bus is not None:
+                self._axis_task = self._cyclic_bus.send_periodic(self.axis_frame, self._cyclic_period)
+        elif self._axis_task is not None:
+            self._axis_task.modify_data()
+
+    def emergency(self, device: int):
+        """
+        Switch to EMERGENCY mode, the mode command skips ahead of every
+        queued command.
+        """
+        self.set_teleo_mode(SystemMode.EMERGENCY)
+        self._command_queue.put_nowait(SystemModeCommand(device, SystemMode.EMERGENCY))
+
+    def stop_axis(self, device: int):
+        """
+        Stop sending axis frames until the next setpoint.
+        """
+        self._axis_stopped = True
+        if self._axis_task is not None:
+            self._axis_task.stop()
+            self._axis_task = None
+        if self._watchdog is not None:
+            self._watchdog.acted(device)
+
+    def start_watchdog(self, timeout: float, resolution: float, action: str) -> HeartbeatWatchdog:
+        """
+        Watch the heartbeat of the JTECU on the transport. On timeout action
+        "emergency" switches it to EMERGENCY mode, "stop-axis" stops the axis
+        frames.
+        """
+        self._watchdog = HeartbeatWatchdog(
+            self.emergency if action == "emergency" else self.stop_axis,
+            timeout=timeout,
+            resolution=resolution,
+            detection=self._metrics.timing(
+                "bench_heartbeat_detection_delay_seconds", "Time from a missed heartbeat deadline to its detection.",
+            ).get(),
+            action=self._metrics.timing(
+                "bench_heartbeat_action_seconds", "Time from detecting a lost heartbeat to acting on it.",
+            ).get(),
+        )
+        self._transport.add_listener(self._watchdog)
+        self._watchdog.watch(self._jtecu_id)
+        return self._watchdog
 
-    def bus(self) -> can.interface.Bus:
+    def encode(self, command) -> can.Message:
+        start = time.perf_counter()
+        msg = to_message(command)
+        self._encode_command_time.observe(time.perf_counter() - start)
+        return msg
+
+    def start_cyclic(self, bus: SharedBus, period: float):
+        """
+        Register the mode and axis frames for cyclic transmission on the bus.
+        From then on set_teleo_mode and set_axis_data update the frames in place.
         """
-        Create a python-can Bus object using the given configuration.
-        Note: this is addresses the fact that a python-can Bus object is opened
-        when it is created. Use of this method allows the application to decide
-        when access to the bus is needed.
+        self._cyclic_bus = bus
+        self._cyclic_period = period
+        self._mode_task = bus.send_periodic(self.mode_frame, period)
+        if not self._axis_stopped:
+            self._axis_task = bus.send_periodic(self.axis_frame, period)
+
+    def bus(self) -> SharedBus:
+        """
+        Get a reference to the shared python-can Bus for the given configuration.
+        Note: the bus is opened by the first caller and then shared by every
+        task in the application. Each reference must be released, which the
+        context manager does.
 
         Usage:
         ```python
@@ -95,14 +322,27 @@ class Context:
             # do something with the bus
         ```
         """
+        return self._acquire_bus(self._busses.acquire)
+
+    def pin_bus(self) -> SharedBus:
+        """
+        Open the shared bus and keep it open until the registry is shut down.
+        """
+        return self._acquire_bus(self._busses.pin)
+
+    def open_transport(self) -> AsyncBus:
+        """
+        Pin the shared bus and start the asyncio transport on it.
+        Must be called from the running loop.
+        """
+        self._transport = AsyncBus(self.pin_bus(), self._loop, metrics=self._metrics).start()
+        self._transport.add_listener(TelemetryDecoder(self._telemetry))
+        self._transport.add_listener(self._axis_tracker)
+        return self._transport
+
+    def _acquire_bus(self, acquire) -> SharedBus:
         try:
-            return can.interface.Bus(
-                interface=self._interface,
-                channel=self._channel,
-                filters=[
-                    {"can_id": 0x11, "can_mask": 0x21, "extended": False},
-                ],
-            )
+            return acquire(self.bus_spec)
         except OSError as e:
             if e.errno == 19:
                 logger.error(
@@ -111,18 +351,30 @@ class Context:
                 exit(1)
             else:
                 raise e
-            
-            
-    
+
 
 # Configure a simple web server
 app = Microdot()
 
+@app.before_request
+async def start_request_timer(request):
+    request.g.start = time.perf_counter()
+
+@app.after_request
+async def observe_request_time(request, response):
+    app.context.request_time.get(request.route.__name__).observe(time.perf_counter() - request.g.start)
+
+@app.get("/metrics")
+async def metrics(request):
+    return app.context.metrics.render(), 200, {"Content-Type": CONTENT_TYPE}
+
 @app.post("/enter_mode/<int:mode>")
 async def enter_mode(request, mode: int):
-    logger.info(f"enter_mode {mode}")
-    if mode in SystemMode:
+    logger.trace("enter_mode {}", mode)
+    if mode in tuple(SystemMode):
         app.context.set_teleo_mode(mode)
+        # Send right away rather than on the next refresh
+        app.context.command_queue.put_nowait(SystemModeCommand(app.context.jtecu_id, mode))
         return {"status": "ok"}
     else:
         return {"status": "error", "message": "Invalid mode"}
@@ -130,14 +382,98 @@ async def enter_mode(request, mode: int):
 @app.post("/set_axis")
 async def set_axis(request):
     data = request.json
-    logger.info(f"set_axis {data}")
+    logger.trace("set_axis {}", data)
+    if len(data) > AXIS_COMMAND.size:
+        return {"status": "error", "message": "Invalid axis data"}
     app.context.set_axis_data(bytearray(data))
+    app.context.command_queue.put_nowait(AxisCommand(app.context.jtecu_id, app.context.axis_data))
     return {"status": "ok"}
 
+# Binary axis stream messages: the 8 byte axis payload, optionally preceded
+# by a sequence number and a client timestamp (seconds). Acks carry the
+# sequence number and the server side ingest latency in microseconds, acks of
+# timestamped messages also echo the client timestamp, so the client can
+# measure the full round trip on its own clock.
+AXIS_STREAM_PAYLOAD = struct.Struct(">8s")
+AXIS_STREAM_SEQUENCED = struct.Struct(">I8s")
+AXIS_STREAM_TIMESTAMPED = struct.Struct(">Id8s")
+AXIS_STREAM_ACK = struct.Struct(">II")
+AXIS_STREAM_TIMESTAMPED_ACK = struct.Struct(">IId")
+
+@app.route("/ws/axis")
+@with_websocket
+async def stream_axis(request, ws):
+    logger.info("axis stream opened")
+    ctx = app.context
+    try:
+        while True:
+            message = await ws.receive()
+            received = time.perf_counter()
+            if isinstance(message, str):
+                message = message.encode()
+
+            match len(message):
+                case AXIS_STREAM_PAYLOAD.size:
+                    seq = client_time = None
+                    (payload,) = AXIS_STREAM_PAYLOAD.unpack(message)
+                case AXIS_STREAM_SEQUENCED.size:
+                    client_time = None
+                    seq, payload = AXIS_STREAM_SEQUENCED.unpack(message)
+                case AXIS_STREAM_TIMESTAMPED.size:
+                    seq, client_time, payload = AXIS_STREAM_TIMESTAMPED.unpack(message)
+                case _:
+                    logger.warning(f"Invalid axis stream message of {len(message)} bytes")
+                    continue
+
+            ctx.set_axis_data(bytearray(payload))
+            ctx.command_queue.put_nowait(AxisCommand(ctx.jtecu_id, ctx.axis_data))
+
+            if seq is not None:
+                latency_us = min(int((time.perf_counter() - received) * 1e6), 0xFFFFFFFF)
+                if client_time is None:
+                    await ws.send(AXIS_STREAM_ACK.pack(seq, latency_us))
+                else:
+                    await ws.send(AXIS_STREAM_TIMESTAMPED_ACK.pack(seq, latency_us, client_time))
+    except (WebSocketError, OSError) as e:
+        logger.debug(f"axis stream error: {e}")
+    logger.info("axis stream closed")
+
+@app.get("/scheduler")
+async def scheduler(request):
+    return app.context.scheduler.as_dict()
+
+@app.get("/telemetry")
+async def telemetry(request):
+    return app.context.telemetry.as_dict()
+
+@app.get("/telemetry/<int:device>")
+async def device_telemetry(request, device: int):
+    return app.context.telemetry.device_dict(device)
+
+@app.get("/watchdog")
+async def watchdog(request):
+    if app.context.watchdog is None:
+        return {"status": "error", "message": "The heartbeat watchdog is off"}
+    return app.context.watchdog.as_dict()
+
+@app.get("/axis_latency")
+async def get_axis_latency(request):
+    return app.context.axis_tracker.as_dict()
+
+@app.get("/axis_latency/<int:device>")
+async def device_axis_latency(request, device: int):
+    stats = app.context.axis_tracker.device_dict(device)
+    if stats is None:
+        return {"status": "error", "message": "No axis commands sent to this device"}
+    return stats
+
 @app.post("/autocal")
 async def autocal(request):
-    logger.info("autocal")
-    await app.context.command_queue.async_put("autocal")
+    logger.trace("autocal")
+    try:
+        app.context.command_queue.put_nowait(autocal_command(app.context.jtecu_id))
+    except asyncio.QueueFull:
+        return {"status": "error", "message": "Command queue is full"}
     return {"status": "ok"}
 
 @click.group()
@@ -165,126 +501,110 @@ def main(
     app.context = ctx.obj
 
 @main.command()
+@click.option("--cyclic", is_flag=True, help="hand the periodic mode and axis frames to the kernel (BCM) instead of the event loop")
+@click.option("--spin", type=float, default=0.0, help="busy-wait this many ms before each periodic deadline for sub-ms precision")
+@click.option("--heartbeat-timeout", type=float, default=DEFAULT_HEARTBEAT_TIMEOUT_S, help="seconds without a JTECU heartbeat before the watchdog acts")
+@click.option("--watchdog-resolution", type=float, default=DEFAULT_RESOLUTION_S, help="seconds between watchdog checks, the most a timeout is detected late")
+@click.option("--watchdog-action", type=click.Choice(["emergency", "stop-axis", "off"]), default="emergency", help="what to do when the heartbeat times out, off to run without a JTECU")
 @click.pass_obj
 def serve(
     ctx,
+    cyclic: bool,
+    spin: float,
+    heartbeat_timeout: float,
+    watchdog_resolution: float,
+    watchdog_action: str,
 ):
     """
     Start the JTECU control server.
+
+    The heartbeat watchdog is on by default: without heartbeats from the
+    JTECU, e.g. on a virtual or vcan bus, the server enters EMERGENCY after
+    --heartbeat-timeout seconds. Pass --watchdog-action off to run without it.
     """
     async def run():
 
+        # Open the bus once, it is shared by every task below.
+        # Sends go through the transport so they never block the loop.
+        ctx.open_transport()
+
         # Maintain JTECU mode
         async def service_jtecu():
-            with ctx.bus() as bus:
-                while True:
-                    TCAN_MODE_REFRESH_PERIOD_S = 0.1
-                    await asyncio.sleep(TCAN_MODE_REFRESH_PERIOD_S)
+            TCAN_MODE_REFRESH_PERIOD_S = 0.1
+            if cyclic:
+                # The frames are sent by the bus, hold on to it forever
+                with ctx.bus() as bus:
+                    ctx.start_cyclic(bus, TCAN_MODE_REFRESH_PERIOD_S)
+                    await asyncio.Future()
 
+            def refresh():
+                # These frames are superseded next period, drop rather than wait.
+                # Each is tried on its own so a full queue never starves one.
+                try:
                     # Keep the JTECU in the current mode
-                    msg = can.Message(
-                        arbitration_id=0x500 + ctx.jtecu_id,
-                        data=[ctx.teleo_mode],
-                        is_extended_id=False,
-                    )
-                    bus.send(msg)
-
-                    # Send commanded Axis values
-                    msg = can.Message(
-                        arbitration_id=0x560 + ctx.jtecu_id,
-                        data=list(ctx.axis_data),
-                        is_extended_id=False,
-                    )
-                    bus.send(msg)
+                    ctx.transport.send_nowait(ctx.mode_message())
+                except TransportFull as e:
+                    logger.debug(e)
+
+                # Send commanded Axis values
+                if not ctx.axis_stopped:
+                    try:
+                        ctx.transport.send_nowait(ctx.axis_message())
+                    except TransportFull as e:
+                        logger.debug(e)
+
+            await ctx.scheduler.run(
+                "service_jtecu",
+                TCAN_MODE_REFRESH_PERIOD_S,
+                refresh,
+                spin=spin / 1000,
+            )
         
-        async def handle_command_queue():
-            while True:
-                command = await ctx.command_queue.async_get()
-                print(f"handling command: {command}")
-
-                if command == "autocal":
-
-                    AUTOCAL_COMMAND_VAL = 0xFF01
-                    AUTOCAL_COMMAND_MSB_INDEX = 2
-                    AUTOCAL_COMMAND_LSB_INDEX = 3
-
-                    data = bytearray(8)
-                    data[AUTOCAL_COMMAND_MSB_INDEX] = (AUTOCAL_COMMAND_VAL >> 8) & 0xFF
-                    data[AUTOCAL_COMMAND_LSB_INDEX] = AUTOCAL_COMMAND_VAL & 0xFF
-
-                    # Send autocal command
-                    with ctx.bus() as bus:
-                        msg = can.Message(
-                            arbitration_id=0x550 + ctx.jtecu_id,
-                            data=data,
-                            is_extended_id=False,
-                        )
-                        bus.send(msg)
-                    
-                else:
-                    logger.error(f"Unknown command: {command}")
-
-
-        async def send_some_ids():
-            IDS_TO_SEND = [
-
-                0x00000003,
-
-                0x08000001,
-                0x08000002,
-                0x08000003,
-                0x08000004,
-                0x08000005,
-
-                0x08000066,
-                0x08000067,
-                0x08000068,
-                0x08000069,
-                0x08000070,
-                0x08000071,
-
-                0x05800001,
-            ]
-
-            DELAY_MS = 500
-
-            while True:
-                await asyncio.sleep(DELAY_MS / 1000)
-                with ctx.bus() as bus:
-                    for id in IDS_TO_SEND:
-                        msg = can.Message(
-                            arbitration_id=id,
-                            data=int.to_bytes(id, 8, byteorder="big"),
-                            is_extended_id=True,
-                        )
-                        bus.send(msg)
-                        print(f"sent {id}")
+        # Send queued commands, newest axis/mode command per device first
+        # and emergency mode commands ahead of everything
+        @ctx.dispatcher.handler(*COMMAND_IDS)
+        async def send_command(command):
+            logger.trace("handling command: {}", command)
+            await ctx.transport.send(ctx.encode(command))
+            if type(command) is AxisCommand:
+                ctx.axis_tracker.commanded(command.device, command.data)
+            elif ctx.watchdog is not None and is_priority(command):
+                ctx.watchdog.acted(command.device)
 
 
         # Start the JTECU servicing task
         task_service_jtecu = asyncio.create_task(service_jtecu())
 
         # Start the command queue handling task
-        task_command_queue = asyncio.create_task(handle_command_queue())
+        task_command_queue = asyncio.create_task(ctx.dispatcher.run())
 
-        # A task to send a few random CAN IDs
-        task_send_some_ids = asyncio.create_task(send_some_ids())
+        # Act within heartbeat_timeout + watchdog_resolution of the last heartbeat
+        tasks = []
+        if watchdog_action != "off":
+            watchdog = ctx.start_watchdog(heartbeat_timeout, watchdog_resolution, watchdog_action)
+            tasks.append(asyncio.create_task(watchdog.run(ctx.scheduler)))
 
         # Start the REST server task
         server = asyncio.create_task(app.start_server(
             host=ctx.host,
             port=ctx.port,
         ))
-        print(f"Running on {ctx.host}:{ctx.port}")
+        logger.info(f"Running on {ctx.host}:{ctx.port}")
 
-        await asyncio.gather(
-            server,
-            task_service_jtecu,
-            task_command_queue,
-            task_send_some_ids,
-        )
+        try:
+            await asyncio.gather(
+                server,
+                task_service_jtecu,
+                task_command_queue,
+                *tasks,
+            )
+        finally:
+            await ctx.transport.close()
 
-    ctx.loop.run_until_complete(run())
+    try:
+        ctx.loop.run_until_complete(run())
+    finally:
+        ctx.busses.shutdown()
 
 
 
@@ -307,6 +627,15 @@ def enter_remote(
     else:
         logger.error("Failed to enter remote control mode")
 
+STEERING_MIN = -1000
+STEERING_MAX = 1000
+
+def steering_axis_data(steering: int) -> bytes:
+    """
+    Axis payload commanding the given steering value.
+    """
+    return AXIS_COMMAND.pack(steering, 0, 0, 0)
+
 @main.command()
 @click.option("--mode", type=click.Choice(["manual", "remote"]), default=None, help="switch to the specified mode")
 @click.option("--steering", type=int, default=None, help="steering value")
@@ -343,15 +672,14 @@ def set(
 
 
     if steering is not None:
-        if steering < -1000 or steering > 1000:
+        if steering < STEERING_MIN or steering > STEERING_MAX:
             logger.error("Invalid steering value")
             exit(1)
         
         url = f"http://{ctx.host}:{ctx.port}/set_axis"
 
 
-        data = bytearray(8)
-        data[0:2] = steering.to_bytes(2, byteorder="big", signed=True)
+        data = steering_axis_data(steering)
         response = requests.post(url, json=list(data))
 
         logger.info(response.json())
@@ -380,5 +708,258 @@ def autocal(
         logger.error("Failed to initiate autocal")
 
 
+def format_axis_latency(device, stats) -> str:
+    latency = stats["latency"]
+    line = (
+        f"device {device}: {stats['commands']} commands, {stats['applied']} applied, "
+        f"{stats['superseded']} superseded, {stats['lost']} lost, {stats['pending']} pending"
+    )
+    if latency["count"]:
+        line += (
+            f"; latency p50 {latency['p50'] * 1000:.1f} ms, p90 {latency['p90'] * 1000:.1f} ms, "
+            f"p99 {latency['p99'] * 1000:.1f} ms, max {latency['max'] * 1000:.1f} ms"
+        )
+    return line
+
+@main.command()
+@click.option("--device", type=int, default=None, help="only show this JTECU")
+@click.option("--watch", type=float, default=None, help="repeat every this many seconds")
+@click.pass_obj
+def axis_latency(
+    ctx,
+    device: int | None,
+    watch: float | None,
+):
+    """
+    Show the command to actuation latency of the axis setpoints.
+    """
+    url = f"http://{ctx.host}:{ctx.port}/axis_latency"
+    while True:
+        stats = requests.get(url).json()
+        if device is not None:
+            stats = {str(device): stats.get(str(device))}
+        for number, device_stats in stats.items():
+            if device_stats is None:
+                logger.warning(f"No axis commands sent to device {number}")
+            else:
+                print(format_axis_latency(number, device_stats))
+        if watch is None:
+            break
+        time.sleep(watch)
+
+
+StreamCommand = namedtuple("StreamCommand", ["kind", "path", "axis", "delay"])
+
+def parse_stream_line(line: str) -> StreamCommand | None:
+    """
+    Parse one line of a command stream. Supported commands:
+
+        mode manual|remote|emergency
+        steering <-1000..1000>
+        axis <b0> ... <b7>
+        autocal
+        sleep <seconds>
+
+    Blank lines and lines starting with '#' are ignored.
+    """
+    words = line.split()
+    if not words or words[0].startswith("#"):
+        return None
+
+    match words:
+        case ["mode", name] if name.upper() in SystemMode.__members__:
+            mode = SystemMode[name.upper()]
+            return StreamCommand("mode", f"/enter_mode/{int(mode)}", None, None)
+        case ["steering", value]:
+            steering = int(value, 0)
+            if steering < STEERING_MIN or steering > STEERING_MAX:
+                raise ValueError(f"Invalid steering value: {steering}")
+            return StreamCommand("steering", "/set_axis", steering_axis_data(steering), None)
+        case ["axis", *values] if len(values) == 8:
+            return StreamCommand("axis", "/set_axis", bytearray(int(v, 0) for v in values), None)
+        case ["autocal"]:
+            return StreamCommand("autocal", "/autocal", None, None)
+        case ["sleep", seconds]:
+            return StreamCommand("sleep", None, None, float(seconds))
+        case _:
+            raise ValueError(f"Invalid command: {line.strip()}")
+
+class RoundTrips:
+    """
+    Round trip times of streamed commands, per command kind.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._times = {}
+        self._errors = {}
+
+    def record(self, kind: str, rtt: float | None):
+        with self._lock:
+            if rtt is None:
+                self._errors[kind] = self._errors.get(kind, 0) + 1
+            else:
+                self._times.setdefault(kind, []).append(rtt)
+
+    def summary(self, elapsed: float) -> str:
+        lines = [f"{'command':<10} {'count':>7} {'errors':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        total = 0
+        for kind in sorted(self._times.keys() | self._errors.keys()):
+            times = sorted(self._times.get(kind, []))
+            errors = self._errors.get(kind, 0)
+            total += len(times) + errors
+            if times:
+                p50, p95, p99 = (times[min(int(q * len(times)), len(times) - 1)] * 1000 for q in (0.5, 0.95, 0.99))
+                lines.append(
+                    f"{kind:<10} {len(times):>7} {errors:>7} {sum(times) / len(times) * 1000:>9.2f} "
+                    f"{p50:>9.2f} {p95:>9.2f} {p99:>9.2f} {times[-1] * 1000:>9.2f}"
+                )
+            else:
+                lines.append(f"{kind:<10} {0:>7} {errors:>7}")
+        rate = total / elapsed if elapsed else 0.0
+        lines.append(f"{total} commands in {elapsed:.2f} s ({rate:.1f}/s)")
+        return "\n".join(lines)
+
+class HttpStreamer:
+    """
+    Posts streamed commands over keep-alive connections, one requests.Session
+    per worker. With more than one worker, up to `pipeline` commands are in
+    flight and commands in flight at the same time may be applied out of order.
+    """
+    def __init__(self, base_url: str, pipeline: int, round_trips: RoundTrips):
+        self._base_url = base_url
+        self._round_trips = round_trips
+        self._local = threading.local()
+        self._pipeline = pipeline
+        self._executor = ThreadPoolExecutor(max_workers=pipeline, thread_name_prefix="stream")
+        self._window = threading.BoundedSemaphore(pipeline)
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _post(self, command: StreamCommand):
+        start = time.perf_counter()
+        try:
+            json = list(command.axis) if command.axis is not None else None
+            response = self._session().post(self._base_url + command.path, json=json)
+            ok = response.status_code == 200 and response.json().get("status") == "ok"
+        except (requests.RequestException, ValueError) as e:
+            logger.debug(f"{command.kind} failed: {e}")
+            ok = False
+        try:
+            self._round_trips.record(command.kind, time.perf_counter() - start if ok else None)
+        finally:
+            self._window.release()
+
+    def submit(self, command: StreamCommand):
+        self._window.acquire()
+        self._executor.submit(self._post, command)
+
+    def drain(self):
+        # Holding every slot of the window means nothing is in flight
+        for _ in range(self._pipeline):
+            self._window.acquire()
+        for _ in range(self._pipeline):
+            self._window.release()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+class WebSocketStreamer:
+    """
+    Sends axis setpoints as sequenced binary messages on one WebSocket
+    without waiting for acks. Acks are matched by sequence number on a
+    reader thread.
+    """
+    def __init__(self, host: str, port: int, round_trips: RoundTrips):
+        self._ws = WebSocketClient(host, port, "/ws/axis")
+        self._round_trips = round_trips
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._seq = 0
+        self._acked = threading.Condition(self._lock)
+        self._reader = threading.Thread(target=self._read_acks, name="stream-acks", daemon=True)
+        self._reader.start()
+
+    def _read_acks(self):
+        while (message := self._ws.recv()) is not None:
+            now = time.perf_counter()
+            seq, _ = AXIS_STREAM_ACK.unpack(message)
+            with self._lock:
+                sent = self._in_flight.pop(seq, None)
+                self._acked.notify_all()
+            if sent is not None:
+                kind, start = sent
+                self._round_trips.record(kind, now - start)
+
+    def submit(self, command: StreamCommand):
+        with self._lock:
+            self._seq = (self._seq + 1) & 0xFFFFFFFF
+            seq = self._seq
+            self._in_flight[seq] = (command.kind, time.perf_counter())
+        self._ws.send(AXIS_STREAM_SEQUENCED.pack(seq, bytes(command.axis)))
+
+    def drain(self, timeout: float = 2.0):
+        with self._lock:
+            self._acked.wait_for(lambda: not self._in_flight, timeout)
+            for kind, _ in self._in_flight.values():
+                self._round_trips.record(kind, None)
+            self._in_flight.clear()
+
+    def close(self):
+        self.drain()
+        self._ws.close()
+
+@main.command()
+@click.option("--input", "-i", "source", type=click.File("r"), default="-", help="file of newline-delimited commands (default: stdin)")
+@click.option("--pipeline", default=1, help="number of HTTP commands in flight")
+@click.option("--websocket", "use_websocket", is_flag=True, help="send axis and steering setpoints over a single WebSocket")
+@click.pass_obj
+def stream(
+    ctx,
+    source,
+    pipeline: int,
+    use_websocket: bool,
+):
+    """
+    Stream commands to the server over persistent connections.
+    """
+    round_trips = RoundTrips()
+    http = HttpStreamer(f"http://{ctx.host}:{ctx.port}", max(pipeline, 1), round_trips)
+    ws = WebSocketStreamer(ctx.host, ctx.port, round_trips) if use_websocket else None
+
+    start = time.perf_counter()
+    try:
+        for number, line in enumerate(source, start=1):
+            try:
+                command = parse_stream_line(line)
+            except ValueError as e:
+                logger.error(f"line {number}: {e}")
+                continue
+            if command is None:
+                continue
+
+            if command.kind == "sleep":
+                # Everything before a sleep is applied before it
+                http.drain()
+                if ws is not None:
+                    ws.drain()
+                time.sleep(command.delay)
+            elif ws is not None and command.axis is not None:
+                ws.submit(command)
+            else:
+                http.submit(command)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted")
+    finally:
+        http.close()
+        if ws is not None:
+            ws.close()
+
+    print(round_trips.summary(time.perf_counter() - start))
+
+
 if __name__ == '__main__':
     main()
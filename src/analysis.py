@@ -0,0 +1,541 @@
+"""
+file: src/analysis.py
+description: chunked, vectorized statistics of capture files
+
+Needs numpy. The records of a capture are read as numpy structured arrays
+straight from the memory map, a batch of chunks at a time, so memory use is
+bounded by the batch size whatever the size of the capture. Each batch is
+grouped by (channel, arbitration ID) with one sort and reduced with
+bincount/reduceat; the per-batch results are small and merge in order.
+Contiguous ranges of chunks can be analyzed in a process pool.
+
+Computed:
+- per ID: count, rate, period distribution, gaps (periods longer than
+  gap_factor times the ID's median period) and silence at the end
+- per device and status frame: min, max and mean of every numeric field,
+  decoded with the TCAN status layouts
+- per device: timeline of the reported (heartbeat) and commanded modes
+
+Per ID the records are expected in time order across batches, which holds
+for recorded and imported captures.
+"""
+
+from src.capture import CaptureReader, FLAG_ERROR, FLAG_EXTENDED, FLAG_REMOTE, RECORD
+from src.tcan_codec import BASE_MASK, DEVICE_MASK, HEARTBEAT_STATUS, STATUS_CODECS, SYSTEM_MODE_COMMAND
+from src.tcan_commands import SystemMode
+from src.telemetry import signal_name
+
+import math
+import numpy as np
+import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Must match capture.RECORD
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("arbitration_id", "<u4"),
+    ("flags", "u1"),
+    ("dlc", "u1"),
+    ("channel", "u1"),
+    ("pad", "u1"),
+    ("data", "u1", (8,)),
+])
+
+# Period histogram bucket upper bounds: 1 us to 1000 s, 40 per decade.
+# The last bucket counts longer periods.
+PERIOD_BOUNDS = np.logspace(-6, 3, 9 * 40 + 1)
+PERIOD_BUCKETS = len(PERIOD_BOUNDS) + 1
+_PERIOD_UPPER = np.append(PERIOD_BOUNDS, np.inf)
+
+DEFAULT_BATCH_RECORDS = 1 << 18
+DEFAULT_GAP_FACTOR = 3.0
+
+# Gaps listed per ID, further ones are only counted
+MAX_GAPS = 100
+
+# Segments per worker, so that uneven segments still keep every worker busy
+SEGMENTS_PER_JOB = 4
+
+_STRUCT_TYPES = {
+    "B": "u1", "b": "i1",
+    "H": ">u2", "h": ">i2",
+    "I": ">u4", "i": ">i4",
+    "Q": ">u8", "q": ">i8",
+}
+
+
+def codec_dtype(codec) -> np.dtype | None:
+    """
+    numpy dtype of a big endian codec layout, None if it has non-numeric fields.
+    """
+    types = []
+    for count, code in re.findall(r"(\d*)([a-zA-Z])", codec.struct.format.lstrip("<>!=@")):
+        if code not in _STRUCT_TYPES:
+            return None
+        types.extend([_STRUCT_TYPES[code]] * int(count or 1))
+    return np.dtype(list(zip(codec.fields, types)))
+
+
+SIGNAL_DTYPES = {
+    base: dtype
+    for base, dtype in ((base, codec_dtype(codec)) for base, codec in STATUS_CODECS.items())
+    if dtype is not None
+}
+
+
+def _key(channel, extended, arbitration_id):
+    return (channel << 32) | (extended << 30) | arbitration_id
+
+
+def _unkey(key):
+    return key >> 32, bool(key >> 30 & 1), key & 0x1FFFFFFF
+
+
+def _median(hist):
+    """
+    Upper bound of the bucket holding the median, per row of a 2D histogram.
+    NaN for empty rows.
+    """
+    hist = np.atleast_2d(hist)
+    total = hist.sum(axis=1)
+    cumulative = np.cumsum(hist, axis=1)
+    index = np.argmax(cumulative >= np.ceil(total / 2)[:, None], axis=1)
+    return np.where(total > 0, _PERIOD_UPPER[index], np.nan)
+
+
+def _percentile(hist, q):
+    total = hist.sum()
+    if not total:
+        return None
+    index = int(np.argmax(np.cumsum(hist) >= max(1, math.ceil(q / 100 * total))))
+    return float(_PERIOD_UPPER[index])
+
+
+class IdStatistics:
+    """
+    Timing of one arbitration ID on one channel.
+    """
+
+    def __init__(self, count, first, last):
+        self.count = count
+        self.first = first
+        self.last = last
+        self.periods = 0
+        self.period_sum = 0.0
+        self.period_sumsq = 0.0
+        self.period_min = math.inf
+        self.period_max = -math.inf
+        self.hist = np.zeros(PERIOD_BUCKETS, dtype=np.int64)
+        self.gaps = 0
+        self.gap_list = []
+
+    def _add_gaps(self, gaps):
+        self.gaps += len(gaps)
+        room = MAX_GAPS - len(self.gap_list)
+        if room > 0:
+            self.gap_list.extend(gaps[:room])
+
+    def merge(self, other: "IdStatistics", gap_factor: float):
+        """
+        Append the statistics of the records following these.
+        """
+        period = other.first - self.last
+        self.count += other.count
+        self.last = other.last
+        self.periods += other.periods + 1
+        self.period_sum += other.period_sum + period
+        self.period_sumsq += other.period_sumsq + period * period
+        self.period_min = min(self.period_min, other.period_min, period)
+        self.period_max = max(self.period_max, other.period_max, period)
+        self.hist += other.hist
+        self.hist[np.searchsorted(PERIOD_BOUNDS, period)] += 1
+        nominal = _median(self.hist)[0]
+        if period > gap_factor * nominal:
+            self._add_gaps([(other.first - period, period)])
+        self._add_gaps(other.gap_list)
+        self.gaps += other.gaps - len(other.gap_list)
+
+    def as_dict(self, end, gap_factor):
+        duration = self.last - self.first
+        period = {"count": self.periods}
+        if self.periods:
+            mean = self.period_sum / self.periods
+            period.update({
+                "mean": mean,
+                "stdev": math.sqrt(max(0.0, self.period_sumsq / self.periods - mean * mean)),
+                "min": self.period_min,
+                "max": self.period_max,
+                # Bucket bounds, clamped to the observed range
+                "p50": min(max(_percentile(self.hist, 50), self.period_min), self.period_max),
+                "p99": min(max(_percentile(self.hist, 99), self.period_min), self.period_max),
+            })
+        # Silent since this long before the end of the capture
+        silent = end - self.last
+        nominal = period.get("p50")
+        return {
+            "count": self.count,
+            "first": self.first,
+            "last": self.last,
+            "rate": (self.count - 1) / duration if duration > 0 else None,
+            "period": period,
+            "gaps": self.gaps,
+            "gap_list": [{"start": start, "duration": length} for start, length in self.gap_list],
+            "silent_at_end": silent if nominal is not None and silent > gap_factor * nominal else None,
+        }
+
+
+class SignalRange:
+    """
+    Minimum, maximum and sum of every field of one status frame of one device.
+    """
+
+    def __init__(self, fields, count, minimum, maximum, total):
+        self.fields = fields
+        self.count = count
+        self.min = minimum
+        self.max = maximum
+        self.sum = total
+
+    def merge(self, other: "SignalRange"):
+        self.count += other.count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.sum = self.sum + other.sum
+
+    def as_dict(self):
+        return {
+            field: {
+                "min": self.min[i].item(),
+                "max": self.max[i].item(),
+                "mean": self.sum[i].item() / self.count,
+            }
+            for i, field in enumerate(self.fields)
+        }
+
+
+class ModeTimeline:
+    """
+    The modes of one device over time, as first, last and every change.
+    """
+
+    def __init__(self, first, first_mode, last, last_mode, transitions):
+        self.first = first
+        self.first_mode = first_mode
+        self.last = last
+        self.last_mode = last_mode
+        self.transitions = transitions
+
+    def merge(self, other: "ModeTimeline"):
+        if other.first_mode != self.last_mode:
+            self.transitions.append((other.first, self.last_mode, other.first_mode))
+        self.transitions.extend(other.transitions)
+        self.last = other.last
+        self.last_mode = other.last_mode
+
+    def as_dict(self):
+        def name(mode):
+            return SystemMode(mode).name if mode in SystemMode._value2member_map_ else mode
+
+        return {
+            "first": self.first,
+            "initial": name(self.first_mode),
+            "final": name(self.last_mode),
+            "transitions": [
+                {"timestamp": timestamp, "from": name(before), "to": name(after)}
+                for timestamp, before, after in self.transitions
+            ],
+        }
+
+
+def _merge_dict(into, other, merge):
+    for key, value in other.items():
+        existing = into.get(key)
+        if existing is None:
+            into[key] = value
+        else:
+            merge(existing, value)
+
+
+class Analysis:
+    """
+    Statistics of a run of consecutive records. `merge` appends those of the
+    records which follow.
+    """
+
+    def __init__(self, gap_factor: float = DEFAULT_GAP_FACTOR):
+        self.gap_factor = gap_factor
+        self.records = 0
+        self.errors = 0
+        self.start = None
+        self.end = None
+        self.ids = {}
+        self.signals = {}
+        self.reported_modes = {}
+        self.commanded_modes = {}
+
+    def merge(self, other: "Analysis"):
+        self.records += other.records
+        self.errors += other.errors
+        if other.start is not None:
+            self.start = other.start if self.start is None else min(self.start, other.start)
+            self.end = other.end if self.end is None else max(self.end, other.end)
+        _merge_dict(self.ids, other.ids, lambda a, b: a.merge(b, self.gap_factor))
+        _merge_dict(self.signals, other.signals, SignalRange.merge)
+        _merge_dict(self.reported_modes, other.reported_modes, ModeTimeline.merge)
+        _merge_dict(self.commanded_modes, other.commanded_modes, ModeTimeline.merge)
+        return self
+
+    def as_dict(self, channels=()):
+        def channel_name(channel):
+            return channels[channel] if channel < len(channels) else str(channel)
+
+        ids = []
+        for key in sorted(self.ids):
+            channel, extended, arbitration_id = _unkey(key)
+            ids.append({
+                "channel": channel_name(channel),
+                "id": f"{arbitration_id:#x}",
+                "extended": extended,
+                **self.ids[key].as_dict(self.end, self.gap_factor),
+            })
+
+        signals = {}
+        for (device, base), signal in sorted(self.signals.items()):
+            signals.setdefault(str(device), {})[signal_name(base)] = signal.as_dict()
+
+        modes = {}
+        for kind, timelines in (("reported", self.reported_modes), ("commanded", self.commanded_modes)):
+            for device, timeline in sorted(timelines.items()):
+                modes.setdefault(str(device), {})[kind] = timeline.as_dict()
+
+        return {
+            "records": self.records,
+            "errors": self.errors,
+            "start": self.start,
+            "end": self.end,
+            "duration": self.end - self.start if self.start is not None else None,
+            "ids": ids,
+            "signals": signals,
+            "modes": modes,
+        }
+
+
+def _id_statistics(batch, gap_factor) -> dict:
+    keys = (
+        (batch["channel"].astype(np.uint64) << np.uint64(32))
+        | ((batch["flags"] & FLAG_EXTENDED).astype(np.uint64) << np.uint64(30))
+        | batch["arbitration_id"].astype(np.uint64)
+    )
+    order = np.lexsort((batch["timestamp"], keys))
+    keys = keys[order]
+    timestamps = batch["timestamp"][order]
+
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    counts = np.diff(np.append(starts, len(keys)))
+    groups = len(starts)
+    group = np.repeat(np.arange(groups), counts)
+
+    # periods[i] is the time since the previous record of the same ID
+    periods = np.empty(len(timestamps))
+    periods[0] = np.nan
+    np.subtract(timestamps[1:], timestamps[:-1], out=periods[1:])
+    periods[starts] = np.nan
+    valid = np.flatnonzero(~np.isnan(periods))
+    valid_periods = periods[valid]
+    valid_group = group[valid]
+
+    buckets = np.searchsorted(PERIOD_BOUNDS, valid_periods)
+    hist = np.bincount(
+        valid_group * PERIOD_BUCKETS + buckets,
+        minlength=groups * PERIOD_BUCKETS,
+    ).reshape(groups, PERIOD_BUCKETS)
+    period_sum = np.bincount(valid_group, weights=valid_periods, minlength=groups)
+    period_sumsq = np.bincount(valid_group, weights=valid_periods * valid_periods, minlength=groups)
+    period_min = np.fmin.reduceat(periods, starts)
+    period_max = np.fmax.reduceat(periods, starts)
+
+    threshold = gap_factor * _median(hist)
+    gap_index = valid[valid_periods > threshold[valid_group]]
+    gaps = {}
+    for i in gap_index.tolist():
+        gaps.setdefault(group[i], []).append((timestamps[i - 1].item(), periods[i].item()))
+
+    first = timestamps[starts]
+    last = timestamps[starts + counts - 1]
+    result = {}
+    for g, key in enumerate(keys[starts].tolist()):
+        stats = IdStatistics(int(counts[g]), first[g].item(), last[g].item())
+        stats.periods = int(counts[g]) - 1
+        if stats.periods:
+            stats.period_sum = period_sum[g].item()
+            stats.period_sumsq = period_sumsq[g].item()
+            stats.period_min = period_min[g].item()
+            stats.period_max = period_max[g].item()
+            stats.hist = hist[g].copy()
+            stats._add_gaps(gaps.get(g, []))
+        result[key] = stats
+    return result
+
+
+def _signal_ranges(batch, standard, bases) -> dict:
+    result = {}
+    for base, dtype in SIGNAL_DTYPES.items():
+        selected = batch[standard & (bases == base) & (batch["dlc"] >= dtype.itemsize)]
+        if not len(selected):
+            continue
+        values = np.ascontiguousarray(selected["data"][:, :dtype.itemsize]).view(dtype).reshape(-1)
+        columns = np.column_stack([values[field].astype(np.float64) for field in dtype.names])
+        devices = selected["arbitration_id"] & DEVICE_MASK
+        for device in np.unique(devices).tolist():
+            rows = columns[devices == device]
+            result[(device, base)] = SignalRange(
+                dtype.names,
+                len(rows),
+                rows.min(axis=0),
+                rows.max(axis=0),
+                rows.sum(axis=0),
+            )
+    return result
+
+
+def _mode_timelines(batch, standard, bases, base) -> dict:
+    selected = batch[standard & (bases == base) & (batch["dlc"] >= 1)]
+    result = {}
+    if not len(selected):
+        return result
+    devices = selected["arbitration_id"] & DEVICE_MASK
+    for device in np.unique(devices).tolist():
+        rows = selected[devices == device]
+        rows = rows[np.argsort(rows["timestamp"], kind="stable")]
+        timestamps = rows["timestamp"]
+        modes = rows["data"][:, 0]
+        changes = np.flatnonzero(modes[1:] != modes[:-1]) + 1
+        result[device] = ModeTimeline(
+            timestamps[0].item(),
+            int(modes[0]),
+            timestamps[-1].item(),
+            int(modes[-1]),
+            [(timestamps[i].item(), int(modes[i - 1]), int(modes[i])) for i in changes.tolist()],
+        )
+    return result
+
+
+def analyze_records(batch, gap_factor: float = DEFAULT_GAP_FACTOR) -> Analysis:
+    """
+    Statistics of a structured array of RECORD_DTYPE records.
+    """
+    analysis = Analysis(gap_factor)
+    analysis.records = len(batch)
+    if not len(batch):
+        return analysis
+    analysis.start = batch["timestamp"].min().item()
+    analysis.end = batch["timestamp"].max().item()
+
+    error = (batch["flags"] & FLAG_ERROR) != 0
+    analysis.errors = int(error.sum())
+    if analysis.errors:
+        batch = batch[~error]
+        if not len(batch):
+            return analysis
+
+    analysis.ids = _id_statistics(batch, gap_factor)
+    # Remote frames carry a DLC but no data, they would decode as zeros
+    standard = (batch["flags"] & (FLAG_EXTENDED | FLAG_REMOTE)) == 0
+    bases = batch["arbitration_id"] & BASE_MASK
+    analysis.signals = _signal_ranges(batch, standard, bases)
+    analysis.reported_modes = _mode_timelines(batch, standard, bases, HEARTBEAT_STATUS.base)
+    analysis.commanded_modes = _mode_timelines(batch, standard, bases, SYSTEM_MODE_COMMAND.base)
+    return analysis
+
+
+def chunk_array(reader: CaptureReader, number: int) -> np.ndarray:
+    """
+    The records of a chunk as a structured array, without copying.
+    """
+    return np.frombuffer(reader.chunk_view(number), dtype=RECORD_DTYPE)
+
+
+def analyze_segment(path, numbers, batch_records=DEFAULT_BATCH_RECORDS, gap_factor=DEFAULT_GAP_FACTOR) -> Analysis:
+    """
+    Statistics of the given consecutive chunks, batch_records at a time.
+    Runs in the worker processes.
+    """
+    analysis = Analysis(gap_factor)
+    with CaptureReader(path) as reader:
+        pending = []
+        size = 0
+        for position, number in enumerate(numbers):
+            pending.append(chunk_array(reader, number))
+            size += len(pending[-1])
+            if size >= batch_records or position == len(numbers) - 1:
+                batch = pending[0] if len(pending) == 1 else np.concatenate(pending)
+                analysis.merge(analyze_records(batch, gap_factor))
+                # Drop the views before the map is closed
+                del batch
+                pending.clear()
+                size = 0
+    return analysis
+
+
+def segments(reader: CaptureReader, count: int) -> list:
+    """
+    Split the chunks into at most count consecutive runs of about equal records.
+    """
+    chunks = reader.chunks
+    total = sum(chunk.count for chunk in chunks)
+    target = max(1, math.ceil(total / max(1, count)))
+    result = []
+    current = []
+    size = 0
+    for number, chunk in enumerate(chunks):
+        current.append(number)
+        size += chunk.count
+        if size >= target:
+            result.append(current)
+            current = []
+            size = 0
+    if current:
+        result.append(current)
+    return result
+
+
+def analyze(
+    path,
+    jobs: int | None = None,
+    batch_records: int = DEFAULT_BATCH_RECORDS,
+    gap_factor: float = DEFAULT_GAP_FACTOR,
+    progress=None,
+) -> Analysis:
+    """
+    Statistics of a capture file. jobs is the number of worker processes
+    (default: one per CPU, 1 analyzes in this process). progress is called
+    with the number of records analyzed so far.
+    """
+    if RECORD_DTYPE.itemsize != RECORD.size:
+        raise RuntimeError("RECORD_DTYPE does not match the capture record layout.")
+    jobs = jobs or os.cpu_count() or 1
+    with CaptureReader(path) as reader:
+        parts = segments(reader, jobs * SEGMENTS_PER_JOB if jobs > 1 else 1)
+        sizes = [sum(reader.chunks[number].count for number in part) for part in parts]
+
+    analysis = Analysis(gap_factor)
+    done = 0
+    if jobs == 1:
+        for part, size in zip(parts, sizes):
+            analysis.merge(analyze_segment(path, part, batch_records, gap_factor))
+            done += size
+            if progress is not None:
+                progress(done)
+        return analysis
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(analyze_segment, path, part, batch_records, gap_factor) for part in parts]
+        # Results are merged in file order as they arrive
+        for future, size in zip(futures, sizes):
+            analysis.merge(future.result())
+            done += size
+            if progress is not None:
+                progress(done)
+    return analysis
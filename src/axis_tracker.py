@@ -0,0 +1,179 @@
+"""
+file: src/axis_tracker.py
+description: command to actuation latency of the axis setpoints
+
+Every axis command sent to a JTECU (CAN_ID_CONTROLLER_COMMAND_CAN_AXIS) is
+matched to the first CAN_ID_TCU_STAT_CAN_AXIS report of that device which
+carries the commanded values. The latency is measured from the command being
+handed to the bus to the receive timestamp of the report, so it includes the
+reporting period of the TCU.
+
+Commands overtaken by a newer command which is reflected first are counted as
+superseded. Commands which are not reflected within the timeout are lost.
+"""
+
+from src.histogram import Histogram, LATENCY_BUCKETS_S
+from src.tcan_codec import AXIS_COMMAND, AXIS_STATUS, DEVICE_MASK
+
+from collections import deque, namedtuple
+
+import can
+import math
+import time
+
+DEFAULT_TIMEOUT_S = 1.0
+
+# Latencies the rolling percentiles are computed over, per device
+DEFAULT_WINDOW = 1000
+
+# Unreflected commands kept per device, older ones are counted lost
+MAX_PENDING = 64
+
+PendingCommand = namedtuple("PendingCommand", ["values", "timestamp"])
+
+
+def _percentile(ordered, q):
+    # Nearest rank
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class DeviceRoundTrips:
+    """
+    Outstanding commands and latency statistics of one device.
+    """
+
+    def __init__(self, device: int, window: int):
+        self.device = device
+        self.pending = deque()
+        self.recent = deque(maxlen=window)
+        self.latency = Histogram(LATENCY_BUCKETS_S)
+        self.commands = 0
+        self.applied = 0
+        self.superseded = 0
+        self.lost = 0
+        self.reported = None
+
+    def as_dict(self):
+        recent = sorted(self.recent)
+        window = {"count": len(recent)}
+        if recent:
+            window.update({
+                "mean": sum(recent) / len(recent),
+                "p50": _percentile(recent, 50),
+                "p90": _percentile(recent, 90),
+                "p99": _percentile(recent, 99),
+                "max": recent[-1],
+            })
+        return {
+            "commands": self.commands,
+            "applied": self.applied,
+            "superseded": self.superseded,
+            "lost": self.lost,
+            "pending": len(self.pending),
+            "reported": self.reported,
+            "latency": window,
+            "total": {
+                "count": self.latency.count,
+                "mean": self.latency.mean,
+                "max": self.latency.max,
+            },
+        }
+
+
+class AxisTracker(can.Listener):
+    """
+    Correlates commanded and reported axis values per device.
+
+    Call `commanded` when an axis command is sent and register the tracker as
+    a listener of the bus the reports arrive on. Both run on the event loop.
+    Timestamps are epoch seconds like those of received frames.
+    """
+
+    def __init__(
+        self,
+        timeout: float = DEFAULT_TIMEOUT_S,
+        window: int = DEFAULT_WINDOW,
+        tolerance: int = 0,
+        clock=time.time,
+    ):
+        self._timeout = timeout
+        self._window = window
+        self._tolerance = tolerance
+        self._clock = clock
+        self._devices = {}
+
+    @property
+    def devices(self):
+        return sorted(self._devices)
+
+    def _device(self, device: int) -> DeviceRoundTrips:
+        state = self._devices.get(device)
+        if state is None:
+            state = self._devices[device] = DeviceRoundTrips(device, self._window)
+        return state
+
+    def commanded(self, device: int, data, timestamp: float | None = None):
+        """
+        Record an axis command payload (zero padded to 8 bytes) sent now.
+        """
+        values = AXIS_COMMAND.unpack(bytes(data).ljust(AXIS_COMMAND.size, b"\x00"))
+        timestamp = self._clock() if timestamp is None else timestamp
+        state = self._device(device)
+        self._expire(state, timestamp)
+
+        # The same setpoint again: the first command is the one to wait for
+        if state.pending and state.pending[-1].values == values:
+            return
+        if len(state.pending) >= MAX_PENDING:
+            state.pending.popleft()
+            state.lost += 1
+        state.pending.append(PendingCommand(values, timestamp))
+        state.commands += 1
+
+    def _matches(self, commanded, reported) -> bool:
+        if self._tolerance == 0:
+            return commanded == reported
+        return all(abs(c - r) <= self._tolerance for c, r in zip(commanded, reported))
+
+    def _expire(self, state: DeviceRoundTrips, now: float):
+        pending = state.pending
+        while pending and now - pending[0].timestamp > self._timeout:
+            pending.popleft()
+            state.lost += 1
+
+    def on_message_received(self, msg: can.Message):
+        if msg.is_extended_id or msg.is_error_frame:
+            return
+        if msg.arbitration_id & ~DEVICE_MASK != AXIS_STATUS.base or len(msg.data) < AXIS_STATUS.size:
+            return
+        state = self._devices.get(msg.arbitration_id & DEVICE_MASK)
+        if state is None:
+            return
+
+        reported = AXIS_STATUS.unpack(msg.data)
+        state.reported = reported
+        self._expire(state, msg.timestamp)
+        pending = state.pending
+        for index, command in enumerate(pending):
+            if self._matches(command.values, reported):
+                latency = max(0.0, msg.timestamp - command.timestamp)
+                state.latency.observe(latency)
+                state.recent.append(latency)
+                state.applied += 1
+                state.superseded += index
+                for _ in range(index + 1):
+                    pending.popleft()
+                return
+
+    def stop(self):
+        pass
+
+    def device_dict(self, device: int):
+        state = self._devices.get(device)
+        if state is None:
+            return None
+        self._expire(state, self._clock())
+        return state.as_dict()
+
+    def as_dict(self):
+        return {str(device): self.device_dict(device) for device in self.devices}
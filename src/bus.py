@@ -0,0 +1,338 @@
+"""
+file: src/bus.py
+description: shared, reference counted CAN bus registry
+"""
+
+from src.configuration.v1 import CanBusSpec
+from src.filters import KERNEL_MAX_FILTERS, compile_filters
+
+import can
+import errno
+import threading
+import time
+
+from loguru import logger
+
+# errno values which mean the interface behind a bus has gone away
+DISCONNECT_ERRNOS = frozenset({
+    errno.ENODEV,
+    errno.ENXIO,
+    errno.ENETDOWN,
+    errno.EBADF,
+})
+
+# Minimum time between two reconnection attempts on the same bus
+RECONNECT_INTERVAL_S = 1.0
+
+
+def is_disconnect(error: Exception) -> bool:
+    """
+    Whether an exception raised by python-can means the interface is gone.
+    """
+    if isinstance(error, can.CanError):
+        code = error.error_code
+    elif isinstance(error, OSError):
+        code = error.errno
+    else:
+        return False
+    return code in DISCONNECT_ERRNOS
+
+
+class PeriodicTask:
+    """
+    A cyclic transmission registered on a SharedBus.
+
+    The frame is sent by python-can's broadcast manager (SocketCAN BCM where
+    available) so its timing does not depend on the event loop. The task is
+    restarted on the new bus if the shared bus reconnects.
+    """
+
+    def __init__(self, shared, msg: can.Message, period: float):
+        self._shared = shared
+        self._msg = msg
+        self._period = period
+        self._task = None
+
+    @property
+    def message(self):
+        return self._msg
+
+    @property
+    def period(self):
+        return self._period
+
+    def _start(self, bus: can.BusABC):
+        self._task = bus.send_periodic(self._msg, self._period)
+
+    def modify_data(self, msg: can.Message | None = None):
+        """
+        Update the transmitted frame in place.
+        With no argument the (mutated) registered message is resent.
+        """
+        if msg is not None:
+            self._msg = msg
+        if self._task is not None:
+            self._task.modify_data(self._msg)
+
+    def stop(self):
+        self._shared._stop_periodic(self)
+
+
+class SharedBus:
+    """
+    A python-can Bus which is opened once and shared between tasks.
+
+    Instances are handed out by a BusRegistry. Each `acquire` must be paired
+    with a `release`, which using the bus as a context manager does:
+
+    ```python
+    with registry.acquire(spec) as bus:
+        bus.send(msg)
+    ```
+
+    If the interface goes away the bus is reopened on the next send or recv.
+    """
+
+    def __init__(self, registry, spec: CanBusSpec, filters=None):
+        self._registry = registry
+        self._spec = spec
+        self._filters = filters
+        self._lock = threading.RLock()
+        self._bus = None
+        self._refs = 0
+        self._reconnects = 0
+        self._last_reconnect = 0.0
+        self._periodic = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._registry.release(self._spec)
+
+    @property
+    def spec(self):
+        return self._spec
+
+    @property
+    def refs(self):
+        return self._refs
+
+    @property
+    def reconnects(self):
+        return self._reconnects
+
+    @property
+    def is_open(self):
+        return self._bus is not None
+
+    @property
+    def bus(self) -> can.BusABC:
+        """
+        The underlying python-can bus, opened on first use.
+        """
+        bus = self._bus
+        if bus is None:
+            with self._lock:
+                if self._bus is None:
+                    self._open()
+                bus = self._bus
+        return bus
+
+    def _open(self):
+        logger.debug(f"Opening {self._spec.interface} bus '{self._spec.channel}'")
+        self._bus = can.interface.Bus(
+            interface=self._spec.interface,
+            channel=self._spec.channel,
+            filters=self._filters,
+        )
+
+    def _close(self):
+        for task in self._periodic:
+            task._task = None
+        if self._bus is not None:
+            logger.debug(f"Closing {self._spec.interface} bus '{self._spec.channel}'")
+            try:
+                self._bus.shutdown()
+            except Exception as e:
+                logger.warning(f"Error closing bus '{self._spec.channel}': {e}")
+            self._bus = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def reconnect(self):
+        """
+        Close and reopen the underlying bus.
+        Attempts are rate limited to one per RECONNECT_INTERVAL_S.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_reconnect < RECONNECT_INTERVAL_S:
+                return False
+            self._last_reconnect = now
+
+            logger.warning(f"Reconnecting {self._spec.interface} bus '{self._spec.channel}'")
+            self._close()
+            try:
+                self._open()
+            except (can.CanError, OSError) as e:
+                logger.error(f"Failed to reopen bus '{self._spec.channel}': {e}")
+                return False
+            self._reconnects += 1
+            for task in self._periodic:
+                task._start(self._bus)
+            return True
+
+    def send_periodic(self, msg: can.Message, period: float) -> PeriodicTask:
+        """
+        Register msg for cyclic transmission every period seconds.
+        """
+        task = PeriodicTask(self, msg, period)
+        with self._lock:
+            task._start(self.bus)
+            self._periodic.append(task)
+        return task
+
+    def _stop_periodic(self, task: PeriodicTask):
+        with self._lock:
+            if task in self._periodic:
+                self._periodic.remove(task)
+            if task._task is not None:
+                task._task.stop()
+                task._task = None
+
+    def set_filters(self, filters):
+        with self._lock:
+            self._filters = filters
+            if self._bus is not None:
+                self._bus.set_filters(filters)
+
+    def send(self, msg: can.Message, timeout: float | None = None):
+        try:
+            self.bus.send(msg, timeout)
+        except (can.CanError, OSError) as e:
+            if not is_disconnect(e) or not self.reconnect():
+                raise
+            self.bus.send(msg, timeout)
+
+    def recv(self, timeout: float | None = None) -> can.Message | None:
+        try:
+            return self.bus.recv(timeout)
+        except (can.CanError, OSError) as e:
+            if not is_disconnect(e) or not self.reconnect():
+                raise
+            return self.bus.recv(timeout)
+
+
+class BusRegistry:
+    """
+    Registry of shared CAN busses keyed by CanBusSpec.
+
+    A bus is opened by the first `acquire` and closed when its last reference
+    is released, unless it has been pinned. Pinned busses stay open until
+    `shutdown`.
+
+    Busses receive every frame until IDs are subscribed. From then on they
+    are opened with, and open busses switched to, kernel filters compiled
+    from all subscribed IDs (in addition to any explicit `filters`), so
+    unrelated traffic never reaches Python.
+    """
+
+    def __init__(self, filters=None):
+        self._explicit_filters = filters
+        self._filters = filters
+        self._subscribed = {False: set(), True: set()}
+        self._lock = threading.Lock()
+        self._busses = {}
+        self._pinned = set()
+
+    def __contains__(self, spec):
+        return spec in self._busses
+
+    @property
+    def filters(self):
+        """
+        The python-can filters busses are opened with, None for no filtering.
+        """
+        return self._filters
+
+    def subscribe(self, ids, extended: bool = False):
+        """
+        Declare arbitration IDs this process needs to receive.
+        """
+        with self._lock:
+            self._subscribed[extended].update(ids)
+            explicit = list(self._explicit_filters or [])
+            standard = compile_filters(
+                self._subscribed[False],
+                max_filters=KERNEL_MAX_FILTERS - len(explicit) - (1 if self._subscribed[True] else 0),
+            )
+            extended_filters = compile_filters(
+                self._subscribed[True],
+                extended=True,
+                max_filters=KERNEL_MAX_FILTERS - len(explicit) - len(standard),
+            )
+            self._filters = explicit + standard + extended_filters
+            busses = list(self._busses.values())
+        logger.debug(f"Receive filters: {len(self._filters)} for {sum(map(len, self._subscribed.values()))} IDs")
+        for shared in busses:
+            shared.set_filters(self._filters)
+
+    def __iter__(self):
+        return iter(list(self._busses.values()))
+
+    def acquire(self, spec: CanBusSpec) -> SharedBus:
+        """
+        Get a reference to the shared bus for spec, opening it if needed.
+        """
+        with self._lock:
+            shared = self._busses.get(spec)
+            if shared is None:
+                shared = SharedBus(self, spec, self._filters)
+                self._busses[spec] = shared
+            shared._refs += 1
+        try:
+            shared.bus
+        except BaseException:
+            self.release(spec)
+            raise
+        return shared
+
+    def release(self, spec: CanBusSpec):
+        with self._lock:
+            shared = self._busses.get(spec)
+            if shared is None:
+                return
+            shared._refs -= 1
+            if shared._refs > 0 or spec in self._pinned:
+                return
+            del self._busses[spec]
+        shared.close()
+
+    def pin(self, spec: CanBusSpec) -> SharedBus:
+        """
+        Open the bus for spec and keep it open until `shutdown`.
+        """
+        shared = self.acquire(spec)
+        with self._lock:
+            if spec in self._pinned:
+                shared._refs -= 1
+            else:
+                self._pinned.add(spec)
+        return shared
+
+    def open_all(self, specs):
+        """
+        Pin every bus in an iterable of CanBusSpec.
+        """
+        return [self.pin(spec) for spec in specs]
+
+    def shutdown(self):
+        with self._lock:
+            busses = list(self._busses.values())
+            self._busses.clear()
+            self._pinned.clear()
+        for shared in busses:
+            shared.close()
@@ -0,0 +1,146 @@
+"""
+file: src/busstats.py
+description: low overhead per arbitration ID bus statistics
+"""
+
+from array import array
+
+import can
+import math
+
+# Standard IDs index their slot directly
+STANDARD_ID_SLOTS = 0x800
+
+# Extended IDs are assigned slots as they are seen, up to this many
+EXTENDED_ID_SLOTS = 1024
+
+# Nominal frame sizes in bits without the data field and bit stuffing
+STANDARD_FRAME_OVERHEAD_BITS = 47
+EXTENDED_FRAME_OVERHEAD_BITS = 67
+
+
+class BusStatistics(can.Listener):
+    """
+    Per arbitration ID frame statistics of a single bus.
+
+    All counters live in arrays preallocated for every standard ID and a
+    fixed number of extended IDs, so counting a frame never grows them.
+    Extended IDs beyond the preallocated slots are counted in the totals only.
+    """
+
+    def __init__(self, name: str, extended_slots: int = EXTENDED_ID_SLOTS):
+        self._name = name
+        slots = STANDARD_ID_SLOTS + extended_slots
+        self._slots = slots
+        self._extended = {}
+        self._extended_slots = extended_slots
+
+        self._counts = array("Q", bytes(8 * slots))
+        self._last = array("d", bytes(8 * slots))
+        self._interval_sum = array("d", bytes(8 * slots))
+        self._interval_sq = array("d", bytes(8 * slots))
+        self._dlc = array("B", bytes(slots))
+        self._payload = bytearray(8 * slots)
+
+        self._frames = 0
+        self._bits = 0
+        self._errors = 0
+        self._untracked = 0
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def frames(self):
+        return self._frames
+
+    @property
+    def bits(self):
+        return self._bits
+
+    @property
+    def errors(self):
+        return self._errors
+
+    @property
+    def untracked(self):
+        return self._untracked
+
+    def _slot(self, msg: can.Message):
+        if not msg.is_extended_id:
+            return msg.arbitration_id
+        slot = self._extended.get(msg.arbitration_id)
+        if slot is None:
+            if len(self._extended) >= self._extended_slots:
+                return None
+            slot = STANDARD_ID_SLOTS + len(self._extended)
+            self._extended[msg.arbitration_id] = slot
+        return slot
+
+    def on_message_received(self, msg: can.Message):
+        if msg.is_error_frame:
+            self._errors += 1
+            return
+
+        self._frames += 1
+        self._bits += EXTENDED_FRAME_OVERHEAD_BITS if msg.is_extended_id else STANDARD_FRAME_OVERHEAD_BITS
+        if not msg.is_remote_frame:
+            self._bits += 8 * msg.dlc
+
+        slot = self._slot(msg)
+        if slot is None:
+            self._untracked += 1
+            return
+
+        ts = msg.timestamp
+        count = self._counts[slot]
+        if count:
+            interval = ts - self._last[slot]
+            self._interval_sum[slot] += interval
+            self._interval_sq[slot] += interval * interval
+        self._counts[slot] = count + 1
+        self._last[slot] = ts
+        # Each slot holds 8 bytes; remote frames carry no data and CAN FD
+        # frames are cut to their first 8 bytes
+        data = msg.data[:8]
+        self._dlc[slot] = len(data)
+        offset = slot * 8
+        self._payload[offset:offset + 8] = data.ljust(8, b"\0")
+
+    def stop(self):
+        pass
+
+    def snapshot(self):
+        """
+        Copy of the per slot frame counts, used to compute rates.
+        """
+        return array("Q", self._counts)
+
+    def ids(self):
+        """
+        (arbitration_id, is_extended, slot) of every ID seen so far.
+        """
+        for slot in range(STANDARD_ID_SLOTS):
+            if self._counts[slot]:
+                yield slot, False, slot
+        for arbitration_id, slot in self._extended.items():
+            yield arbitration_id, True, slot
+
+    def count(self, slot):
+        return self._counts[slot]
+
+    def period(self, slot):
+        """
+        Mean inter-arrival time and its standard deviation (jitter).
+        """
+        intervals = self._counts[slot] - 1
+        if intervals < 1:
+            return None, None
+        mean = self._interval_sum[slot] / intervals
+        variance = self._interval_sq[slot] / intervals - mean * mean
+        return mean, math.sqrt(max(variance, 0.0))
+
+    def payload(self, slot):
+        offset = slot * 8
+        return bytes(self._payload[offset:offset + self._dlc[slot]])
@@ -0,0 +1,92 @@
+"""
+file: src/cache.py
+description: cache of values derived from files, invalidated by mtime
+"""
+
+import json
+import os
+import pathlib
+import tempfile
+
+
+def default_path() -> pathlib.Path:
+    """
+    $BENCH_CACHE, else bench/cache.json in $XDG_CACHE_HOME (~/.cache).
+    """
+    if "BENCH_CACHE" in os.environ:
+        return pathlib.Path(os.environ["BENCH_CACHE"])
+    base = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(base) / "bench" / "cache.json"
+
+
+class FileCache:
+    """
+    Persists values computed from a file (its version, its parsed contents...)
+    in a JSON file, so they are only computed again once the file changes.
+
+    Entries are keyed by the kind of value and the resolved path of the source,
+    and are valid while the source's mtime and size are unchanged. Values must
+    be JSON serializable; anything else is computed but not cached. A cache
+    which cannot be read or written behaves as an empty one.
+    """
+
+    def __init__(self, path=None):
+        self._path = pathlib.Path(path) if path is not None else default_path()
+        self._entries = None
+        self._dirty = False
+
+    @property
+    def path(self):
+        return self._path
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with self._path.open("r") as f:
+                    self._entries = json.load(f)
+                if not isinstance(self._entries, dict):
+                    self._entries = {}
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, kind: str, source, compute):
+        """
+        The cached `kind` value of the file at `source`, or `compute(source)`
+        if there is none or the file changed since it was cached.
+        """
+        source = pathlib.Path(source)
+        stat = source.stat()
+        key = f"{kind}:{source.resolve()}"
+        stamp = [stat.st_mtime_ns, stat.st_size]
+
+        entries = self._load()
+        entry = entries.get(key)
+        if isinstance(entry, dict) and entry.get("stamp") == stamp:
+            return entry["value"]
+
+        value = compute(source)
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            return value
+        entries[key] = {"stamp": stamp, "value": value}
+        self._dirty = True
+        self.save()
+        return value
+
+    def save(self):
+        if not self._dirty:
+            return
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self._path.parent, prefix=".cache-")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self._path)
+            self._dirty = False
+        except OSError:
+            os.unlink(tmp)
@@ -0,0 +1,414 @@
+"""
+file: src/capture.py
+description: indexed binary CAN capture files
+
+A capture file is a header, a sequence of chunks of fixed-width records and,
+once the file is closed, an index and a footer:
+
+    header   HEADER, then the channel names (UTF-8, newline separated)
+    chunk    CHUNK_HEADER, then `count` RECORDs
+    ...
+    index    CHUNK_ENTRY per chunk, then per arbitration ID an ID_ENTRY
+             followed by the numbers of the chunks holding that ID (u32)
+    footer   FOOTER
+
+Records and chunks have fixed layouts so a file can be memory mapped and
+sliced without parsing. If the writer did not get to close the file (no
+footer) the chunk headers are enough to rebuild the index.
+"""
+
+from array import array
+from collections import namedtuple
+
+import can
+import mmap
+import struct
+
+MAGIC = b"BCAP\x00\x00\x00\x01"
+FOOTER_MAGIC = b"BCAPEND\x01"
+CHUNK_MAGIC = b"CHNK"
+VERSION = 1
+
+# magic, version, record size, records per chunk, channel table length
+HEADER = struct.Struct("<8sHHII")
+# magic, record count, earliest and latest timestamp
+CHUNK_HEADER = struct.Struct("<4sIdd")
+# timestamp, arbitration id, flags, dlc, channel, data
+RECORD = struct.Struct("<dIBBBx8s")
+# chunk offset, record count, earliest and latest timestamp
+CHUNK_ENTRY = struct.Struct("<QIdd")
+# arbitration id, flags (extended), number of chunks
+ID_ENTRY = struct.Struct("<IBxxxI")
+# index offset, chunk count, id count, magic
+FOOTER = struct.Struct("<QII8s")
+
+FLAG_EXTENDED = 0x01
+FLAG_REMOTE = 0x02
+FLAG_ERROR = 0x04
+FLAG_RX = 0x08
+
+DEFAULT_CHUNK_RECORDS = 16384
+
+CaptureRecord = namedtuple(
+    "CaptureRecord",
+    ["timestamp", "arbitration_id", "flags", "dlc", "channel", "data"],
+)
+
+ChunkEntry = namedtuple("ChunkEntry", ["offset", "count", "t_min", "t_max"])
+
+
+def record_flags(msg: can.Message) -> int:
+    flags = 0
+    if msg.is_extended_id:
+        flags |= FLAG_EXTENDED
+    if msg.is_remote_frame:
+        flags |= FLAG_REMOTE
+    if msg.is_error_frame:
+        flags |= FLAG_ERROR
+    if msg.is_rx:
+        flags |= FLAG_RX
+    return flags
+
+
+def to_message(record: CaptureRecord) -> can.Message:
+    """
+    Convert a capture record back into a python-can message.
+    """
+    flags = record.flags
+    return can.Message(
+        timestamp=record.timestamp,
+        arbitration_id=record.arbitration_id,
+        is_extended_id=bool(flags & FLAG_EXTENDED),
+        is_remote_frame=bool(flags & FLAG_REMOTE),
+        is_error_frame=bool(flags & FLAG_ERROR),
+        is_rx=bool(flags & FLAG_RX),
+        dlc=record.dlc,
+        data=record.data[:record.dlc],
+    )
+
+
+class CaptureWriter:
+    """
+    Appends frames to a capture file.
+
+    Records are packed into a preallocated chunk buffer which is written with
+    a single call once full, so the per-frame cost is one `pack_into`.
+    Records hold 8 data bytes, CAN FD frames with more are skipped and counted.
+    """
+
+    def __init__(self, path, channels=("can0",), chunk_records=DEFAULT_CHUNK_RECORDS):
+        self._path = path
+        self._channels = list(channels)
+        self._chunk_records = chunk_records
+        self._buffer = bytearray(CHUNK_HEADER.size + RECORD.size * chunk_records)
+        self._count = 0
+        self._t_min = float("inf")
+        self._t_max = float("-inf")
+        self._chunk_ids = set()
+
+        self._chunks = []
+        self._ids = {}
+        self._records = 0
+        self._skipped = 0
+
+        self._file = open(path, "wb")
+        names = "\n".join(self._channels).encode("utf-8")
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, chunk_records, len(names)))
+        self._file.write(names)
+        self._offset = HEADER.size + len(names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def records(self):
+        return self._records + self._count
+
+    @property
+    def chunks(self):
+        return len(self._chunks)
+
+    @property
+    def skipped(self):
+        return self._skipped
+
+    def write(self, msg: can.Message, channel: int = 0):
+        if len(msg.data) > 8:
+            self._skipped += 1
+            return
+        self.write_raw(
+            msg.timestamp,
+            msg.arbitration_id,
+            record_flags(msg),
+            msg.dlc,
+            channel,
+            bytes(msg.data),
+        )
+
+    def write_raw(self, timestamp, arbitration_id, flags, dlc, channel, data):
+        RECORD.pack_into(
+            self._buffer,
+            CHUNK_HEADER.size + self._count * RECORD.size,
+            timestamp,
+            arbitration_id,
+            flags,
+            dlc,
+            channel,
+            data,
+        )
+        self._count += 1
+        if timestamp < self._t_min:
+            self._t_min = timestamp
+        if timestamp > self._t_max:
+            self._t_max = timestamp
+        self._chunk_ids.add((arbitration_id, flags & FLAG_EXTENDED))
+        if self._count == self._chunk_records:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the current chunk, if it holds any records.
+        """
+        if self._count == 0:
+            return
+        CHUNK_HEADER.pack_into(self._buffer, 0, CHUNK_MAGIC, self._count, self._t_min, self._t_max)
+        size = CHUNK_HEADER.size + self._count * RECORD.size
+        self._file.write(memoryview(self._buffer)[:size])
+        self._file.flush()
+
+        number = len(self._chunks)
+        self._chunks.append(ChunkEntry(self._offset, self._count, self._t_min, self._t_max))
+        for key in self._chunk_ids:
+            chunks = self._ids.get(key)
+            if chunks is None:
+                chunks = self._ids[key] = array("I")
+            chunks.append(number)
+
+        self._offset += size
+        self._records += self._count
+        self._count = 0
+        self._t_min = float("inf")
+        self._t_max = float("-inf")
+        self._chunk_ids.clear()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        index_offset = self._offset
+        for chunk in self._chunks:
+            self._file.write(CHUNK_ENTRY.pack(*chunk))
+        for (arbitration_id, extended), chunks in sorted(self._ids.items()):
+            self._file.write(ID_ENTRY.pack(arbitration_id, extended, len(chunks)))
+            self._file.write(chunks.tobytes())
+        self._file.write(FOOTER.pack(index_offset, len(self._chunks), len(self._ids), FOOTER_MAGIC))
+        self._file.close()
+        self._file = None
+
+
+class CaptureListener(can.Listener):
+    """
+    Writes every received frame of one bus to a CaptureWriter.
+    """
+
+    def __init__(self, writer: CaptureWriter, channel: int = 0):
+        self._writer = writer
+        self._channel = channel
+
+    def on_message_received(self, msg: can.Message):
+        self._writer.write(msg, self._channel)
+
+    def stop(self):
+        pass
+
+
+class CaptureReader:
+    """
+    Memory mapped, indexed access to a capture file.
+
+    `query` only reads the chunks whose time range and ID index match, so
+    selecting one ID in a time window of a large capture does not scan it.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, record_size, chunk_records, names_len = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a capture file.")
+        if version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"Unsupported capture file version {version} in '{path}'.")
+        self._chunk_records = chunk_records
+        names = bytes(self._map[HEADER.size:HEADER.size + names_len]).decode("utf-8")
+        self._channels = names.split("\n") if names else []
+        self._data_offset = HEADER.size + names_len
+
+        self._chunks = []
+        self._ids = {}
+        self._complete = self._read_index()
+        if not self._complete:
+            self._recover_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        for number in range(len(self._chunks)):
+            yield from self.chunk_records(number)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @property
+    def chunks(self):
+        return self._chunks
+
+    @property
+    def complete(self):
+        """
+        False if the file has no footer and its index was rebuilt.
+        """
+        return self._complete
+
+    @property
+    def records(self):
+        return sum(chunk.count for chunk in self._chunks)
+
+    @property
+    def ids(self):
+        """
+        (arbitration_id, extended) of every ID in the capture.
+        """
+        return sorted(self._ids)
+
+    @property
+    def buffer(self):
+        return self._map
+
+    @property
+    def start(self):
+        return min((chunk.t_min for chunk in self._chunks), default=None)
+
+    @property
+    def end(self):
+        return max((chunk.t_max for chunk in self._chunks), default=None)
+
+    def _read_index(self):
+        size = len(self._map)
+        if size < self._data_offset + FOOTER.size:
+            return False
+        index_offset, n_chunks, n_ids, magic = FOOTER.unpack_from(self._map, size - FOOTER.size)
+        if magic != FOOTER_MAGIC:
+            return False
+
+        offset = index_offset
+        for _ in range(n_chunks):
+            self._chunks.append(ChunkEntry(*CHUNK_ENTRY.unpack_from(self._map, offset)))
+            offset += CHUNK_ENTRY.size
+        for _ in range(n_ids):
+            arbitration_id, extended, count = ID_ENTRY.unpack_from(self._map, offset)
+            offset += ID_ENTRY.size
+            chunks = array("I")
+            chunks.frombytes(self._map[offset:offset + 4 * count])
+            offset += 4 * count
+            self._ids[(arbitration_id, extended)] = chunks
+        return True
+
+    def _recover_index(self):
+        offset = self._data_offset
+        size = len(self._map)
+        while offset + CHUNK_HEADER.size <= size:
+            magic, count, t_min, t_max = CHUNK_HEADER.unpack_from(self._map, offset)
+            end = offset + CHUNK_HEADER.size + count * RECORD.size
+            if magic != CHUNK_MAGIC or end > size:
+                break
+            number = len(self._chunks)
+            self._chunks.append(ChunkEntry(offset, count, t_min, t_max))
+            for record in self._iter_chunk(offset, count):
+                key = (record[1], record[2] & FLAG_EXTENDED)
+                chunks = self._ids.get(key)
+                if chunks is None:
+                    chunks = self._ids[key] = array("I")
+                if not chunks or chunks[-1] != number:
+                    chunks.append(number)
+            offset = end
+
+    def _iter_chunk(self, offset, count):
+        start = offset + CHUNK_HEADER.size
+        return RECORD.iter_unpack(self._map[start:start + count * RECORD.size])
+
+    def chunk_view(self, number) -> memoryview:
+        """
+        Zero-copy view of the records of a chunk.
+        """
+        chunk = self._chunks[number]
+        start = chunk.offset + CHUNK_HEADER.size
+        return memoryview(self._map)[start:start + chunk.count * RECORD.size]
+
+    def chunk_records(self, number):
+        chunk = self._chunks[number]
+        for fields in self._iter_chunk(chunk.offset, chunk.count):
+            yield CaptureRecord._make(fields)
+
+    def candidate_chunks(self, ids=None, t0=None, t1=None):
+        """
+        Numbers of the chunks which may hold records matching the query.
+        ids is an iterable of arbitration IDs (standard or extended).
+        """
+        if ids is None:
+            numbers = range(len(self._chunks))
+        else:
+            selected = set()
+            for arbitration_id in ids:
+                for extended in (0, FLAG_EXTENDED):
+                    selected.update(self._ids.get((arbitration_id, extended), ()))
+            numbers = sorted(selected)
+
+        for number in numbers:
+            chunk = self._chunks[number]
+            if t0 is not None and chunk.t_max < t0:
+                continue
+            if t1 is not None and chunk.t_min > t1:
+                continue
+            yield number
+
+    def query(self, ids=None, t0=None, t1=None):
+        """
+        Records with an arbitration ID in ids and t0 <= timestamp <= t1.
+        Any criterion left as None matches everything.
+        """
+        wanted = None if ids is None else frozenset(ids)
+        for number in self.candidate_chunks(wanted, t0, t1):
+            for record in self.chunk_records(number):
+                if wanted is not None and record.arbitration_id not in wanted:
+                    continue
+                if t0 is not None and record.timestamp < t0:
+                    continue
+                if t1 is not None and record.timestamp > t1:
+                    continue
+                yield record
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
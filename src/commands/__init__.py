@@ -1,3 +1,73 @@
-from .config import config
-from .monitor import monitor
-from .serve import serve
+"""
+file: src/commands/__init__.py
+description: bench subcommands, imported only when they are run
+"""
+
+import click
+import importlib
+import keyword
+
+# name: (module, short help). The help is repeated here so that `--help` and
+# shell completion can list the commands without importing them.
+COMMANDS = {
+    "analyze": ("src.commands.analyze", "Analyze the timing and signals of a capture."),
+    "config": ("src.commands.config", "Manage the testbench configuration."),
+    "flash": ("src.commands.flash", "Flash a firmware image (.bin) over TCAN."),
+    "import": ("src.commands.import_", "Import candump, ASC or BLF logs to a capture."),
+    "loadgen": ("src.commands.loadgen", "Generate bus load from a YAML profile."),
+    "monitor": ("src.commands.monitor", "Run testbench monitoring."),
+    "record": ("src.commands.record", "Record bus traffic to a capture file."),
+    "replay": ("src.commands.replay", "Replay a capture file on a bus."),
+    "serve": ("src.commands.serve", "Run the testbench server."),
+}
+
+
+class LazyGroup(click.Group):
+    """
+    A click group which imports the subcommands in `lazy_commands` the first
+    time they are looked up, instead of when the group is defined.
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lazy_commands = dict(lazy_commands or {})
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | self._lazy_commands.keys())
+
+    def get_command(self, ctx, name):
+        if name not in self.commands and name in self._lazy_commands:
+            module, _ = self._lazy_commands[name]
+            # Commands named after a keyword are defined with a trailing underscore
+            attribute = f"{name}_" if keyword.iskeyword(name) else name
+            self.add_command(getattr(importlib.import_module(module), attribute), name)
+        return super().get_command(ctx, name)
+
+    def _short_help(self, ctx, name):
+        if name in self.commands:
+            command = self.commands[name]
+            return None if command.hidden else command.get_short_help_str()
+        return self._lazy_commands[name][1]
+
+    def format_commands(self, ctx, formatter):
+        rows = []
+        for name in self.list_commands(ctx):
+            short_help = self._short_help(ctx, name)
+            if short_help is not None:
+                rows.append((name, short_help))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+    def shell_complete(self, ctx, incomplete):
+        from click.shell_completion import CompletionItem
+
+        results = []
+        for name in self.list_commands(ctx):
+            if name.startswith(incomplete):
+                short_help = self._short_help(ctx, name)
+                if short_help is not None:
+                    results.append(CompletionItem(name, help=short_help))
+        results.extend(click.Command.shell_complete(self, ctx, incomplete))
+        return results
+
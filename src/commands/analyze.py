@@ -0,0 +1,101 @@
+from src.capture import CaptureReader
+
+import click
+import json
+import os
+import sys
+import time
+
+from loguru import logger
+
+
+def _seconds(value) -> str:
+    if value is None:
+        return "-"
+    if value < 1e-3:
+        return f"{value * 1e6:.0f} us"
+    if value < 1:
+        return f"{value * 1e3:.2f} ms"
+    return f"{value:.3f} s"
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{report['records']} records, {report['errors']} error frames, "
+        f"{_seconds(report['duration'])} from {report['start']} to {report['end']}",
+        "",
+        f"{'channel':<10} {'id':>10} {'count':>10} {'rate':>10} {'p50':>10} {'p99':>10} {'max':>10} {'gaps':>6} {'silent':>10}",
+    ]
+    for entry in report["ids"]:
+        period = entry["period"]
+        rate = f"{entry['rate']:.1f}" if entry["rate"] is not None else "-"
+        lines.append(
+            f"{entry['channel']:<10} {entry['id']:>10} {entry['count']:>10} {rate:>10} "
+            f"{_seconds(period.get('p50')):>10} {_seconds(period.get('p99')):>10} {_seconds(period.get('max')):>10} "
+            f"{entry['gaps']:>6} {_seconds(entry['silent_at_end']):>10}"
+        )
+
+    for device, signals in report["signals"].items():
+        lines.append("")
+        lines.append(f"device {device}")
+        for signal, fields in signals.items():
+            ranges = ", ".join(
+                f"{field} {values['min']:g}..{values['max']:g} (mean {values['mean']:.1f})"
+                for field, values in fields.items()
+            )
+            lines.append(f"  {signal}: {ranges}")
+
+    for device, kinds in report["modes"].items():
+        for kind, timeline in kinds.items():
+            lines.append("")
+            lines.append(f"device {device} {kind} mode: {timeline['initial']} at {timeline['first']:.6f}")
+            for transition in timeline["transitions"]:
+                lines.append(f"  {transition['timestamp']:.6f} {transition['from']} -> {transition['to']}")
+    return "\n".join(lines)
+
+
+@click.command()
+@click.argument("capture", type=click.Path(exists=True, dir_okay=False))
+@click.option("--jobs", "-j", type=int, default=None, help="Worker processes. Default: one per CPU, 1 runs in this process.")
+@click.option("--batch-records", type=int, default=None, help="Records analyzed at once per worker, bounds the memory use.")
+@click.option("--gap-factor", type=float, default=None, help="A period longer than this many median periods of its ID is a gap.")
+@click.option("--json", "json_path", type=click.Path(dir_okay=False, writable=True), default=None, help="Also write the full report as JSON.")
+def analyze(capture, jobs, batch_records, gap_factor, json_path):
+    """
+    Analyze the timing and signals of a capture.
+    """
+    try:
+        from src import analysis
+    except ImportError as e:
+        logger.error(f"bench analyze needs numpy: {e}")
+        sys.exit(1)
+
+    if jobs is not None and jobs < 1:
+        logger.error(f"Invalid number of jobs: {jobs}")
+        sys.exit(1)
+    jobs = jobs or os.cpu_count() or 1
+
+    with CaptureReader(capture) as reader:
+        total = reader.records
+        channels = reader.channels
+
+    def progress(done):
+        logger.debug(f"Analyzed {done}/{total} records")
+
+    logger.info(f"Analyzing {total} records of '{capture}' with {jobs} job(s).")
+    start = time.perf_counter()
+    result = analysis.analyze(
+        capture,
+        jobs=jobs,
+        batch_records=batch_records or analysis.DEFAULT_BATCH_RECORDS,
+        gap_factor=gap_factor or analysis.DEFAULT_GAP_FACTOR,
+        progress=progress,
+    )
+    elapsed = time.perf_counter() - start
+    logger.info(f"Analyzed in {elapsed:.2f} s ({total / elapsed if elapsed > 0 else 0:.0f} records/s).")
+
+    report = result.as_dict(channels)
+    if json_path is not None:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    print(format_report(report))
@@ -0,0 +1,75 @@
+from src.ota import (
+    DEFAULT_BLOCK_FRAMES,
+    DEFAULT_RETRIES,
+    DEFAULT_TIMEOUT_S,
+    DEFAULT_WINDOW,
+    Flasher,
+    FirmwareImage,
+    OtaError,
+)
+from src.tcan_commands import TCAN_ID
+from src.transport import AsyncBus
+
+import click
+import sys
+
+from loguru import logger
+
+
+async def flash_image(ctx, spec, image, device, window, timeout, retries):
+    ctx.busses.subscribe([TCAN_ID.CAN_ID_OTA_RESPONSE + device])
+    transport = AsyncBus(ctx.busses.pin(spec)).start()
+    try:
+        flasher = Flasher(transport, device, window=window, timeout=timeout, retries=retries)
+        return await flasher.flash(image)
+    finally:
+        await transport.close()
+
+
+@click.command()
+@click.argument("image", type=click.Path(exists=True, dir_okay=False))
+@click.option("--device", "-d", type=int, required=True, help="Number of the JTECU to flash.")
+@click.option("--bus", "-b", "bus_name", default="tcan", help="Name of the configured bus the device is on.")
+@click.option("--window", default=DEFAULT_WINDOW, help="Number of blocks in flight.")
+@click.option("--block-frames", default=DEFAULT_BLOCK_FRAMES, help="Number of data frames per acknowledged block.")
+@click.option("--timeout", default=DEFAULT_TIMEOUT_S, help="Seconds to wait for a block acknowledgement.")
+@click.option("--retries", default=DEFAULT_RETRIES, help="Retransmissions of a block before giving up.")
+@click.pass_obj
+def flash(
+    ctx,
+    image,
+    device,
+    bus_name,
+    window,
+    block_frames,
+    timeout,
+    retries,
+):
+    """
+    Flash a firmware image (.bin) over TCAN.
+    """
+    configured = ctx.cfg.all_busses
+    if bus_name not in configured:
+        logger.error(f"Unknown bus: {bus_name} (configured: {', '.join(configured)})")
+        sys.exit(1)
+
+    with FirmwareImage(image, block_frames) as firmware:
+        logger.info(f"Flashing '{image}' ({firmware.size} bytes, {firmware.blocks} blocks) to device {device} on {bus_name}.")
+        loop = ctx.loop
+        try:
+            stats = loop.run_until_complete(
+                flash_image(ctx, configured[bus_name], firmware, device, window, timeout, retries)
+            )
+        except OtaError as e:
+            logger.error(f"Flashing failed: {e}")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            logger.warning("Flashing aborted.")
+            sys.exit(1)
+        finally:
+            loop.close()
+
+    print(
+        f"flashed {stats.bytes} bytes in {stats.duration:.2f} s "
+        f"({stats.throughput / 1024:.1f} KiB/s, {stats.frames} frames, {stats.retransmits} blocks retransmitted)"
+    )
@@ -0,0 +1,84 @@
+from src.capture import DEFAULT_CHUNK_RECORDS
+from src.importer import DEFAULT_SEGMENT_BYTES, FORMATS, import_logs
+
+import click
+import sys
+import time
+
+from loguru import logger
+
+
+@click.command("import")
+@click.argument("logs", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--output", "-o", required=True, help="Path of the capture file to write.")
+@click.option("--format", "format", type=click.Choice([*FORMATS.values(), "other"]), default=None, help="Log format. Default is by file extension (.log candump, .asc, .blf, others by python-can).")
+@click.option("--jobs", "-j", type=int, default=None, help="Worker processes. Default: one per CPU, 1 parses in this process.")
+@click.option("--segment-size", type=float, default=DEFAULT_SEGMENT_BYTES / (1 << 20), help="Size in MiB of the pieces of a log parsed by one worker.")
+@click.option("--chunk-records", default=DEFAULT_CHUNK_RECORDS, help="Number of records per chunk.")
+@click.option("--channel", "channels", multiple=True, help="Record a log channel under another name, FROM=TO (e.g. can0=tcan). May be repeated.")
+def import_(logs, output, format, jobs, segment_size, chunk_records, channels):
+    """
+    Import candump, ASC or BLF logs to a capture.
+
+    Several logs are merged into one capture in timestamp order.
+    """
+    if jobs is not None and jobs < 1:
+        logger.error(f"Invalid number of jobs: {jobs}")
+        sys.exit(1)
+    if segment_size <= 0:
+        logger.error(f"Invalid segment size: {segment_size}")
+        sys.exit(1)
+
+    rename = {}
+    for entry in channels:
+        source, separator, target = entry.partition("=")
+        if not separator or not source or not target:
+            logger.error(f"Invalid channel mapping: {entry}")
+            sys.exit(1)
+        rename[source] = target
+
+    last = 0.0
+
+    def progress(statistics):
+        nonlocal last
+        now = time.perf_counter()
+        if now - last < 1.0 and statistics.finished is None:
+            return
+        last = now
+        elapsed = statistics.elapsed
+        if statistics.parsed is None:
+            logger.info(
+                f"Parsed {statistics.parsed_segments}/{statistics.segments} segments, "
+                f"{statistics.parsed_bytes / (1 << 20):.1f}/{statistics.total_bytes / (1 << 20):.1f} MiB, "
+                f"{statistics.frames} frames ({statistics.parsed_bytes / (1 << 20) / elapsed:.1f} MiB/s)"
+            )
+        elif statistics.finished is None:
+            logger.info(f"Merged {statistics.merged}/{statistics.frames} frames")
+
+    logger.info(f"Importing {', '.join(logs)} to '{output}'.")
+    try:
+        statistics = import_logs(
+            logs,
+            output,
+            jobs=jobs,
+            segment_bytes=int(segment_size * (1 << 20)),
+            chunk_records=chunk_records,
+            format=format,
+            rename=rename,
+            progress=progress,
+        )
+    except ValueError as e:
+        logger.error(f"Import failed: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        logger.info("Import interrupted.")
+        sys.exit(1)
+
+    result = statistics.as_dict()
+    if result["skipped"]:
+        logger.warning(f"Skipped {result['skipped']} CAN FD frames with more than 8 bytes of data.")
+    print(
+        f"wrote {result['frames']} frames from {result['bytes'] / (1 << 20):.1f} MiB in {result['seconds']:.2f} s "
+        f"({result['frames_per_second'] or 0:.0f} frames/s, {(result['bytes_per_second'] or 0) / (1 << 20):.1f} MiB/s, "
+        f"parsing took {result['parse_seconds']:.2f} s)"
+    )
@@ -0,0 +1,96 @@
+from src.loadgen import DEFAULT_MAX_BACKLOG, DEFAULT_TICK_S, LoadGenerator, Profile
+from src.transport import AsyncBus
+
+import asyncio
+import click
+import sys
+import yaml
+
+from loguru import logger
+
+
+def summary(stats) -> str:
+    return (
+        f"{stats['rate']:.0f} fps ({stats['load'] * 100:.1f}% load) of "
+        f"{stats['target_rate']:.0f} fps ({stats['target_load'] * 100:.1f}%), "
+        f"{stats['sent']} sent, {stats['skipped']} skipped, "
+        f"{stats['errors']} errors, {stats['enobufs']} ENOBUFS, {stats['pending']} pending"
+    )
+
+
+async def report(generator, interval):
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(summary(generator.as_dict()))
+
+
+async def generate(generator, duration, interval):
+    reporter = asyncio.create_task(report(generator, interval))
+    try:
+        return await generator.run(duration)
+    finally:
+        reporter.cancel()
+
+
+@click.command()
+@click.argument("profile", type=click.Path(exists=True, dir_okay=False))
+@click.option("--bus", "-b", "bus_name", default="tcan", help="Name of the configured bus to load.")
+@click.option("--duration", "-d", type=float, default=None, help="Stop after this many seconds. Overrides the profile.")
+@click.option("--interval", "-i", default=1.0, help="Seconds between progress reports.")
+@click.option("--tick", default=DEFAULT_TICK_S, help="Seconds between batches.")
+@click.option("--tx-queue", default=1024, help="Number of frames the transmit queue holds.")
+@click.option("--max-backlog", default=DEFAULT_MAX_BACKLOG, help="Frames a stream may fall behind before it skips ahead.")
+@click.option("--seed", type=int, default=None, help="Seed of the random payloads.")
+@click.pass_obj
+def loadgen(
+    ctx,
+    profile,
+    bus_name,
+    duration,
+    interval,
+    tick,
+    tx_queue,
+    max_backlog,
+    seed,
+):
+    """
+    Generate bus load from a YAML profile.
+    """
+    configured = ctx.cfg.all_busses
+    if bus_name not in configured:
+        logger.error(f"Unknown bus: {bus_name} (configured: {', '.join(configured)})")
+        sys.exit(1)
+
+    try:
+        load_profile = Profile.load_file(profile, seed=seed)
+    except (ValueError, TypeError, KeyError, yaml.YAMLError) as e:
+        logger.error(f"Invalid profile '{profile}': {e}")
+        sys.exit(1)
+
+    logger.info(
+        f"Loading {bus_name} with {len(load_profile.streams)} stream(s): "
+        f"{load_profile.rate:.0f} fps, {load_profile.load * 100:.1f}% of {load_profile.bitrate} bit/s."
+    )
+
+    loop = ctx.loop
+    transport = AsyncBus(ctx.busses.pin(configured[bus_name]), loop=loop, tx_maxsize=tx_queue)
+    generator = LoadGenerator(transport, load_profile, tick=tick, max_backlog=max_backlog)
+    task = loop.create_task(generate(generator, duration, interval))
+    try:
+        transport.start()
+        loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        logger.info("Stopping load generation.")
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+    finally:
+        loop.run_until_complete(transport.close())
+        loop.close()
+
+    stats = generator.as_dict()
+    print(f"{stats['elapsed']:.2f} s: {summary(stats)}")
+    for stream in stats["streams"]:
+        print(f"  {stream['name']}: {stream['queued']} frames, {stream['skipped']} skipped, target {stream['rate']:.0f} fps")
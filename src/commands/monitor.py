@@ -1,16 +1,154 @@
-from src.configuration.v1 import Configuration
+from src.busstats import BusStatistics
+from src.shmring import RingReader
 
+import asyncio
+import can
 import click
+import sys
+import time
 
 from loguru import logger
 
+CLEAR_SCREEN = "\033[2J\033[H"
+
+# How often the shared memory ring is read
+RING_POLL_S = 0.01
+
+
+def render(stats, previous, elapsed, bitrate, rows):
+    """
+    Format one refresh of the monitor view.
+    """
+    lines = []
+    for bus_stats, (counts, bits, errors) in zip(stats, previous):
+        load = 100.0 * (bus_stats.bits - bits) / (bitrate * elapsed)
+        rate = sum(bus_stats.count(slot) - counts[slot] for _, _, slot in bus_stats.ids()) / elapsed
+        lines.append(
+            f"\033[1m{bus_stats.name}\033[0m  "
+            f"{rate:9.1f} frames/s  "
+            f"load {load:5.1f}%  "
+            f"errors {bus_stats.errors} (+{bus_stats.errors - errors})  "
+            f"untracked {bus_stats.untracked}"
+        )
+        lines.append(f"  {'id':>10} {'count':>10} {'rate/s':>9} {'period ms':>10} {'jitter ms':>10}  last payload")
+
+        ids = sorted(bus_stats.ids(), key=lambda item: (item[1], item[0]))
+        for arbitration_id, extended, slot in ids[:rows]:
+            mean, jitter = bus_stats.period(slot)
+            id_rate = (bus_stats.count(slot) - counts[slot]) / elapsed
+            id_str = f"{arbitration_id:08x}" if extended else f"{arbitration_id:03x}"
+            period_str = f"{mean * 1000:10.2f}" if mean is not None else f"{'-':>10}"
+            jitter_str = f"{jitter * 1000:10.3f}" if jitter is not None else f"{'-':>10}"
+            lines.append(
+                f"  {id_str:>10} {bus_stats.count(slot):>10} {id_rate:9.1f} "
+                f"{period_str} {jitter_str}  {bus_stats.payload(slot).hex(' ')}"
+            )
+        if len(ids) > rows:
+            lines.append(f"  ... {len(ids) - rows} more")
+        lines.append("")
+    return "\n".join(lines)
+
+
+async def watch(ctx, busses, bitrate, interval, rows):
+    loop = asyncio.get_running_loop()
+
+    # Several names may refer to the same bus, count it once
+    by_spec = {}
+    for name, spec in busses.items():
+        by_spec.setdefault(spec, []).append(name)
+
+    stats = []
+    notifiers = []
+    try:
+        for spec, names in by_spec.items():
+            shared = ctx.busses.pin(spec)
+            bus_stats = BusStatistics(", ".join(names))
+            notifiers.append(can.Notifier(shared.bus, [bus_stats], timeout=0.1, loop=loop))
+            stats.append(bus_stats)
+
+        previous = [(s.snapshot(), s.bits, s.errors) for s in stats]
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            view = render(stats, previous, now - last, bitrate, rows)
+            sys.stdout.write(CLEAR_SCREEN + view)
+            sys.stdout.flush()
+            previous = [(s.snapshot(), s.bits, s.errors) for s in stats]
+            last = now
+    finally:
+        for notifier in notifiers:
+            notifier.stop()
+
+
+async def watch_ring(name, bitrate, interval, rows):
+    """
+    Like watch, on the frames a running server publishes in a shared memory
+    ring instead of opening the busses.
+    """
+    with RingReader(name, latest=True) as reader:
+        stats = [BusStatistics(channel) for channel in reader.channels]
+        previous = [(s.snapshot(), s.bits, s.errors) for s in stats]
+        last = time.monotonic()
+        while not reader.closed:
+            await asyncio.sleep(RING_POLL_S)
+            for channel, msg in reader.messages():
+                stats[channel].on_message_received(msg)
+
+            now = time.monotonic()
+            if now - last < interval:
+                continue
+            view = render(stats, previous, now - last, bitrate, rows)
+            sys.stdout.write(CLEAR_SCREEN + view + f"ring '{name}': {reader.overruns} frames overrun\n")
+            sys.stdout.flush()
+            previous = [(s.snapshot(), s.bits, s.errors) for s in stats]
+            last = now
+        logger.info(f"The server closed ring '{name}'.")
+
+
 @click.command()
+@click.option("--bitrate", default=500000, help="Nominal bitrate of the busses, used to estimate bus load.")
+@click.option("--interval", default=1.0, help="Refresh period in seconds.")
+@click.option("--rows", default=32, help="Maximum number of IDs shown per bus.")
+@click.option("--ring", default=None, help="Watch the shared memory ring of a running 'bench serve' instead of opening the busses.")
 @click.pass_obj
 def monitor(
     ctx,
+    bitrate,
+    interval,
+    rows,
+    ring,
 ):
     """
     Run testbench monitoring.
     """
     logger.info("Monitoring the testbench.")
-    logger.warning("No monitors are currently implemented.")
+
+    if ring is not None:
+        loop = ctx.loop
+        try:
+            loop.run_until_complete(watch_ring(ring, bitrate, interval, rows))
+        except FileNotFoundError:
+            logger.error(f"No shared memory ring '{ring}'. Is 'bench serve' running?")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            logger.info("Stopping monitor.")
+        finally:
+            loop.close()
+        return
+
+    busses = ctx.cfg.all_busses
+    if not busses:
+        logger.warning("No busses are configured.")
+        return
+
+    for name, spec in busses.items():
+        logger.debug(f"Monitoring {name}: {spec.interface} '{spec.channel}'")
+
+    loop = ctx.loop
+    try:
+        loop.run_until_complete(watch(ctx, busses, bitrate, interval, rows))
+    except KeyboardInterrupt:
+        logger.info("Stopping monitor.")
+    finally:
+        loop.close()
@@ -0,0 +1,77 @@
+from src.capture import CaptureListener, CaptureWriter, DEFAULT_CHUNK_RECORDS
+
+import asyncio
+import can
+import click
+import sys
+
+from loguru import logger
+
+
+async def capture(ctx, busses, writer, duration):
+    loop = asyncio.get_running_loop()
+    notifiers = []
+    seen = set()
+    try:
+        for channel, (name, spec) in enumerate(busses.items()):
+            if spec in seen:
+                logger.warning(f"Bus {name} is already recorded under another name.")
+                continue
+            seen.add(spec)
+            shared = ctx.busses.pin(spec)
+            listener = CaptureListener(writer, channel)
+            notifiers.append(can.Notifier(shared.bus, [listener], timeout=0.1, loop=loop))
+
+        stop = None if duration is None else loop.time() + duration
+        while stop is None or loop.time() < stop:
+            await asyncio.sleep(1.0 if stop is None else max(0.0, min(1.0, stop - loop.time())))
+            logger.debug(f"{writer.records} frames in {writer.chunks} chunks, {writer.skipped} skipped")
+    finally:
+        for notifier in notifiers:
+            notifier.stop()
+
+
+@click.command()
+@click.option("--output", "-o", required=True, help="Path of the capture file to write.")
+@click.option("--bus", "-b", "bus_names", multiple=True, help="Name of a configured bus to record. Default is every bus.")
+@click.option("--duration", "-d", type=float, default=None, help="Stop after this many seconds. Default is to record until interrupted.")
+@click.option("--chunk-records", default=DEFAULT_CHUNK_RECORDS, help="Number of records per chunk.")
+@click.pass_obj
+def record(
+    ctx,
+    output,
+    bus_names,
+    duration,
+    chunk_records,
+):
+    """
+    Record bus traffic to a capture file.
+    """
+    configured = ctx.cfg.all_busses
+    if bus_names:
+        unknown = [name for name in bus_names if name not in configured]
+        if unknown:
+            logger.error(f"Unknown bus(ses): {', '.join(unknown)} (configured: {', '.join(configured)})")
+            sys.exit(1)
+        busses = {name: configured[name] for name in bus_names}
+    else:
+        busses = configured
+
+    if not busses:
+        logger.error("No busses to record.")
+        sys.exit(1)
+
+    logger.info(f"Recording {', '.join(busses)} to '{output}'.")
+    writer = CaptureWriter(output, channels=busses.keys(), chunk_records=chunk_records)
+
+    loop = ctx.loop
+    try:
+        loop.run_until_complete(capture(ctx, busses, writer, duration))
+    except KeyboardInterrupt:
+        logger.info("Stopping recording.")
+    finally:
+        writer.close()
+        loop.close()
+        logger.info(f"Wrote {writer.records} frames in {writer.chunks} chunks to '{output}'.")
+        if writer.skipped:
+            logger.warning(f"Skipped {writer.skipped} CAN FD frames with more than 8 bytes of data.")
@@ -0,0 +1,100 @@
+from src.capture import CaptureReader
+from src.replay import Replayer, remap_device
+
+import click
+import sys
+
+from loguru import logger
+
+
+def parse_id(value: str) -> int:
+    return int(value, 0)
+
+
+def id_key(arbitration_id: int):
+    """
+    (arbitration_id, is_extended) of an ID given on the command line, where
+    only IDs above 0x7FF are extended.
+    """
+    return arbitration_id, arbitration_id > 0x7FF
+
+
+@click.command()
+@click.argument("capture", type=click.Path(exists=True, dir_okay=False))
+@click.option("--bus", "-b", "bus_name", default="tcan", help="Name of the configured bus to replay on.")
+@click.option("--speed", "-s", type=float, default=1.0, help="Time scale, 2.0 replays twice as fast. 0 replays as fast as possible.")
+@click.option("--id", "ids", multiple=True, help="Only replay this arbitration ID (e.g. 0x561). May be repeated.")
+@click.option("--channel", "channels", multiple=True, help="Only replay frames recorded on this bus. May be repeated.")
+@click.option("--remap", multiple=True, help="Send one ID as another, FROM=TO (e.g. 0x561=0x562), IDs above 0x7FF are extended. May be repeated.")
+@click.option("--device", type=int, default=None, help="Rewrite the device number of every standard TCAN ID (e.g. a different jtecu_id).")
+@click.option("--prefetch", default=4, help="Number of chunks read ahead.")
+@click.pass_obj
+def replay(
+    ctx,
+    capture,
+    bus_name,
+    speed,
+    ids,
+    channels,
+    remap,
+    device,
+    prefetch,
+):
+    """
+    Replay a capture file on a bus.
+    """
+    configured = ctx.cfg.all_busses
+    if bus_name not in configured:
+        logger.error(f"Unknown bus: {bus_name} (configured: {', '.join(configured)})")
+        sys.exit(1)
+
+    try:
+        id_filter = [parse_id(i) for i in ids] or None
+        mapping = {}
+        for entry in remap:
+            source, target = entry.split("=")
+            mapping[id_key(parse_id(source))] = parse_id(target)
+    except ValueError as e:
+        logger.error(f"Invalid ID: {e}")
+        sys.exit(1)
+
+    with CaptureReader(capture) as reader:
+        channel_filter = None
+        if channels:
+            unknown = [name for name in channels if name not in reader.channels]
+            if unknown:
+                logger.error(f"Capture has no channel(s) {', '.join(unknown)} (recorded: {', '.join(reader.channels)})")
+                sys.exit(1)
+            channel_filter = [reader.channels.index(name) for name in channels]
+
+        if device is not None:
+            for arbitration_id, extended in reader.ids:
+                key = (arbitration_id, bool(extended))
+                mapping.setdefault(key, remap_device(arbitration_id, device, key[1]))
+
+        logger.info(f"Replaying {reader.records} frames from '{capture}' on {bus_name} at {speed or 'maximum'} speed.")
+        with ctx.busses.acquire(configured[bus_name]) as bus:
+            replayer = Replayer(
+                reader,
+                bus,
+                speed=speed,
+                ids=id_filter,
+                channels=channel_filter,
+                remap=mapping,
+                prefetch=prefetch,
+            )
+            try:
+                stats = replayer.run()
+            except KeyboardInterrupt:
+                logger.info("Replay interrupted.")
+                return
+
+    error = stats.timing_error
+    print(f"sent {stats.sent} frames in {stats.duration:.3f} s ({stats.errors} errors, {stats.skipped} skipped)")
+    if error.count:
+        print(
+            f"timing error: mean {error.mean * 1e6:.1f} us, "
+            f"p50 <= {error.percentile(50) * 1e6:.1f} us, "
+            f"p99 <= {error.percentile(99) * 1e6:.1f} us, "
+            f"max {error.max * 1e6:.1f} us"
+        )
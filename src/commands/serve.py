@@ -1,13 +1,22 @@
 from src.server import server
+from src.shmring import DEFAULT_RING_NAME, DEFAULT_RING_RECORDS, RingInUse
 
+import asyncio
 import click
+import sys
 
 from loguru import logger
 
 @click.command()
+@click.option("--ring", default=DEFAULT_RING_NAME, help="Name of the shared memory ring received frames are published in.")
+@click.option("--ring-records", default=DEFAULT_RING_RECORDS, help="Capacity of the shared memory ring, in frames.")
+@click.option("--no-ring", is_flag=True, help="Do not publish received frames in shared memory.")
 @click.pass_obj
 def serve(
     ctx,
+    ring,
+    ring_records,
+    no_ring,
 ):
     """
     Run the testbench server.
@@ -18,9 +27,19 @@ def serve(
     logger.trace("This is a trace message.")
 
     loop = ctx.loop
+    task = loop.create_task(server(ctx, None if no_ring else ring, ring_records))
     try:
-        loop.run_until_complete(server(ctx))
+        loop.run_until_complete(task)
+    except RingInUse as e:
+        logger.error(f"{e} Stop that server or choose another --ring.")
+        sys.exit(1)
     except KeyboardInterrupt:
         logger.info("Shutting down server.")
+        # Let the server close its busses
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
     finally:
         loop.close()
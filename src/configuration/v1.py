@@ -183,6 +183,19 @@ class Configuration:
     @property
     def busses(self):
         return self._busses
+
+    @property
+    def all_busses(self):
+        """
+        Every configured bus by name, including tcan and mcan.
+        """
+        busses = {}
+        if self._tcan is not None:
+            busses["tcan"] = self._tcan
+        if self._mcan is not None:
+            busses["mcan"] = self._mcan
+        busses.update(self._busses)
+        return busses
     
     def format(self, fmt):
         if fmt == "yaml":
@@ -0,0 +1,207 @@
+"""
+file: src/dispatch.py
+description: typed TCAN commands, coalescing priority queue and dispatcher
+"""
+
+from src.histogram import Histogram
+from src.tcan_codec import SYSTEM_MODE_COMMAND, autocal_payload
+from src.tcan_commands import SystemMode, TCAN_ID
+
+from collections import deque, namedtuple
+
+import asyncio
+import can
+import time
+
+from loguru import logger
+
+SystemModeCommand = namedtuple("SystemModeCommand", ["device", "mode"])
+PwmCommand = namedtuple("PwmCommand", ["device", "data"])
+SpstCommand = namedtuple("SpstCommand", ["device", "data"])
+SpdtCommand = namedtuple("SpdtCommand", ["device", "data"])
+HcCommand = namedtuple("HcCommand", ["device", "data"])
+CustomCommand = namedtuple("CustomCommand", ["device", "data"])
+AxisCommand = namedtuple("AxisCommand", ["device", "data"])
+RdacCommand = namedtuple("RdacCommand", ["device", "data"])
+
+# Base TCAN ID of each command type
+COMMAND_IDS = {
+    SystemModeCommand: TCAN_ID.CAN_ID_CONTROLLER_COMMAND_SYS,
+    PwmCommand: TCAN_ID.CAN_ID_CONTROLLER_COMMAND_PWM,
+    SpstCommand: TCAN_ID.CAN_ID_CONTROLLER_COMMAND_SPST,
+    SpdtCommand: TCAN_ID.CAN_ID_CONTROLLER_COMMAND_SPDT,
+    HcCommand: TCAN_ID.CAN_ID_CONTROLLER_COMMAND_HC,
+    CustomCommand: TCAN_ID.CAN_ID_CONTROLLER_COMMAND_CUSTOM_1,
+    AxisCommand: TCAN_ID.CAN_ID_CONTROLLER_COMMAND_CAN_AXIS,
+    RdacCommand: TCAN_ID.CAN_ID_CONTROLLER_COMMAND_RDAC,
+}
+
+# Commands which set a state: a newer one for the same device makes any
+# queued one obsolete. Custom commands are actions and are never coalesced.
+COALESCED = frozenset({
+    SystemModeCommand,
+    PwmCommand,
+    SpstCommand,
+    SpdtCommand,
+    HcCommand,
+    AxisCommand,
+    RdacCommand,
+})
+
+def autocal(device: int) -> CustomCommand:
+    """
+    The custom command which starts the autocalibration of a device.
+    """
+    return CustomCommand(device, autocal_payload())
+
+
+def is_priority(command) -> bool:
+    """
+    Safety commands skip ahead of everything else.
+    """
+    return type(command) is SystemModeCommand and command.mode == SystemMode.EMERGENCY
+
+
+def to_message(command) -> can.Message:
+    arbitration_id = COMMAND_IDS[type(command)] + command.device
+    if type(command) is SystemModeCommand:
+        data = SYSTEM_MODE_COMMAND.pack(command.mode)
+    else:
+        data = command.data
+    return can.Message(arbitration_id=arbitration_id, data=data, is_extended_id=False)
+
+
+class CommandQueue:
+    """
+    Command queue with a priority lane and coalescing of superseded commands.
+
+    Commands in COALESCED keep the queue position of the first pending
+    command of the same type and device but only the newest is delivered.
+    Priority commands are delivered before anything else and drop pending
+    mode commands of their device so they cannot be undone by a stale one.
+    Other commands are queued FIFO, up to maxsize.
+
+    With a wait histogram the time from `put` of the delivered command to
+    its `get` is observed.
+    """
+
+    def __init__(self, maxsize: int = 256, wait: Histogram | None = None):
+        self._maxsize = maxsize
+        self._wait = wait
+        self._priority = deque()
+        self._normal = deque()
+        self._pending = {}
+        self._ready = asyncio.Event()
+        self._coalesced = 0
+        self._rejected = 0
+
+    @property
+    def coalesced(self):
+        return self._coalesced
+
+    @property
+    def rejected(self):
+        return self._rejected
+
+    def qsize(self):
+        return len(self._priority) + len(self._normal)
+
+    def empty(self):
+        return not self._priority and not self._normal
+
+    def put_nowait(self, command):
+        """
+        Queue a command. Raises asyncio.QueueFull if the FIFO lane is full.
+        """
+        kind = type(command)
+        if kind not in COMMAND_IDS:
+            raise TypeError(f"Unknown command type: {kind.__name__}")
+
+        queued = time.perf_counter() if self._wait is not None else None
+        if is_priority(command):
+            key = (kind, command.device)
+            if self._pending.pop(key, None) is not None:
+                self._coalesced += 1
+            self._priority.append((command, queued))
+        elif kind in COALESCED:
+            key = (kind, command.device)
+            if key in self._pending:
+                self._coalesced += 1
+            else:
+                self._normal.append((key, None))
+            self._pending[key] = (command, queued)
+        else:
+            if len(self._normal) >= self._maxsize:
+                self._rejected += 1
+                raise asyncio.QueueFull
+            self._normal.append((None, (command, queued)))
+        self._ready.set()
+
+    async def put(self, command):
+        self.put_nowait(command)
+
+    def _delivered(self, entry):
+        command, queued = entry
+        if queued is not None:
+            self._wait.observe(time.perf_counter() - queued)
+        return command
+
+    def get_nowait(self):
+        if self._priority:
+            return self._delivered(self._priority.popleft())
+        while self._normal:
+            key, entry = self._normal.popleft()
+            if key is None:
+                return self._delivered(entry)
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                return self._delivered(entry)
+        raise asyncio.QueueEmpty
+
+    async def get(self):
+        while True:
+            try:
+                return self.get_nowait()
+            except asyncio.QueueEmpty:
+                self._ready.clear()
+                await self._ready.wait()
+
+
+class Dispatcher:
+    """
+    Delivers the commands of a CommandQueue to the handler registered for
+    their type.
+
+    ```python
+    @dispatcher.handler(AxisCommand, SystemModeCommand)
+    async def send(command):
+        ...
+    ```
+    """
+
+    def __init__(self, queue: CommandQueue):
+        self._queue = queue
+        self._handlers = {}
+
+    @property
+    def queue(self):
+        return self._queue
+
+    def handler(self, *command_types):
+        def register(function):
+            for command_type in command_types:
+                self._handlers[command_type] = function
+            return function
+        return register
+
+    async def run(self):
+        while True:
+            command = await self._queue.get()
+            handler = self._handlers.get(type(command))
+            if handler is None:
+                logger.error(f"No handler for command: {command}")
+                continue
+            try:
+                await handler(command)
+            except Exception as e:
+                logger.error(f"Failed to handle {command}: {e}")
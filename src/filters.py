@@ -0,0 +1,174 @@
+"""
+file: src/filters.py
+description: compiles sets of CAN IDs into SocketCAN id/mask filters
+"""
+
+# CAN_RAW_FILTER_MAX in linux/can/raw.h
+KERNEL_MAX_FILTERS = 512
+
+STANDARD_ID_BITS = 11
+EXTENDED_ID_BITS = 29
+
+# Devices are numbered in the low nibble of the TCAN IDs
+TCAN_DEVICES = range(16)
+
+
+def tcan_ids(bases, devices=TCAN_DEVICES) -> set:
+    """
+    The arbitration IDs of the given TCAN_ID bases for the given devices.
+    """
+    return {base + device for base in bases for device in devices}
+
+
+def _size(mask, bits):
+    return 1 << (bits - bin(mask).count("1"))
+
+
+def _merge(a, b):
+    """
+    The smallest cube containing the cubes a and b.
+    """
+    mask = a[1] & b[1] & ~(a[0] ^ b[0])
+    return a[0] & mask, mask
+
+
+def _ids(cube, bits):
+    """
+    Every ID in a cube.
+    """
+    value, mask = cube
+    free = ((1 << bits) - 1) ^ mask
+    sub = free
+    while True:
+        yield value | sub
+        if sub == 0:
+            return
+        sub = (sub - 1) & free
+
+
+def prime_implicants(ids, bits) -> set:
+    """
+    The largest (value, mask) cubes which only contain IDs of the set.
+    IDs match a cube if `id & mask == value`.
+    """
+    # Cubes of the current size, grouped by mask
+    level = {(1 << bits) - 1: set(ids)}
+    primes = set()
+    while level:
+        merged = {}
+        for mask, values in level.items():
+            combined = set()
+            bit = mask
+            while bit:
+                low = bit & -bit
+                bit ^= low
+                pairs = [value for value in values if not value & low and value | low in values]
+                if pairs:
+                    merged.setdefault(mask ^ low, set()).update(pairs)
+                    combined.update(pairs)
+                    combined.update(value | low for value in pairs)
+            primes.update((value, mask) for value in values - combined)
+        level = merged
+    return primes
+
+
+def _cover(ids, primes, bits):
+    """
+    Pick primes until every ID is covered: first those which are the only
+    cover of an ID, then greedily the one covering the most remaining IDs.
+    """
+    members = {cube: set(_ids(cube, bits)) for cube in primes}
+
+    covering = {}
+    for cube, covered in members.items():
+        for i in covered:
+            covering.setdefault(i, []).append(cube)
+
+    chosen = {cubes[0] for cubes in covering.values() if len(cubes) == 1}
+    remaining = set(ids)
+    for cube in chosen:
+        remaining -= members[cube]
+
+    candidates = {cube for cube in members if members[cube] & remaining}
+    while remaining:
+        cube = max(
+            candidates,
+            key=lambda c: (len(members[c] & remaining), _size(c[1], bits), -c[0]),
+        )
+        chosen.add(cube)
+        remaining -= members[cube]
+        candidates = {c for c in candidates if members[c] & remaining}
+    return chosen
+
+
+def _reduce(cubes, max_filters, bits):
+    """
+    Merge neighbouring cubes (by value) until at most max_filters remain,
+    cheapest first: those merges let the fewest extra IDs through. The
+    result accepts a superset of the IDs.
+    """
+    cubes = set(cubes)
+    while len(cubes) > max_filters:
+        ordered = sorted(cubes)
+        costs = []
+        for index, (a, b) in enumerate(zip(ordered, ordered[1:])):
+            merged = _merge(a, b)
+            costs.append((_size(merged[1], bits) - _size(a[1], bits) - _size(b[1], bits), index, merged))
+        costs.sort()
+
+        # Merge as many disjoint pairs as needed in one pass
+        excess = len(cubes) - max_filters
+        used = set()
+        merges = {}
+        for _, index, merged in costs:
+            if index in used or index + 1 in used:
+                continue
+            used.update((index, index + 1))
+            merges.setdefault(merged[1], set()).add(merged[0])
+            excess -= 1
+            if excess == 0:
+                break
+
+        # Drop every cube a merged one contains, the merged pairs included
+        cubes = {
+            (value, mask)
+            for value, mask in cubes
+            if not any(mask & m == m and value & m in values for m, values in merges.items())
+        }
+        cubes.update((value, mask) for mask, values in merges.items() for value in values)
+    return cubes
+
+
+def compile_filters(ids, extended: bool = False, max_filters: int = KERNEL_MAX_FILTERS) -> list:
+    """
+    python-can filters which accept exactly the given arbitration IDs, in as
+    few id/mask pairs as practical. If more than max_filters would be needed
+    the closest filters are merged, accepting some extra IDs rather than
+    dropping any of the requested ones.
+    """
+    bits = EXTENDED_ID_BITS if extended else STANDARD_ID_BITS
+    ids = set(ids)
+    if not ids:
+        return []
+    if any(not 0 <= i < 1 << bits for i in ids):
+        raise ValueError(f"Arbitration IDs must fit in {bits} bits.")
+
+    cubes = _cover(ids, prime_implicants(ids, bits), bits)
+    if len(cubes) > max_filters:
+        cubes = _reduce(cubes, max_filters, bits)
+    return [
+        {"can_id": value, "can_mask": mask, "extended": extended}
+        for value, mask in sorted(cubes)
+    ]
+
+
+def matches(filters, arbitration_id: int, extended: bool = False) -> bool:
+    """
+    Whether a frame passes python-can style filters (no filters pass all).
+    """
+    if not filters:
+        return True
+    for f in filters:
+        if f.get("extended", extended) == extended and (arbitration_id ^ f["can_id"]) & f["can_mask"] == 0:
+            return True
+    return False
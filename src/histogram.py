@@ -0,0 +1,108 @@
+"""
+file: src/histogram.py
+description: fixed bucket histograms for timing measurements
+"""
+
+import bisect
+import math
+
+# Bucket upper bounds in seconds for latency and jitter measurements
+LATENCY_BUCKETS_S = (
+    10e-6, 25e-6, 50e-6,
+    100e-6, 250e-6, 500e-6,
+    1e-3, 2.5e-3, 5e-3,
+    10e-3, 25e-3, 50e-3,
+    100e-3, 250e-3, 500e-3,
+    1.0,
+)
+
+
+class Histogram:
+    """
+    A histogram with fixed, preallocated buckets.
+
+    Observing a value is a bisect and two additions, cheap enough to leave on
+    in hot paths. Values above the last bound land in an overflow bucket.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS_S):
+        self._bounds = tuple(bounds)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+
+    @property
+    def bounds(self):
+        return self._bounds
+
+    @property
+    def counts(self):
+        return self._counts
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def sum(self):
+        return self._sum
+
+    @property
+    def min(self):
+        return self._min if self._count else None
+
+    @property
+    def max(self):
+        return self._max if self._count else None
+
+    @property
+    def mean(self):
+        return self._sum / self._count if self._count else None
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._count += 1
+        self._sum += value
+        if value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
+
+    def percentile(self, q: float):
+        """
+        Upper bound of the bucket holding the q-th percentile (0 <= q <= 100).
+        Returns the observed maximum if it falls in the overflow bucket.
+        """
+        if not self._count:
+            return None
+        rank = q / 100.0 * self._count
+        seen = 0
+        for bound, count in zip(self._bounds, self._counts):
+            seen += count
+            if seen >= rank and seen > 0:
+                return min(bound, self._max)
+        return self._max
+
+    def reset(self):
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+
+    def as_dict(self):
+        return {
+            "count": self._count,
+            "sum": self._sum,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "buckets": {
+                **{str(bound): count for bound, count in zip(self._bounds, self._counts)},
+                "+Inf": self._counts[-1],
+            },
+        }
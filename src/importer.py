@@ -0,0 +1,471 @@
+"""
+file: src/importer.py
+description: parallel conversion of candump, ASC and BLF logs to capture files
+
+Parsing a log with python-can costs a few microseconds per frame, so a large
+input is split into segments which worker processes parse independently:
+
+- candump (-l) and Vector ASC files are split at line boundaries. ASC
+  segments are parsed behind the header of the file, so the reader picks up
+  its number base.
+- BLF files are split between their LOG_CONTAINER objects. Objects may run
+  over from one container into the next, so a segment starts at the first
+  object beginning in its first container and finishes the object running
+  into the container after its last.
+- Other formats python-can reads are converted as a single segment.
+
+Every worker writes its frames, in timestamp order, to a temporary capture
+file. The segments are then merged in timestamp order into the output:
+one after the other when their time ranges follow each other, otherwise
+with a heap over at most MERGE_FAN_IN captures at a time.
+"""
+
+from src.capture import CaptureReader, CaptureWriter, DEFAULT_CHUNK_RECORDS, RECORD, record_flags
+
+import can
+import heapq
+import io
+import operator
+import os
+import re
+import tempfile
+import time
+import zlib
+
+from can.io.blf import FILE_HEADER_STRUCT, LOG_CONTAINER, LOG_CONTAINER_STRUCT, NO_COMPRESSION, OBJ_HEADER_BASE_STRUCT, ZLIB_DEFLATE
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_SEGMENT_BYTES = 16 << 20
+
+FORMATS = {
+    ".log": "candump",
+    ".asc": "asc",
+    ".blf": "blf",
+}
+
+# A line of an ASC file which carries an event rather than header information
+_ASC_EVENT = re.compile(rb"^\s*\d+\.\d+\s")
+
+# Objects of a BLF container checked before an object start is trusted
+_BLF_SYNC_OBJECTS = 32
+
+# Captures merged at once. Each open capture holds two file descriptors (file
+# and map), overlapping segments beyond this are merged in several passes.
+MERGE_FAN_IN = 64
+
+# path, format, byte range, bytes the segment is parsed behind, whether the
+# range starts within an object (BLF)
+Segment = namedtuple("Segment", ["path", "format", "start", "end", "header", "sync"])
+
+# Output of a worker: temporary capture, channel names in the order of its
+# channel numbers, frames written, frames which do not fit a capture record,
+# earliest and latest timestamp (None if empty)
+SegmentResult = namedtuple("SegmentResult", ["path", "channels", "frames", "skipped", "start", "end"])
+
+# A capture to merge: path, output channel number of each of its channels
+# (None if they are already), earliest and latest timestamp
+MergeInput = namedtuple("MergeInput", ["path", "mapping", "start", "end"])
+
+
+def detect_format(path) -> str:
+    return FORMATS.get(os.path.splitext(str(path))[1].lower(), "other")
+
+
+def _line_boundaries(f, size, segment_bytes, start=0) -> list:
+    """
+    Offsets splitting [start, size) into ranges of about segment_bytes which
+    end at a newline.
+    """
+    boundaries = [start]
+    while boundaries[-1] + segment_bytes < size:
+        f.seek(boundaries[-1] + segment_bytes)
+        f.readline()
+        position = f.tell()
+        if position >= size:
+            break
+        boundaries.append(position)
+    boundaries.append(size)
+    return boundaries
+
+
+def _asc_header(f) -> int:
+    """
+    Length of the header of an ASC file, i.e. the offset of its first event.
+    """
+    f.seek(0)
+    offset = 0
+    for line in f:
+        if _ASC_EVENT.match(line):
+            break
+        offset += len(line)
+    return offset
+
+
+def _blf_objects(f, size) -> tuple:
+    """
+    Header size and (offset, size) of the top level objects of a BLF file.
+    """
+    header = FILE_HEADER_STRUCT.unpack(f.read(FILE_HEADER_STRUCT.size))
+    if header[0] != b"LOGG":
+        raise ValueError(f"'{f.name}' is not a BLF file.")
+    objects = []
+    offset = header[1]
+    while offset + OBJ_HEADER_BASE_STRUCT.size <= size:
+        f.seek(offset)
+        signature, _, _, obj_size, _ = OBJ_HEADER_BASE_STRUCT.unpack(f.read(OBJ_HEADER_BASE_STRUCT.size))
+        if signature != b"LOBJ" or obj_size < OBJ_HEADER_BASE_STRUCT.size:
+            raise ValueError(f"Corrupt BLF object at offset {offset} of '{f.name}'.")
+        # Objects are padded to 4 bytes like the reader expects
+        length = obj_size + obj_size % 4
+        objects.append((offset, length))
+        offset += length
+    return header[1], objects
+
+
+def plan(path, segment_bytes: int = DEFAULT_SEGMENT_BYTES, format: str | None = None) -> list:
+    """
+    Split a log file into segments of about segment_bytes.
+    """
+    format = format or detect_format(path)
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if format == "candump":
+            boundaries = _line_boundaries(f, size, segment_bytes)
+            return [
+                Segment(str(path), format, start, end, b"", False)
+                for start, end in zip(boundaries, boundaries[1:])
+            ]
+
+        if format == "asc":
+            header_size = _asc_header(f)
+            f.seek(0)
+            header = f.read(header_size)
+            boundaries = _line_boundaries(f, size, segment_bytes, header_size)
+            boundaries[0] = 0
+            return [
+                Segment(str(path), format, start, end, header if start else b"", False)
+                for start, end in zip(boundaries, boundaries[1:])
+            ]
+
+        if format == "blf":
+            header_size, objects = _blf_objects(f, size)
+            f.seek(0)
+            header = f.read(header_size)
+            if not objects:
+                return [Segment(str(path), format, header_size, header_size, header, False)]
+            segments = []
+            start = objects[0][0]
+            for offset, length in objects:
+                if offset + length - start >= segment_bytes:
+                    segments.append(Segment(str(path), format, start, offset + length, header, bool(segments)))
+                    start = offset + length
+            if start < objects[-1][0] + objects[-1][1]:
+                segments.append(Segment(str(path), format, start, size, header, bool(segments)))
+            return segments
+
+    return [Segment(str(path), format, 0, size, b"", False)]
+
+
+def _blf_object_start(data) -> int:
+    """
+    Offset of the first object beginning in a decompressed container, or
+    len(data) if an object spans all of it. A candidate is accepted once the
+    objects following it chain up to the end of the container.
+    """
+    end = len(data)
+    candidate = data.find(b"LOBJ")
+    while candidate >= 0:
+        position = candidate
+        for _ in range(_BLF_SYNC_OBJECTS):
+            obj_size = OBJ_HEADER_BASE_STRUCT.unpack_from(data, position)[3] if position + OBJ_HEADER_BASE_STRUCT.size <= end else None
+            if obj_size is None or obj_size >= end - position:
+                # Runs into the next container
+                return candidate
+            if obj_size < OBJ_HEADER_BASE_STRUCT.size:
+                break
+            following = data.find(b"LOBJ", position + obj_size, position + obj_size + 8)
+            if following < 0:
+                if position + obj_size + 8 > end:
+                    return candidate
+                break
+            position = following
+        else:
+            return candidate
+        candidate = data.find(b"LOBJ", candidate + 1)
+    return end
+
+
+def _blf_container_data(f, start, end=None):
+    """
+    Decompressed data of the containers of f from offset start to end, one
+    object read at a time.
+    """
+    f.seek(start)
+    offset = start
+    while end is None or offset < end:
+        base = f.read(OBJ_HEADER_BASE_STRUCT.size)
+        if len(base) < OBJ_HEADER_BASE_STRUCT.size:
+            return
+        _, _, _, obj_size, obj_type = OBJ_HEADER_BASE_STRUCT.unpack(base)
+        body = f.read(obj_size - OBJ_HEADER_BASE_STRUCT.size)
+        f.read(obj_size % 4)
+        offset += obj_size + obj_size % 4
+        if obj_type != LOG_CONTAINER:
+            continue
+        method, _ = LOG_CONTAINER_STRUCT.unpack_from(body)
+        data = body[LOG_CONTAINER_STRUCT.size:]
+        if method == ZLIB_DEFLATE:
+            data = zlib.decompress(data)
+        elif method != NO_COMPRESSION:
+            continue
+        yield data
+
+
+def _blf_segment(f, segment: Segment) -> io.BytesIO:
+    """
+    The objects starting in the containers of the segment, repacked as one
+    uncompressed container behind the file header.
+    """
+    parts = list(_blf_container_data(f, segment.start, segment.end))
+    if segment.sync and parts:
+        parts[0] = parts[0][_blf_object_start(parts[0]):]
+
+    # Finish the object running into the following containers
+    for data in _blf_container_data(f, segment.end):
+        start = _blf_object_start(data)
+        parts.append(data[:start])
+        if start < len(data):
+            break
+
+    data = b"".join(parts)
+    obj_size = OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size + len(data)
+    return io.BytesIO(b"".join((
+        segment.header,
+        OBJ_HEADER_BASE_STRUCT.pack(b"LOBJ", OBJ_HEADER_BASE_STRUCT.size, 1, obj_size, LOG_CONTAINER),
+        LOG_CONTAINER_STRUCT.pack(NO_COMPRESSION, len(data)),
+        data,
+        b"\x00" * (obj_size % 4),
+    )))
+
+
+def _reader(segment: Segment):
+    if segment.format == "other":
+        return can.LogReader(segment.path)
+    with open(segment.path, "rb") as f:
+        if segment.format == "blf":
+            return can.BLFReader(_blf_segment(f, segment))
+        f.seek(segment.start)
+        text = (segment.header + f.read(segment.end - segment.start)).decode("utf-8", errors="replace")
+    if segment.format == "asc":
+        return can.ASCReader(io.StringIO(text))
+    return can.CanutilsLogReader(io.StringIO(text))
+
+
+def convert_segment(segment: Segment, output, chunk_records: int = DEFAULT_CHUNK_RECORDS) -> SegmentResult:
+    """
+    Parse a segment into a temporary capture file, in timestamp order.
+    Runs in the worker processes.
+    """
+    channels = {}
+    records = []
+    skipped = 0
+    ordered = True
+    previous = float("-inf")
+    for msg in _reader(segment):
+        if msg.is_fd and len(msg.data) > 8:
+            skipped += 1
+            continue
+        channel = channels.setdefault(msg.channel, len(channels))
+        records.append((msg.timestamp, msg.arbitration_id, record_flags(msg), msg.dlc, channel, bytes(msg.data)))
+        if msg.timestamp < previous:
+            ordered = False
+        previous = msg.timestamp
+
+    if not ordered:
+        records.sort(key=operator.itemgetter(0))
+    with CaptureWriter(output, channels=(), chunk_records=chunk_records) as writer:
+        for record in records:
+            writer.write_raw(*record)
+    if records:
+        start, end = records[0][0], records[-1][0]
+    else:
+        start = end = None
+    return SegmentResult(str(output), list(channels), len(records), skipped, start, end)
+
+
+def channel_name(channel, path) -> str:
+    """
+    Capture channel name of a python-can channel: interface names are kept,
+    numbered channels become e.g. "can0", frames without one take the name
+    of the log file.
+    """
+    if channel is None:
+        return os.path.splitext(os.path.basename(str(path)))[0]
+    if isinstance(channel, int):
+        return f"can{channel}"
+    return str(channel)
+
+
+class ImportStatistics:
+    """
+    Progress and throughput of an import.
+    """
+
+    def __init__(self, total_bytes: int, segments: int):
+        self.total_bytes = total_bytes
+        self.segments = segments
+        self.parsed_bytes = 0
+        self.parsed_segments = 0
+        self.frames = 0
+        self.skipped = 0
+        self.merged = 0
+        self.start = time.perf_counter()
+        self.parsed = None
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.start
+
+    def as_dict(self):
+        elapsed = self.elapsed
+        return {
+            "bytes": self.total_bytes,
+            "segments": self.segments,
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "parse_seconds": (self.parsed or time.perf_counter()) - self.start,
+            "seconds": elapsed,
+            "frames_per_second": self.frames / elapsed if elapsed > 0 else None,
+            "bytes_per_second": self.total_bytes / elapsed if elapsed > 0 else None,
+        }
+
+
+def _records(path, mapping):
+    """
+    Records of a capture with output channel numbers. The capture is only
+    open while its records are read.
+    """
+    with CaptureReader(path) as reader:
+        for number in range(len(reader.chunks)):
+            # A copy, the map can then be closed with a record pending
+            chunk = reader.chunk_view(number).tobytes()
+            if mapping is None:
+                yield from RECORD.iter_unpack(chunk)
+            else:
+                for record in RECORD.iter_unpack(chunk):
+                    yield record[:4] + (mapping[record[4]], record[5])
+
+
+def _heap_merge(inputs):
+    return heapq.merge(*(_records(i.path, i.mapping) for i in inputs), key=operator.itemgetter(0))
+
+
+def _merged(inputs, scratch, chunk_records=DEFAULT_CHUNK_RECORDS):
+    """
+    Records of the captures in timestamp order. Ties keep the order of the
+    inputs. At most MERGE_FAN_IN captures are open at a time.
+    """
+    inputs = [i for i in inputs if i.start is not None]
+
+    # Segments of time ordered logs follow each other and are streamed one
+    # after the other
+    ordered = sorted(inputs, key=operator.attrgetter("start"))
+    if all(before.end <= after.start for before, after in zip(ordered, ordered[1:])):
+        for i in ordered:
+            yield from _records(i.path, i.mapping)
+        return
+
+    passes = 0
+    while len(inputs) > MERGE_FAN_IN:
+        merged = []
+        for first in range(0, len(inputs), MERGE_FAN_IN):
+            group = inputs[first:first + MERGE_FAN_IN]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            path = os.path.join(scratch, f"merge-{passes}-{first}.bcap")
+            with CaptureWriter(path, channels=(), chunk_records=chunk_records) as writer:
+                for record in _heap_merge(group):
+                    writer.write_raw(*record)
+            for i in group:
+                os.remove(i.path)
+            merged.append(MergeInput(path, None, min(i.start for i in group), max(i.end for i in group)))
+        inputs = merged
+        passes += 1
+    yield from _heap_merge(inputs)
+
+
+def import_logs(
+    paths,
+    output,
+    jobs: int | None = None,
+    segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+    chunk_records: int = DEFAULT_CHUNK_RECORDS,
+    format: str | None = None,
+    rename=None,
+    progress=None,
+) -> ImportStatistics:
+    """
+    Convert log files into one capture file, merged in timestamp order.
+
+    jobs is the number of worker processes (default: one per CPU, 1 parses
+    in this process). rename maps channel names to those to record. progress
+    is called with the ImportStatistics after every segment parsed and every
+    chunk merged.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    rename = rename or {}
+    segments = [segment for path in paths for segment in plan(path, segment_bytes, format)]
+    statistics = ImportStatistics(sum(os.path.getsize(path) for path in paths), len(segments))
+
+    directory = os.path.dirname(os.path.abspath(output))
+    with tempfile.TemporaryDirectory(prefix=".import-", dir=directory) as scratch:
+        outputs = [os.path.join(scratch, f"{number:06d}.bcap") for number in range(len(segments))]
+        results = [None] * len(segments)
+
+        def done(number, result):
+            results[number] = result
+            statistics.parsed_bytes += segments[number].end - segments[number].start
+            statistics.parsed_segments += 1
+            statistics.frames += result.frames
+            statistics.skipped += result.skipped
+            if progress is not None:
+                progress(statistics)
+
+        if jobs == 1:
+            for number, segment in enumerate(segments):
+                done(number, convert_segment(segment, outputs[number], chunk_records))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = {
+                    pool.submit(convert_segment, segment, outputs[number], chunk_records): number
+                    for number, segment in enumerate(segments)
+                }
+                for future in as_completed(futures):
+                    done(futures[future], future.result())
+        statistics.parsed = time.perf_counter()
+
+        # Channel numbers of every segment in the output
+        names = {}
+        inputs = []
+        for segment, result in zip(segments, results):
+            mapping = []
+            for channel in result.channels:
+                name = channel_name(channel, segment.path)
+                name = rename.get(name, name)
+                mapping.append(names.setdefault(name, len(names)))
+            inputs.append(MergeInput(result.path, mapping, result.start, result.end))
+
+        with CaptureWriter(output, channels=names.keys(), chunk_records=chunk_records) as writer:
+            for record in _merged(inputs, scratch, chunk_records):
+                writer.write_raw(*record)
+                statistics.merged += 1
+                if statistics.merged % chunk_records == 0 and progress is not None:
+                    progress(statistics)
+
+    statistics.finished = time.perf_counter()
+    if progress is not None:
+        progress(statistics)
+    return statistics
@@ -0,0 +1,419 @@
+"""
+file: src/loadgen.py
+description: profile driven load generation on a CAN bus
+
+A profile is a list of streams. Each stream cycles through a set of IDs at
+a target rate, given either in frames per second (`rate`) or as a fraction
+of the bitrate (`load`). A stream may ramp up to its target and may send in
+bursts of a fixed number of frames at the same average rate:
+
+    bitrate: 500000
+    duration: 10
+    streams:
+      - name: flood
+        ids: [0x08000001, {first: 0x08000066, last: 0x08000071}]
+        payload: counter
+        load: 0.3
+        burst: 32
+        ramp: {over: 5, from: 0.05}
+
+Frames are released every tick and queued on an AsyncBus in one batch per
+stream, the transport's I/O thread sends them in batches as well.
+"""
+
+from src.busstats import EXTENDED_FRAME_OVERHEAD_BITS, STANDARD_FRAME_OVERHEAD_BITS
+from src.scheduler import Scheduler
+from src.transport import AsyncBus
+
+import asyncio
+import can
+import itertools
+import math
+import random
+import yaml
+
+from loguru import logger
+
+DEFAULT_BITRATE = 500000
+
+# Frames are released this often
+DEFAULT_TICK_S = 0.005
+
+# A stream that falls further behind than this skips the excess frames
+DEFAULT_MAX_BACKLOG = 1024
+
+# Time allowed for the transmit queue to drain at the end of a run
+DRAIN_TIMEOUT_S = 1.0
+
+PAYLOADS = ("constant", "counter", "random", "id")
+
+STANDARD_ID_MAX = 0x7FF
+EXTENDED_ID_MAX = 0x1FFFFFFF
+
+
+def frame_bits(dlc: int, extended: bool) -> int:
+    """
+    Bits of a data frame without stuff bits, as counted by BusStatistics.
+    """
+    overhead = EXTENDED_FRAME_OVERHEAD_BITS if extended else STANDARD_FRAME_OVERHEAD_BITS
+    return overhead + 8 * dlc
+
+
+def _parse_ids(entries) -> list:
+    if isinstance(entries, (int, dict)):
+        entries = [entries]
+    ids = []
+    for entry in entries:
+        if isinstance(entry, int):
+            ids.append(entry)
+        elif isinstance(entry, dict) and "first" in entry and "last" in entry:
+            ids.extend(range(entry["first"], entry["last"] + 1, entry.get("step", 1)))
+        else:
+            raise ValueError(f"Invalid ID entry: {entry!r} (use an integer or {{first, last}}).")
+    return ids
+
+
+def _payload(kind: str, dlc: int, data, seed):
+    """
+    A function of (frame number, arbitration id) returning the payload.
+    """
+    if kind == "constant":
+        payload = bytes(data or [])
+        if len(payload) > dlc:
+            raise ValueError(f"Constant payload of {len(payload)} bytes does not fit dlc {dlc}.")
+        payload = payload.ljust(dlc, b"\x00")
+        return lambda n, arbitration_id: payload
+    if kind == "counter":
+        modulo = 1 << (8 * dlc)
+        return lambda n, arbitration_id: (n % modulo).to_bytes(dlc, "big")
+    if kind == "random":
+        randbytes = random.Random(seed).randbytes
+        return lambda n, arbitration_id: randbytes(dlc)
+    if kind == "id":
+        return lambda n, arbitration_id: arbitration_id.to_bytes(8, "big")[8 - dlc:]
+    raise ValueError(f"Unknown payload generator: {kind} (supported: {', '.join(PAYLOADS)}).")
+
+
+class Stream:
+    """
+    Frames of one profile entry and the schedule they are due on.
+
+    `due(t)` is the number of frames which should have been released t
+    seconds into the run: the integral of the (ramping) rate, rounded down to
+    whole bursts.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ids,
+        rate: float,
+        extended: bool | None = None,
+        dlc: int = 8,
+        payload: str = "counter",
+        data=None,
+        burst: int = 1,
+        ramp: float = 0.0,
+        ramp_from: float = 0.0,
+        seed=None,
+    ):
+        ids = list(ids)
+        if not ids:
+            raise ValueError(f"Stream '{name}' has no IDs.")
+        if extended is None:
+            extended = any(i > STANDARD_ID_MAX for i in ids)
+        limit = EXTENDED_ID_MAX if extended else STANDARD_ID_MAX
+        if any(not 0 <= i <= limit for i in ids):
+            raise ValueError(f"Stream '{name}' has IDs which are not valid {'extended' if extended else 'standard'} IDs.")
+        if not 0 <= dlc <= 8:
+            raise ValueError(f"Invalid dlc for stream '{name}': {dlc}")
+        if rate <= 0:
+            raise ValueError(f"Invalid rate for stream '{name}': {rate}")
+        if burst < 1:
+            raise ValueError(f"Invalid burst size for stream '{name}': {burst}")
+        if ramp < 0 or not 0 <= ramp_from <= rate:
+            raise ValueError(f"Invalid ramp for stream '{name}'.")
+
+        self._name = name
+        self._ids = ids
+        self._extended = extended
+        self._dlc = dlc
+        self._payload = _payload(payload, dlc, data, seed)
+        self._rate = rate
+        self._burst = burst
+        self._ramp = ramp
+        self._ramp_from = ramp_from
+        self._bits = frame_bits(dlc, extended)
+
+        self._next_id = itertools.cycle(ids).__next__
+        self._queued = 0
+        self._skipped = 0
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def bits(self):
+        """
+        Bits of one frame of the stream.
+        """
+        return self._bits
+
+    @property
+    def queued(self):
+        return self._queued
+
+    @property
+    def skipped(self):
+        return self._skipped
+
+    def scheduled(self, t: float) -> float:
+        """
+        Frames scheduled in the first t seconds, ignoring bursts.
+        """
+        if t <= 0:
+            return 0.0
+        if t < self._ramp:
+            slope = (self._rate - self._ramp_from) / self._ramp
+            return self._ramp_from * t + slope * t * t / 2
+        ramped = (self._ramp_from + self._rate) * self._ramp / 2
+        return ramped + self._rate * (t - self._ramp)
+
+    def due(self, t: float) -> int:
+        # The first burst goes out at the start
+        return (math.floor(self.scheduled(t) / self._burst) + 1) * self._burst
+
+    def frames(self, t: float, max_backlog: int = DEFAULT_MAX_BACKLOG) -> list:
+        """
+        The frames due at t which have not been released yet.
+        """
+        count = self.due(t) - self._queued - self._skipped
+        if count > max_backlog:
+            self._skipped += count - max_backlog
+            count = max_backlog
+        if count <= 0:
+            return []
+
+        payload = self._payload
+        next_id = self._next_id
+        extended = self._extended
+        first = self._queued
+        self._queued += count
+        batch = []
+        for n in range(first, first + count):
+            arbitration_id = next_id()
+            batch.append(can.Message(
+                arbitration_id=arbitration_id,
+                data=payload(n, arbitration_id),
+                is_extended_id=extended,
+            ))
+        return batch
+
+    def as_dict(self):
+        return {
+            "name": self._name,
+            "ids": len(self._ids),
+            "rate": self._rate,
+            "burst": self._burst,
+            "queued": self._queued,
+            "skipped": self._skipped,
+        }
+
+
+class Profile:
+    """
+    A parsed load profile.
+    """
+
+    def __init__(self, streams, bitrate: int = DEFAULT_BITRATE, duration: float | None = None):
+        self.streams = list(streams)
+        self.bitrate = bitrate
+        self.duration = duration
+
+    @property
+    def rate(self):
+        """
+        Target frames per second of every stream together.
+        """
+        return sum(stream.rate for stream in self.streams)
+
+    @property
+    def load(self):
+        """
+        Target bus load of every stream together, as a fraction of the bitrate.
+        """
+        return sum(stream.rate * stream.bits for stream in self.streams) / self.bitrate
+
+    @staticmethod
+    def from_dict(data, seed=None) -> "Profile":
+        if not isinstance(data, dict) or not data.get("streams"):
+            raise ValueError("Profile must have a list of 'streams'.")
+        bitrate = data.get("bitrate", DEFAULT_BITRATE)
+        if bitrate <= 0:
+            raise ValueError(f"Invalid bitrate: {bitrate}")
+
+        streams = []
+        for index, entry in enumerate(data["streams"]):
+            name = entry.get("name", f"stream-{index}")
+            if "ids" not in entry:
+                raise ValueError(f"Stream '{name}' must have an 'ids' key.")
+            if ("rate" in entry) == ("load" in entry):
+                raise ValueError(f"Stream '{name}' must have exactly one of 'rate' or 'load'.")
+
+            ids = _parse_ids(entry["ids"])
+            extended = entry.get("extended")
+            if extended is None:
+                extended = any(i > STANDARD_ID_MAX for i in ids)
+            dlc = entry.get("dlc", 8)
+
+            # Bus load targets are converted to frames per second
+            scale = 1.0
+            if "load" in entry:
+                scale = bitrate / frame_bits(dlc, extended)
+                target = entry["load"]
+                if not 0 < target <= 1:
+                    raise ValueError(f"Invalid load for stream '{name}': {target} (a fraction of the bitrate).")
+            else:
+                target = entry["rate"]
+
+            ramp = entry.get("ramp", {})
+            if not isinstance(ramp, dict):
+                ramp = {"over": ramp}
+            streams.append(Stream(
+                name,
+                ids,
+                rate=target * scale,
+                extended=extended,
+                dlc=dlc,
+                payload=entry.get("payload", "counter"),
+                data=entry.get("data"),
+                burst=entry.get("burst", 1),
+                ramp=ramp.get("over", 0.0),
+                ramp_from=ramp.get("from", 0.0) * scale,
+                seed=None if seed is None else seed + index,
+            ))
+
+        names = [stream.name for stream in streams]
+        if len(names) != len(set(names)):
+            raise ValueError("Stream names must be unique.")
+        return Profile(streams, bitrate=bitrate, duration=data.get("duration"))
+
+    @staticmethod
+    def load_file(path, seed=None) -> "Profile":
+        with open(path, "r") as f:
+            return Profile.from_dict(yaml.safe_load(f), seed=seed)
+
+
+class LoadGenerator:
+    """
+    Sends the streams of a profile on an AsyncBus.
+
+    Every tick each stream's due frames are queued in one batch with
+    `send_many`, which only waits when the transmit queue is full. A bus
+    which cannot keep up therefore slows the generator down instead of
+    losing frames; streams more than max_backlog frames behind skip ahead
+    and count the frames they skipped.
+    """
+
+    def __init__(
+        self,
+        bus: AsyncBus,
+        profile: Profile,
+        tick: float = DEFAULT_TICK_S,
+        max_backlog: int = DEFAULT_MAX_BACKLOG,
+    ):
+        self._bus = bus
+        self._profile = profile
+        self._tick = tick
+        self._max_backlog = max_backlog
+        self._scheduler = Scheduler()
+        self._clock = None
+        self._start = None
+        self._elapsed = 0.0
+        self._base = None
+
+    @property
+    def profile(self):
+        return self._profile
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def elapsed(self):
+        if self._start is not None and self._clock is not None:
+            return self._clock() - self._start
+        return self._elapsed
+
+    async def _release(self):
+        t = self._clock() - self._start
+        for stream in self._profile.streams:
+            batch = stream.frames(t, self._max_backlog)
+            if batch:
+                await self._bus.send_many(batch)
+
+    async def run(self, duration: float | None = None):
+        """
+        Generate load for duration seconds (the profile's duration if None,
+        forever if neither is set) and wait for the queue to drain.
+        Returns the statistics of the run.
+        """
+        if duration is None:
+            duration = self._profile.duration
+        self._base = self._bus.stats
+        self._clock = asyncio.get_running_loop().time
+        self._start = self._clock()
+        try:
+            await self._release()
+            async with asyncio.timeout(duration):
+                await self._scheduler.run("loadgen", self._tick, self._release)
+        except TimeoutError:
+            pass
+        finally:
+            await self._drain()
+            self._elapsed = self._clock() - self._start
+            self._start = None
+        return self.as_dict()
+
+    async def _drain(self):
+        deadline = self._clock() + DRAIN_TIMEOUT_S
+        while self._bus.pending and self._clock() < deadline:
+            await asyncio.sleep(self._tick)
+        if self._bus.pending:
+            logger.warning(f"{self._bus.pending} frames still queued at the end of the run.")
+
+    def as_dict(self):
+        """
+        Counters since the start of the run. `rate` and `load` are what the
+        bus accepted, `target_rate` and `target_load` what the profile asks.
+        """
+        elapsed = self.elapsed
+        stats = self._bus.stats
+        base = self._base or {key: 0 for key in stats}
+        sent = stats["sent"] - base["sent"]
+
+        streams = [stream.as_dict() for stream in self._profile.streams]
+        queued = sum(stream.queued for stream in self._profile.streams)
+        queued_bits = sum(stream.queued * stream.bits for stream in self._profile.streams)
+        # Frames are sent in queue order, so the sent bits are in proportion
+        sent_bits = queued_bits * sent / queued if queued else 0
+        return {
+            "elapsed": elapsed,
+            "queued": queued,
+            "sent": sent,
+            "skipped": sum(stream.skipped for stream in self._profile.streams),
+            "errors": stats["errors"] - base["errors"],
+            "enobufs": stats["enobufs"] - base["enobufs"],
+            "pending": stats["pending"],
+            "rate": sent / elapsed if elapsed > 0 else 0.0,
+            "load": sent_bits / (self._profile.bitrate * elapsed) if elapsed > 0 else 0.0,
+            "target_rate": self._profile.rate,
+            "target_load": self._profile.load,
+            "streams": streams,
+        }
@@ -0,0 +1,198 @@
+"""
+file: src/metrics.py
+description: counters and latency histograms exposed in the Prometheus text format
+
+Metrics are meant to stay on in production: a counter increment is a dict
+update and a timing is two `time.perf_counter()` calls plus a
+Histogram.observe. Hot paths should look up the labelled histogram once with
+`labels()` and keep it. Nothing is formatted until `render` is called.
+"""
+
+from src.histogram import Histogram, LATENCY_BUCKETS_S
+
+import time
+
+# Bucket upper bounds in seconds for sub-microsecond to 100 us operations
+# such as encoding a frame
+FAST_BUCKETS_S = (
+    250e-9, 500e-9,
+    1e-6, 2.5e-6, 5e-6,
+    10e-6, 25e-6, 50e-6,
+    100e-6,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_value(value) -> str:
+    # Integer labels are arbitration IDs
+    if isinstance(value, int):
+        return f"{value:#x}"
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count per label values.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, labels: tuple = (), amount: int = 1):
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> int:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        # list() copies in one step, the I/O threads may add label values
+        for values, count in list(self._values.items()):
+            yield self.name, _labels(self.labels, values), count
+
+
+class Gauge:
+    """
+    Values read from the application when the metrics are rendered.
+    function returns a number, or a dict of label values to numbers.
+    """
+
+    def __init__(self, name: str, help: str, function, labels=(), kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.kind = kind
+        self._function = function
+
+    def samples(self):
+        values = self._function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield self.name, _labels(self.labels, labels), value
+
+
+class Timing:
+    """
+    A Histogram per label values.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), bounds=LATENCY_BUCKETS_S):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.bounds = tuple(bounds)
+        self._histograms = {}
+
+    def get(self, *values) -> Histogram:
+        """
+        The histogram of these label values, created on first use.
+        """
+        histogram = self._histograms.get(values)
+        if histogram is None:
+            histogram = self._histograms.setdefault(values, Histogram(self.bounds))
+        return histogram
+
+    def observe(self, value: float, labels: tuple = ()):
+        self.get(*labels).observe(value)
+
+    def samples(self):
+        for values, histogram in list(self._histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _labels(self.labels, values, f'le="{bound!r}"'), cumulative
+            yield f"{self.name}_bucket", _labels(self.labels, values, 'le="+Inf"'), histogram.count
+            yield f"{self.name}_sum", _labels(self.labels, values), histogram.sum
+            yield f"{self.name}_count", _labels(self.labels, values), histogram.count
+
+
+class Stopwatch:
+    """
+    Times a block into a histogram.
+
+    ```python
+    with Stopwatch(histogram):
+        ...
+    ```
+    """
+
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class Metrics:
+    """
+    A registry of metrics. Registering a name again returns the existing
+    metric, so every AsyncBus of an application can share the same ones.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labels != metric.labels:
+                raise ValueError(f"Metric {metric.name} is already registered differently.")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def timing(self, name: str, help: str, labels=(), bounds=LATENCY_BUCKETS_S) -> Timing:
+        return self._register(Timing(name, help, labels, bounds))
+
+    def gauge(self, name: str, help: str, function, labels=(), kind: str = "gauge") -> Gauge:
+        """
+        Register a value read at render time. kind may be "counter" for
+        totals kept elsewhere.
+        """
+        return self._register(Gauge(name, help, function, labels, kind))
+
+    def __getitem__(self, name):
+        return self._metrics[name]
+
+    def __contains__(self, name):
+        return name in self._metrics
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
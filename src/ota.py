@@ -0,0 +1,265 @@
+"""
+file: src/ota.py
+description: pipelined OTA firmware flashing over TCAN
+
+Protocol, all frames standard IDs with the device number in the low nibble
+and big endian fields:
+
+    CAN_ID_OTA_COMMAND  BEGIN  [0x01][image size u32][frames per block u8]
+                        END    [0x02][crc32 of the image u32]
+                        ABORT  [0x03]
+    CAN_ID_OTA_DATA            [block u16][frame u8][up to 5 image bytes]
+    CAN_ID_OTA_RESPONSE        [status u8][block u16]
+
+The device answers BEGIN with READY, every complete block with ACK (or NAK
+when it detected a gap or a bad frame) and END with DONE once the image is
+verified, or ERROR. Blocks are sent with a sliding window: up to `window`
+blocks are in flight and only blocks which are NAKed or time out are sent
+again.
+"""
+
+from src.tcan_commands import SystemMode, TCAN_ID
+from src.transport import AsyncBus
+
+import asyncio
+import can
+import mmap
+import struct
+import time
+import zlib
+
+from loguru import logger
+
+OP_BEGIN = 0x01
+OP_END = 0x02
+OP_ABORT = 0x03
+
+STATUS_ACK = 0x01
+STATUS_NAK = 0x02
+STATUS_READY = 0x10
+STATUS_DONE = 0x11
+STATUS_ERROR = 0x7F
+
+BEGIN = struct.Struct(">BIB")
+END = struct.Struct(">BI")
+DATA_HEADER = struct.Struct(">HB")
+RESPONSE = struct.Struct(">BH")
+
+FRAME_PAYLOAD = 8 - DATA_HEADER.size
+
+DEFAULT_BLOCK_FRAMES = 64
+DEFAULT_WINDOW = 8
+DEFAULT_TIMEOUT_S = 0.5
+DEFAULT_RETRIES = 5
+
+
+class OtaError(Exception):
+    pass
+
+
+class FirmwareImage:
+    """
+    A memory mapped firmware image, sliced into blocks of frames without copying.
+    """
+
+    def __init__(self, path, block_frames: int = DEFAULT_BLOCK_FRAMES):
+        if not 0 < block_frames <= 0xFF:
+            raise ValueError(f"Invalid number of frames per block: {block_frames}")
+        self._path = path
+        self._block_frames = block_frames
+        self._block_size = block_frames * FRAME_PAYLOAD
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self._blocks = -(-len(self._view) // self._block_size)
+        if self._blocks > 0xFFFF:
+            self.close()
+            raise ValueError(f"Image '{path}' is too large for {block_frames} frames per block.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def size(self):
+        return len(self._view)
+
+    @property
+    def blocks(self):
+        return self._blocks
+
+    @property
+    def block_frames(self):
+        return self._block_frames
+
+    def crc32(self):
+        return zlib.crc32(self._view)
+
+    def block(self, number) -> memoryview:
+        start = number * self._block_size
+        return self._view[start:start + self._block_size]
+
+    def frames(self, number):
+        """
+        (frame index, payload view) of every frame of a block.
+        """
+        block = self.block(number)
+        for index, offset in enumerate(range(0, len(block), FRAME_PAYLOAD)):
+            yield index, block[offset:offset + FRAME_PAYLOAD]
+
+    def close(self):
+        if self._map is not None:
+            self._view.release()
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+
+class FlashStatistics:
+    def __init__(self):
+        self.bytes = 0
+        self.frames = 0
+        self.blocks = 0
+        self.retransmits = 0
+        self.duration = 0.0
+
+    @property
+    def throughput(self):
+        return self.bytes / self.duration if self.duration else 0.0
+
+    def as_dict(self):
+        return {
+            "bytes": self.bytes,
+            "frames": self.frames,
+            "blocks": self.blocks,
+            "retransmits": self.retransmits,
+            "duration": self.duration,
+            "throughput": self.throughput,
+        }
+
+
+class Flasher:
+    """
+    Sends a FirmwareImage to one device through an AsyncBus.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncBus,
+        device: int,
+        window: int = DEFAULT_WINDOW,
+        timeout: float = DEFAULT_TIMEOUT_S,
+        retries: int = DEFAULT_RETRIES,
+    ):
+        self._transport = transport
+        self._device = device
+        self._window = window
+        self._timeout = timeout
+        self._retries = retries
+        self._command_id = TCAN_ID.CAN_ID_OTA_COMMAND + device
+        self._data_id = TCAN_ID.CAN_ID_OTA_DATA + device
+        self._response_id = TCAN_ID.CAN_ID_OTA_RESPONSE + device
+        self._responses = asyncio.Queue()
+
+    def _on_message(self, msg: can.Message):
+        if msg.arbitration_id == self._response_id and not msg.is_extended_id and len(msg.data) >= RESPONSE.size:
+            self._responses.put_nowait(RESPONSE.unpack_from(msg.data))
+
+    def _message(self, arbitration_id, data):
+        return can.Message(arbitration_id=arbitration_id, data=data, is_extended_id=False)
+
+    async def _command(self, data):
+        await self._transport.send(self._message(self._command_id, data))
+
+    async def _expect(self, status, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise OtaError(f"Timed out waiting for device {self._device}.")
+            try:
+                received, block = await asyncio.wait_for(self._responses.get(), remaining)
+            except asyncio.TimeoutError:
+                raise OtaError(f"Timed out waiting for device {self._device}.") from None
+            if received == STATUS_ERROR:
+                raise OtaError(f"Device {self._device} reported an error (block {block}).")
+            if received == status:
+                return block
+
+    async def _send_block(self, image: FirmwareImage, number: int, stats: FlashStatistics):
+        for index, payload in image.frames(number):
+            data = bytearray(DATA_HEADER.size + len(payload))
+            DATA_HEADER.pack_into(data, 0, number, index)
+            data[DATA_HEADER.size:] = payload
+            await self._transport.send(self._message(self._data_id, data))
+            stats.frames += 1
+
+    async def flash(self, image: FirmwareImage) -> FlashStatistics:
+        stats = FlashStatistics()
+        self._transport.add_listener(self._on_message)
+        start = time.monotonic()
+        try:
+            await self._transport.send(self._message(
+                TCAN_ID.CAN_ID_CONTROLLER_COMMAND_SYS + self._device,
+                [SystemMode.OTA],
+            ))
+            await self._command(BEGIN.pack(OP_BEGIN, image.size, image.block_frames))
+            await self._expect(STATUS_READY, self._timeout * self._retries)
+
+            await self._stream(image, stats)
+
+            await self._command(END.pack(OP_END, image.crc32()))
+            await self._expect(STATUS_DONE, self._timeout * self._retries)
+        except BaseException:
+            await self._command(bytes([OP_ABORT]))
+            raise
+        finally:
+            stats.duration = time.monotonic() - start
+            self._transport.remove_listener(self._on_message)
+        stats.bytes = image.size
+        return stats
+
+    async def _stream(self, image: FirmwareImage, stats: FlashStatistics):
+        in_flight = {}
+        attempts = {}
+        next_block = 0
+        remaining = image.blocks
+
+        while remaining:
+            # Keep the window full
+            while len(in_flight) < self._window and next_block < image.blocks:
+                await self._send_block(image, next_block, stats)
+                in_flight[next_block] = time.monotonic() + self._timeout
+                attempts[next_block] = 1
+                next_block += 1
+
+            timeout = max(min(in_flight.values()) - time.monotonic(), 0.0)
+            try:
+                status, block = await asyncio.wait_for(self._responses.get(), timeout)
+            except asyncio.TimeoutError:
+                status, block = None, None
+
+            if status == STATUS_ERROR:
+                raise OtaError(f"Device {self._device} reported an error (block {block}).")
+            if status == STATUS_ACK and block in in_flight:
+                del in_flight[block]
+                stats.blocks += 1
+                remaining -= 1
+                continue
+
+            # Resend the NAKed block, or every block whose ACK is overdue
+            now = time.monotonic()
+            if status == STATUS_NAK and block in in_flight:
+                resend = [block]
+            else:
+                resend = [b for b, deadline in in_flight.items() if deadline <= now]
+            for b in resend:
+                if attempts[b] > self._retries:
+                    raise OtaError(f"Block {b} failed after {self._retries} retransmissions.")
+                attempts[b] += 1
+                stats.retransmits += 1
+                logger.debug(f"Retransmitting block {b}")
+                await self._send_block(image, b, stats)
+                in_flight[b] = time.monotonic() + self._timeout
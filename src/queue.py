@@ -3,7 +3,22 @@ file: src/queue.py
 description: queue for synchronous and asynchronous communication
 """
 
+from enum import Enum
+
 import asyncio
+import collections
+import queue
+import threading
+import time
+
+
+class Backpressure(Enum):
+    """
+    What a bounded queue does with items put while it is full.
+    """
+    BLOCK = "block"
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
 
 
 class Queue:
@@ -11,30 +26,245 @@ class Queue:
     This class provides a queue that can be used to communicate between
     synchronous and asynchronous code.
 
-    Original code shared by user4815162342 on StackOverflow:
+    Items live in a deque guarded by a lock, so threads never have to
+    schedule a coroutine and wait on a future to put or get an item. The
+    event loop is only woken when a coroutine is actually waiting, and at
+    most once per batch for the `*_many` operations.
+
+    maxsize bounds the queue (0 is unbounded). When full, `policy` decides
+    whether producers wait (BLOCK) or items are dropped (DROP_NEWEST,
+    DROP_OLDEST). Dropped items are counted in `dropped`.
+
+    Methods prefixed sync_ may be called from any thread except the loop's,
+    async_ methods only from the loop.
+
+    This is a standalone utility: the control server queues its commands in
+    src.dispatch.CommandQueue and does not use it.
+
+    Originally based on code shared by user4815162342 on StackOverflow:
     https://stackoverflow.com/a/59650685/8662931
     """
 
-    def __init__(self, loop=None):
+    def __init__(self, loop=None, maxsize=0, policy=Backpressure.BLOCK):
         self._loop = loop
         if self._loop is None:
             self._loop = asyncio.get_running_loop()
-        self._queue = asyncio.Queue()
+        self._maxsize = maxsize
+        self._policy = policy
+        self._items = collections.deque()
+        self._dropped = 0
+
+        self._lock = threading.Lock()
+        self._sync_not_empty = threading.Condition(self._lock)
+        self._sync_not_full = threading.Condition(self._lock)
+
+        # Coroutines waiting for items or for room, and whether a wakeup of
+        # the loop is already scheduled
+        self._async_getters = 0
+        self._async_putters = 0
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._wakeup_pending = False
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def full(self):
+        return 0 < self._maxsize <= len(self._items)
+
+    # Internals, called with the lock held
+
+    def _room(self):
+        if self._maxsize <= 0:
+            return None
+        return self._maxsize - len(self._items)
+
+    def _insert(self, items, start=0):
+        """
+        Insert items[start:] as far as the policy allows.
+        Returns the index of the first item not inserted.
+        """
+        room = self._room()
+        end = len(items)
+        if room is None or end - start <= room:
+            self._items.extend(items[start:] if start else items)
+            return end
+
+        if self._policy is Backpressure.BLOCK:
+            stop = start + max(room, 0)
+            self._items.extend(items[start:stop])
+            return stop
+
+        if self._policy is Backpressure.DROP_NEWEST:
+            stop = start + max(room, 0)
+            self._items.extend(items[start:stop])
+            self._dropped += end - stop
+            return end
+
+        # DROP_OLDEST: the deque keeps the newest maxsize items
+        incoming = end - start
+        overflow = len(self._items) + incoming - self._maxsize
+        if incoming > self._maxsize:
+            start = end - self._maxsize
+        for _ in range(min(overflow, len(self._items))):
+            self._items.popleft()
+        self._items.extend(items[start:end])
+        self._dropped += overflow
+        return end
+
+    def _take(self, max_items):
+        count = min(max_items, len(self._items))
+        popleft = self._items.popleft
+        return [popleft() for _ in range(count)]
+
+    def _notify_added(self, count, threadsafe):
+        self._sync_not_empty.notify(count)
+        if self._async_getters:
+            self._wake(self._not_empty, threadsafe)
+
+    def _notify_removed(self, count, threadsafe):
+        self._sync_not_full.notify(count)
+        if self._async_putters:
+            self._wake(self._not_full, threadsafe)
+
+    def _wake(self, event, threadsafe):
+        if not threadsafe:
+            event.set()
+        elif not self._wakeup_pending:
+            self._wakeup_pending = True
+            self._loop.call_soon_threadsafe(self._wakeup)
+
+    def _wakeup(self):
+        with self._lock:
+            self._wakeup_pending = False
+            if self._items:
+                self._not_empty.set()
+            if self._room() != 0:
+                self._not_full.set()
+
+    # Synchronous (thread) side
+
+    def sync_put_many(self, items, timeout=None):
+        """
+        Put a batch of items. With the BLOCK policy waits for room up to
+        timeout seconds and returns the number of items put.
+        """
+        items = list(items)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        start = 0
+        with self._lock:
+            while True:
+                stop = self._insert(items, start)
+                if stop > start:
+                    self._notify_added(stop - start, threadsafe=True)
+                if stop == len(items):
+                    return stop
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return stop
+                self._sync_not_full.wait(remaining)
+                start = stop
+
+    def sync_put(self, item, timeout=None):
+        if self.sync_put_many((item,), timeout) == 0:
+            raise queue.Full
 
     def sync_put_nowait(self, item):
-        self._loop.call_soon(self._queue.put_nowait, item)
+        if self.sync_put_many((item,), 0) == 0:
+            raise queue.Full
 
-    def sync_put(self, item):
-        asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+    def sync_get_many(self, max_items, timeout=None):
+        """
+        Wait up to timeout seconds for at least one item and return up to
+        max_items items. Returns an empty list on timeout.
+        """
+        with self._lock:
+            if not self._items:
+                self._sync_not_empty.wait_for(lambda: self._items, timeout)
+            items = self._take(max_items)
+            if items:
+                self._notify_removed(len(items), threadsafe=True)
+            return items
 
-    def sync_get(self):
-        return asyncio.run_coroutine_threadsafe(self._queue.get(), self._loop).result()
+    def sync_get(self, timeout=None):
+        items = self.sync_get_many(1, timeout)
+        if not items:
+            raise queue.Empty
+        return items[0]
 
-    def async_put_nowait(self, item):
-        self._queue.put_nowait(item)
+    # Asynchronous (event loop) side
+
+    async def async_put_many(self, items):
+        """
+        Put a batch of items, waiting for room with the BLOCK policy.
+        """
+        items = list(items)
+        start = 0
+        while True:
+            with self._lock:
+                stop = self._insert(items, start)
+                if stop > start:
+                    self._notify_added(stop - start, threadsafe=False)
+                if stop == len(items):
+                    return stop
+                self._not_full.clear()
+                self._async_putters += 1
+            try:
+                await self._not_full.wait()
+            finally:
+                with self._lock:
+                    self._async_putters -= 1
+            start = stop
 
     async def async_put(self, item):
-        await self._queue.put(item)
+        await self.async_put_many((item,))
+
+    def async_put_nowait(self, item):
+        with self._lock:
+            if self._insert((item,)) == 0:
+                raise asyncio.QueueFull
+            self._notify_added(1, threadsafe=False)
+
+    async def async_get_many(self, max_items):
+        """
+        Wait for at least one item and return up to max_items items.
+        """
+        while True:
+            with self._lock:
+                items = self._take(max_items)
+                if items:
+                    self._notify_removed(len(items), threadsafe=False)
+                    return items
+                self._not_empty.clear()
+                self._async_getters += 1
+            try:
+                await self._not_empty.wait()
+            finally:
+                with self._lock:
+                    self._async_getters -= 1
 
     async def async_get(self):
-        return await self._queue.get()
+        return (await self.async_get_many(1))[0]
+
+    def async_get_nowait(self):
+        with self._lock:
+            items = self._take(1)
+            if not items:
+                raise asyncio.QueueEmpty
+            self._notify_removed(1, threadsafe=False)
+            return items[0]
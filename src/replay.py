@@ -0,0 +1,199 @@
+"""
+file: src/replay.py
+description: timing accurate replay of capture files
+"""
+
+from src.capture import CaptureReader, FLAG_ERROR, to_message
+from src.histogram import Histogram, LATENCY_BUCKETS_S
+
+import can
+import queue
+import threading
+import time
+
+from loguru import logger
+
+# Standard TCAN IDs carry the device number in their low nibble
+TCAN_ID_MIN = 0x400
+TCAN_ID_MAX = 0x7FF
+
+# Chunks read ahead of the sender
+DEFAULT_PREFETCH_CHUNKS = 4
+
+# Busy-wait this long before each frame instead of sleeping
+DEFAULT_SPIN_S = 0.0005
+
+_END = object()
+
+
+def remap_device(arbitration_id: int, device: int, extended: bool = False) -> int:
+    """
+    Replace the device number of a standard TCAN ID. Extended IDs are not
+    TCAN frames and are returned unchanged.
+    """
+    if not extended and TCAN_ID_MIN <= arbitration_id <= TCAN_ID_MAX:
+        return (arbitration_id & ~0xF) | (device & 0xF)
+    return arbitration_id
+
+
+class ReplayStatistics:
+    """
+    Outcome of a replay. The timing error is how late each frame was handed to
+    the bus relative to its scaled capture timestamp.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.skipped = 0
+        self.errors = 0
+        self.duration = 0.0
+        self.timing_error = Histogram(LATENCY_BUCKETS_S)
+
+    def as_dict(self):
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "duration": self.duration,
+            "timing_error": self.timing_error.as_dict(),
+        }
+
+
+class Prefetcher:
+    """
+    Reads the capture on a background thread into a bounded queue of chunks,
+    so replaying a capture of any length uses constant memory.
+    """
+
+    def __init__(self, reader: CaptureReader, ids=None, channels=None, depth=DEFAULT_PREFETCH_CHUNKS):
+        self._reader = reader
+        self._ids = None if ids is None else frozenset(ids)
+        self._channels = None if channels is None else frozenset(channels)
+        self._queue = queue.Queue(depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="replay-prefetch", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        # Unblock the reader thread if it is waiting for room
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        ids = self._ids
+        channels = self._channels
+        try:
+            for number in self._reader.candidate_chunks(ids):
+                batch = [
+                    record
+                    for record in self._reader.chunk_records(number)
+                    if (ids is None or record.arbitration_id in ids)
+                    and (channels is None or record.channel in channels)
+                ]
+                if batch and not self._put(batch):
+                    return
+        except Exception as e:
+            logger.error(f"Failed to read capture: {e}")
+        self._put(_END)
+
+    def __iter__(self):
+        while True:
+            batch = self._queue.get()
+            if batch is _END:
+                return
+            yield from batch
+
+
+class Replayer:
+    """
+    Sends the frames of a capture on a bus, reproducing their timing.
+
+    speed scales time (2.0 replays twice as fast); 0 sends as fast as the bus
+    accepts. remap maps (arbitration_id, is_extended) to the ID to send them as.
+    """
+
+    def __init__(
+        self,
+        reader: CaptureReader,
+        bus,
+        speed: float = 1.0,
+        ids=None,
+        channels=None,
+        remap=None,
+        prefetch: int = DEFAULT_PREFETCH_CHUNKS,
+        spin: float = DEFAULT_SPIN_S,
+    ):
+        if speed < 0:
+            raise ValueError(f"Invalid replay speed: {speed}")
+        self._reader = reader
+        self._bus = bus
+        self._speed = speed
+        self._ids = ids
+        self._channels = channels
+        self._remap = remap or {}
+        self._prefetch = prefetch
+        self._spin = spin
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self) -> ReplayStatistics:
+        stats = ReplayStatistics()
+        prefetcher = Prefetcher(self._reader, self._ids, self._channels, self._prefetch).start()
+        remap = self._remap
+        scale = 1.0 / self._speed if self._speed else 0.0
+        spin = self._spin
+        clock = time.perf_counter
+
+        origin = None
+        start = clock()
+        try:
+            for record in prefetcher:
+                if self._stop.is_set():
+                    break
+                if record.flags & FLAG_ERROR:
+                    stats.skipped += 1
+                    continue
+
+                msg = to_message(record)
+                msg.arbitration_id = remap.get((msg.arbitration_id, msg.is_extended_id), msg.arbitration_id)
+
+                if origin is None:
+                    origin = record.timestamp
+                    start = clock()
+                target = start + (record.timestamp - origin) * scale
+
+                if scale:
+                    delay = target - clock() - spin
+                    if delay > 0:
+                        time.sleep(delay)
+                    while clock() < target:
+                        pass
+                    stats.timing_error.observe(clock() - target)
+                try:
+                    self._bus.send(msg, timeout=1.0)
+                    stats.sent += 1
+                except can.CanError as e:
+                    stats.errors += 1
+                    logger.debug(f"Failed to replay {msg.arbitration_id:#x}: {e}")
+        finally:
+            prefetcher.stop()
+            stats.duration = clock() - start
+        return stats
@@ -0,0 +1,138 @@
+"""
+file: src/scheduler.py
+description: drift-free fixed rate scheduling of periodic tasks
+"""
+
+from src.histogram import Histogram, LATENCY_BUCKETS_S
+
+import asyncio
+import inspect
+
+from loguru import logger
+
+# Fractions of the nominal period used as bounds of the period histogram
+PERIOD_BUCKET_RATIOS = (0.5, 0.9, 0.95, 0.99, 0.999, 1.001, 1.01, 1.05, 1.1, 1.5, 2.0)
+
+
+class TaskStatistics:
+    """
+    Timing statistics of a single periodic task.
+
+    period: measured time between two consecutive runs
+    jitter: lateness of each run relative to its absolute deadline
+    missed: number of deadlines skipped because a run was a period or more late
+    """
+
+    def __init__(self, name: str, period: float):
+        self._name = name
+        self._period = period
+        self._runs = 0
+        self._missed = 0
+        self._period_hist = Histogram([period * r for r in PERIOD_BUCKET_RATIOS])
+        self._jitter_hist = Histogram(LATENCY_BUCKETS_S)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def period(self):
+        return self._period
+
+    @property
+    def runs(self):
+        return self._runs
+
+    @property
+    def missed(self):
+        return self._missed
+
+    @property
+    def period_histogram(self):
+        return self._period_hist
+
+    @property
+    def jitter_histogram(self):
+        return self._jitter_hist
+
+    def as_dict(self):
+        return {
+            "name": self._name,
+            "period": self._period,
+            "runs": self._runs,
+            "missed": self._missed,
+            "measured_period": self._period_hist.as_dict(),
+            "jitter": self._jitter_hist.as_dict(),
+        }
+
+
+class Scheduler:
+    """
+    Runs callbacks at a fixed rate on absolute deadlines.
+
+    Deadlines are computed as start + n * period on the loop's monotonic clock,
+    so the time spent in the callback does not accumulate as drift the way
+    `await asyncio.sleep(period)` does.
+
+    With spin > 0 the task sleeps until `spin` seconds before the deadline and
+    then busy-waits for the rest, trading that much event loop time per run
+    for sub-millisecond release precision.
+    """
+
+    def __init__(self):
+        self._stats = {}
+
+    @property
+    def stats(self):
+        return self._stats
+
+    def as_dict(self):
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+    async def run(self, name: str, period: float, callback, spin: float = 0.0):
+        """
+        Call callback every period seconds, forever.
+        callback may be a plain function or a coroutine function.
+        """
+        if period <= 0:
+            raise ValueError(f"Invalid period for task '{name}': {period}")
+
+        stats = TaskStatistics(name, period)
+        self._stats[name] = stats
+        is_async = inspect.iscoroutinefunction(callback)
+
+        loop = asyncio.get_running_loop()
+        clock = loop.time
+        deadline = clock() + period
+        last_start = None
+
+        while True:
+            delay = deadline - clock() - spin
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if spin > 0:
+                while clock() < deadline:
+                    pass
+
+            start = clock()
+            lateness = start - deadline
+            if lateness >= period:
+                skipped = int(lateness // period)
+                stats._missed += skipped
+                deadline += skipped * period
+                lateness -= skipped * period
+                logger.trace(f"Task '{name}' missed {skipped} deadline(s)")
+
+            stats._jitter_hist.observe(lateness)
+            if last_start is not None:
+                stats._period_hist.observe(start - last_start)
+            last_start = start
+            stats._runs += 1
+
+            if is_async:
+                await callback()
+            else:
+                callback()
+
+            deadline += period
+
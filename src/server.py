@@ -1,12 +1,386 @@
+"""
+file: src/server.py
+description: concurrent orchestration of every configured bus
+"""
+
+from src.bus import BusRegistry
+from src.shmring import DEFAULT_RING_RECORDS, RingWriter
+from src.transport import AsyncBus
+
+from collections import deque, namedtuple
+
 import asyncio
+import can
+import heapq
+import itertools
 
 from loguru import logger
 
-async def server(ctx):
+# How long a frame may be held back to be ordered against the other busses
+DEFAULT_REORDER_WINDOW_S = 0.005
+
+# Frames buffered per subscriber before the oldest are dropped
+DEFAULT_SUBSCRIBER_MAXSIZE = 1024
+
+Frame = namedtuple("Frame", ["bus", "message"])
+
+
+class Subscription:
+    """
+    A consumer of the merged stream.
+
+    Only frames from `busses` (all if None) whose arbitration ID is in `ids`
+    or matches one of the python-can style `filters` (everything if neither is
+    given) are delivered. Frames are buffered up to maxsize; a consumer which
+    falls behind loses its oldest frames, counted in `dropped`, and never
+    holds up the busses or the other subscribers.
+
+    ```python
+    with server.subscribe(ids={0x701}) as subscription:
+        async for frame in subscription:
+            ...
+    ```
+    """
+
+    def __init__(self, server, ids=None, filters=None, busses=None, maxsize=DEFAULT_SUBSCRIBER_MAXSIZE):
+        self._server = server
+        self._ids = None if ids is None else frozenset(ids)
+        self._filters = None if filters is None else [
+            (f["can_id"], f["can_mask"], f.get("extended"))
+            for f in filters
+        ]
+        self._busses = None if busses is None else frozenset(busses)
+        self._frames = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+        self._delivered = 0
+        self._dropped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    @property
+    def delivered(self):
+        return self._delivered
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def qsize(self):
+        return len(self._frames)
+
+    def matches(self, frame: Frame) -> bool:
+        if self._busses is not None and frame.bus not in self._busses:
+            return False
+        if self._ids is None and self._filters is None:
+            return True
+        arbitration_id = frame.message.arbitration_id
+        if self._ids is not None and arbitration_id in self._ids:
+            return True
+        if self._filters is not None:
+            extended = frame.message.is_extended_id
+            for can_id, can_mask, is_extended in self._filters:
+                if (arbitration_id ^ can_id) & can_mask == 0 and is_extended in (None, extended):
+                    return True
+        return False
+
+    def _put(self, frame: Frame):
+        if len(self._frames) == self._frames.maxlen:
+            self._dropped += 1
+        self._frames.append(frame)
+        self._delivered += 1
+        self._ready.set()
+
+    def get_nowait(self) -> Frame:
+        try:
+            return self._frames.popleft()
+        except IndexError:
+            raise asyncio.QueueEmpty
+
+    async def get(self) -> Frame:
+        while not self._frames:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._frames.popleft()
+
+    def close(self):
+        self._server.unsubscribe(self)
+
+    def as_dict(self):
+        return {
+            "delivered": self._delivered,
+            "dropped": self._dropped,
+            "pending": len(self._frames),
+        }
+
+
+class Merger:
+    """
+    Orders the frames of several busses by timestamp.
+
+    Frames of one bus arrive in order, so a frame can be released once every
+    bus has delivered a later one. A bus which is idle would hold everything
+    back, so no frame is held for longer than `window` after its arrival. A
+    frame which arrives after later frames were already released is passed
+    through immediately and counted in `late`.
+    """
+
+    def __init__(self, busses, release, window=DEFAULT_REORDER_WINDOW_S, clock=None):
+        self._watermarks = {bus: float("-inf") for bus in busses}
+        self._release = release
+        self._window = window
+        self._clock = clock or asyncio.get_running_loop().time
+        self._heap = []
+        self._sequence = itertools.count()
+        self._released_until = float("-inf")
+        self._late = 0
+
+    @property
+    def late(self):
+        return self._late
+
+    @property
+    def pending(self):
+        return len(self._heap)
+
+    def push(self, frame: Frame):
+        timestamp = frame.message.timestamp
+        if timestamp < self._released_until:
+            self._late += 1
+            self._release(frame)
+            return
+        if timestamp > self._watermarks[frame.bus]:
+            self._watermarks[frame.bus] = timestamp
+        heapq.heappush(self._heap, (timestamp, next(self._sequence), self._clock(), frame))
+        self.flush()
+
+    def flush(self, everything=False):
+        heap = self._heap
+        watermark = min(self._watermarks.values(), default=float("inf"))
+        expired = self._clock() - self._window
+        while heap:
+            timestamp, _, arrival, frame = heap[0]
+            if not (everything or timestamp <= watermark or arrival <= expired):
+                break
+            heapq.heappop(heap)
+            self._released_until = timestamp
+            self._release(frame)
+
+    def next_deadline(self):
+        """
+        Loop time at which the oldest held frame must be released, if any.
+        """
+        if not self._heap:
+            return None
+        return self._heap[0][2] + self._window
+
+
+class BusServer:
+    """
+    Opens every configured bus and runs a reader and a writer for each of them
+    concurrently (through one AsyncBus per bus).
+
+    Received frames of all busses are merged into a single timestamp ordered
+    stream which is fanned out to the subscriptions. Every bus has its own
+    transmit queue and I/O thread and every subscriber its own bounded
+    buffer, so neither a busy bus nor a slow consumer delays the others.
+    """
+
+    def __init__(
+        self,
+        registry: BusRegistry,
+        busses: dict,
+        reorder_window: float = DEFAULT_REORDER_WINDOW_S,
+        tx_maxsize: int = 256,
+        rx_maxsize: int = 1024,
+    ):
+        self._registry = registry
+        self._specs = {}
+        seen = {}
+        for name, spec in busses.items():
+            if spec in seen:
+                logger.warning(f"Bus {name} is the same as {seen[spec]}, ignoring it.")
+                continue
+            seen[spec] = name
+            self._specs[name] = spec
+        self._reorder_window = reorder_window
+        self._tx_maxsize = tx_maxsize
+        self._rx_maxsize = rx_maxsize
+
+        self._shared = {}
+        self._transports = {}
+        self._received = {}
+        self._tasks = []
+        self._subscriptions = []
+        self._merger = None
+        self._flushed = asyncio.Event()
+
+    @property
+    def busses(self):
+        return list(self._specs)
+
+    @property
+    def subscriptions(self):
+        return list(self._subscriptions)
+
+    def transport(self, bus: str) -> AsyncBus:
+        return self._transports[bus]
+
+    async def start(self):
+        self._merger = Merger(self._specs, self._publish, self._reorder_window)
+        try:
+            for name, spec in self._specs.items():
+                shared = self._registry.acquire(spec)
+                self._shared[name] = shared
+                self._transports[name] = AsyncBus(
+                    shared,
+                    tx_maxsize=self._tx_maxsize,
+                    rx_maxsize=self._rx_maxsize,
+                ).start()
+                self._received[name] = 0
+                logger.info(f"Serving bus {name} ({spec.interface}:{spec.channel}).")
+        except Exception:
+            await self.close()
+            raise
+        for name in self._transports:
+            self._tasks.append(asyncio.create_task(self._read(name), name=f"read-{name}"))
+        self._tasks.append(asyncio.create_task(self._flush(), name="merge"))
+        return self
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _read(self, name):
+        transport = self._transports[name]
+        merger = self._merger
+        while True:
+            msg = await transport.recv()
+            self._received[name] += 1
+            merger.push(Frame(name, msg))
+            if merger.pending:
+                self._flushed.set()
+
+    async def _flush(self):
+        """
+        Releases frames held for an idle bus once their window expired.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            deadline = self._merger.next_deadline()
+            if deadline is None:
+                self._flushed.clear()
+                await self._flushed.wait()
+                continue
+            await asyncio.sleep(max(deadline - loop.time(), 0.0))
+            self._merger.flush()
+
+    def _publish(self, frame: Frame):
+        for subscription in self._subscriptions:
+            if subscription.matches(frame):
+                subscription._put(frame)
+
+    def subscribe(self, ids=None, filters=None, busses=None, maxsize=DEFAULT_SUBSCRIBER_MAXSIZE) -> Subscription:
+        if busses is not None:
+            unknown = [name for name in busses if name not in self._specs]
+            if unknown:
+                raise KeyError(f"Unknown bus(ses): {', '.join(unknown)}")
+        subscription = Subscription(self, ids, filters, busses, maxsize)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+
+    async def send(self, bus: str, msg: can.Message):
+        await self._transports[bus].send(msg)
+
+    def send_nowait(self, bus: str, msg: can.Message):
+        self._transports[bus].send_nowait(msg)
+
+    def as_dict(self):
+        return {
+            "busses": {
+                name: {"received": self._received[name], **transport.stats}
+                for name, transport in self._transports.items()
+            },
+            "merge": {
+                "pending": self._merger.pending if self._merger is not None else 0,
+                "late": self._merger.late if self._merger is not None else 0,
+            },
+            "subscriptions": [subscription.as_dict() for subscription in self._subscriptions],
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks.clear()
+        if self._merger is not None:
+            self._merger.flush(everything=True)
+        for transport in self._transports.values():
+            await transport.close()
+        self._transports.clear()
+        for spec in (shared.spec for shared in self._shared.values()):
+            self._registry.release(spec)
+        self._shared.clear()
+
+
+async def publish(bus_server: BusServer, ring: RingWriter):
+    """
+    Copies the merged stream into a shared memory ring.
+    """
+    channels = {name: index for index, name in enumerate(bus_server.busses)}
+    with bus_server.subscribe(maxsize=ring.capacity) as subscription:
+        while True:
+            frame = await subscription.get()
+            ring.write(frame.message, channels[frame.bus])
+            while subscription.qsize():
+                frame = subscription.get_nowait()
+                ring.write(frame.message, channels[frame.bus])
+
+
+async def server(ctx, ring=None, ring_records=DEFAULT_RING_RECORDS):
     """
     Long running processes.
+
+    With a ring name, received frames are also published in that shared
+    memory ring for other processes (see src/shmring.py).
     """
+    busses = ctx.cfg.all_busses
+    if not busses:
+        logger.warning("No busses are configured.")
 
-    while True:
-        await asyncio.sleep(1)
-        logger.trace("Server running...")
+    async with BusServer(ctx.busses, busses) as bus_server:
+        tasks = []
+        ring_writer = None
+        if ring is not None:
+            ring_writer = RingWriter(ring, ring_records, bus_server.busses)
+            tasks.append(asyncio.create_task(publish(bus_server, ring_writer)))
+            logger.info(f"Publishing frames in shared memory ring '{ring}'.")
+        try:
+            while True:
+                await asyncio.sleep(1)
+                logger.trace(f"Server running... {bus_server.as_dict()}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if ring_writer is not None:
+                ring_writer.close()
@@ -0,0 +1,317 @@
+"""
+file: src/shmring.py
+description: shared memory ring of received CAN frames
+
+A single writer (the server) publishes frames into a POSIX shared memory
+segment which any number of processes map read-only:
+
+    header   HEADER at offset 0, the write sequence (u64) at HEAD_OFFSET,
+             the pid of the writer (u64) at OWNER_OFFSET
+    channels channel names (UTF-8, newline separated) at CHANNELS_OFFSET
+    slots    `capacity` SLOTs from DATA_OFFSET
+
+Every frame gets the next sequence number n and goes to slot n % capacity. A
+slot holds a marker followed by a capture RECORD (see src/capture.py). The
+writer sets the marker to 0, writes the record, sets the marker to n + 1 and
+then advances the head to n + 1. A reader copies the record and accepts it if
+the marker read before and after is n + 1, so it never needs a lock and a
+record which was overwritten while being read is detected. Readers which fall
+more than `capacity` frames behind lose the oldest frames, which they count
+as overruns.
+
+A segment of the same name is only taken over when its writer closed it or
+is no longer running, so a second server cannot orphan the readers of a live
+ring.
+
+This relies on stores reaching the other processes in program order, as on
+x86. The writer never waits for the readers.
+"""
+
+from src.capture import CaptureRecord, RECORD, record_flags, to_message
+
+from multiprocessing import shared_memory
+
+import can
+import mmap
+import os
+import struct
+
+MAGIC = b"BRING\x00\x00\x01"
+VERSION = 1
+
+# magic, version, slot size, capacity, channel table length, open
+HEADER = struct.Struct("<8sHHIIB")
+HEAD = struct.Struct("<Q")
+OWNER = struct.Struct("<Q")
+MARKER = struct.Struct("<Q")
+
+HEAD_OFFSET = 64
+OWNER_OFFSET = 72
+CHANNELS_OFFSET = 128
+DATA_OFFSET = 4096
+CHANNELS_MAX = DATA_OFFSET - CHANNELS_OFFSET
+
+SLOT_SIZE = MARKER.size + RECORD.size
+
+DEFAULT_RING_NAME = "bench-ring"
+DEFAULT_RING_RECORDS = 65536
+
+SHM_DIR = "/dev/shm"
+
+
+class RingInUse(Exception):
+    """
+    Raised by RingWriter when a running process still writes the ring.
+    """
+    pass
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running as another user
+        return True
+    return True
+
+
+def ring_owner(name) -> int | None:
+    """
+    pid of the process writing the existing ring `name`, None if the segment
+    is no ring, was closed or its writer is gone.
+    """
+    # Read through the file: attaching with SharedMemory would register the
+    # segment with this process' resource tracker, which unlinks it at exit
+    try:
+        with open(os.path.join(SHM_DIR, name), "rb") as f:
+            header = f.read(OWNER_OFFSET + OWNER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < OWNER_OFFSET + OWNER.size or not header.startswith(MAGIC):
+        return None
+    if header[HEADER.size - 1] == 0:
+        return None
+    (owner,) = OWNER.unpack_from(header, OWNER_OFFSET)
+    if not owner or not _running(owner):
+        return None
+    return owner
+
+
+class RingWriter:
+    """
+    Creates the shared memory segment `name` and publishes frames into it.
+    The segment is removed on close.
+
+    A segment left behind by a writer which did not shut down cleanly is
+    replaced. Raises RingInUse if its writer is still running.
+    """
+
+    def __init__(self, name=DEFAULT_RING_NAME, capacity=DEFAULT_RING_RECORDS, channels=("can0",)):
+        if capacity <= 0:
+            raise ValueError(f"Invalid ring capacity: {capacity}")
+        names = "\n".join(channels).encode("utf-8")
+        if len(names) > CHANNELS_MAX:
+            raise ValueError("Too many channel names for the ring header.")
+
+        size = DATA_OFFSET + capacity * SLOT_SIZE
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            owner = ring_owner(name)
+            if owner is not None:
+                raise RingInUse(f"Frame ring '{name}' is in use by process {owner}.") from None
+            # Left behind by a server which did not shut down cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+
+        self._name = name
+        self._capacity = capacity
+        self._buffer = self._shm.buf
+        self._head = 0
+        self._buffer[CHANNELS_OFFSET:CHANNELS_OFFSET + len(names)] = names
+        HEAD.pack_into(self._buffer, HEAD_OFFSET, 0)
+        OWNER.pack_into(self._buffer, OWNER_OFFSET, os.getpid())
+        HEADER.pack_into(self._buffer, 0, MAGIC, VERSION, SLOT_SIZE, capacity, len(names), 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def head(self):
+        """
+        Number of frames written so far.
+        """
+        return self._head
+
+    def write(self, msg: can.Message, channel: int = 0):
+        self.write_raw(
+            msg.timestamp,
+            msg.arbitration_id,
+            record_flags(msg),
+            msg.dlc,
+            channel,
+            bytes(msg.data),
+        )
+
+    def write_raw(self, timestamp, arbitration_id, flags, dlc, channel, data):
+        sequence = self._head
+        offset = DATA_OFFSET + (sequence % self._capacity) * SLOT_SIZE
+        buffer = self._buffer
+        MARKER.pack_into(buffer, offset, 0)
+        RECORD.pack_into(buffer, offset + MARKER.size, timestamp, arbitration_id, flags, dlc, channel, data)
+        MARKER.pack_into(buffer, offset, sequence + 1)
+        self._head = sequence + 1
+        HEAD.pack_into(buffer, HEAD_OFFSET, self._head)
+
+    def close(self):
+        if self._shm is None:
+            return
+        # Tell attached readers that no more frames will come
+        self._buffer[HEADER.size - 1] = 0
+        self._buffer = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+
+class RingReader:
+    """
+    Maps the ring `name` read-only and follows the writer.
+
+    A new reader starts at the oldest frame still in the ring, or at the
+    newest with `latest=True`. `buffer` gives zero-copy access to the slots.
+    """
+
+    def __init__(self, name=DEFAULT_RING_NAME, latest=False):
+        self._name = name
+        self._file = open(os.path.join(SHM_DIR, name), "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, slot_size, capacity, names_len, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"'{name}' is not a frame ring.")
+        if version != VERSION or slot_size != SLOT_SIZE:
+            raise ValueError(f"Unsupported frame ring version {version} in '{name}'.")
+        self._capacity = capacity
+        names = bytes(self._map[CHANNELS_OFFSET:CHANNELS_OFFSET + names_len]).decode("utf-8")
+        self._channels = names.split("\n") if names else []
+
+        head = self.head
+        self._next = head if latest else max(head - capacity, 0)
+        self._overruns = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.read())
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def head(self):
+        return HEAD.unpack_from(self._map, HEAD_OFFSET)[0]
+
+    @property
+    def position(self):
+        """
+        Sequence number of the next frame to read.
+        """
+        return self._next
+
+    @property
+    def overruns(self):
+        """
+        Frames overwritten before this reader got to them.
+        """
+        return self._overruns
+
+    @property
+    def closed(self):
+        """
+        Whether the writer has shut down.
+        """
+        return self._map[HEADER.size - 1] == 0
+
+    @property
+    def buffer(self) -> memoryview:
+        return memoryview(self._map)[DATA_OFFSET:DATA_OFFSET + self._capacity * SLOT_SIZE]
+
+    def _skip_lapped(self, head):
+        oldest = head - self._capacity
+        if self._next < oldest:
+            self._overruns += oldest - self._next
+            self._next = oldest
+
+    def read(self, max_records=None) -> list:
+        """
+        The CaptureRecords written since the last read, oldest first.
+        """
+        buffer = self._map
+        capacity = self._capacity
+        head = self.head
+        self._skip_lapped(head)
+        if max_records is not None:
+            head = min(head, self._next + max_records)
+
+        records = []
+        sequence = self._next
+        while sequence < head:
+            offset = DATA_OFFSET + (sequence % capacity) * SLOT_SIZE
+            (before,) = MARKER.unpack_from(buffer, offset)
+            record = RECORD.unpack_from(buffer, offset + MARKER.size)
+            (after,) = MARKER.unpack_from(buffer, offset)
+            if before != sequence + 1 or after != sequence + 1:
+                # The writer lapped us while reading
+                self._next = sequence
+                self._skip_lapped(self.head)
+                if self._next == sequence:
+                    # Overwritten right now, not counted in the head yet
+                    self._next += 1
+                    self._overruns += 1
+                sequence = self._next
+                continue
+            records.append(CaptureRecord._make(record))
+            sequence += 1
+        self._next = sequence
+        return records
+
+    def messages(self, max_records=None) -> list:
+        """
+        Like `read`, as (channel, can.Message) pairs.
+        """
+        return [(record.channel, to_message(record)) for record in self.read(max_records)]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
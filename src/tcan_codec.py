@@ -0,0 +1,210 @@
+"""
+file: src/tcan_codec.py
+description: precompiled payload layouts of the TCAN command and status frames
+
+Every frame type has one Codec holding its compiled struct.Struct. Codecs
+pack into preallocated buffers (`Encoder` keeps one can.Message per device
+and rewrites its data in place) and unpack into `__slots__` records, so the
+send and receive loops do not build lists, dicts or messages per frame.
+
+All payloads are big endian.
+"""
+
+from src.tcan_commands import TCAN_ID
+
+import can
+import struct
+
+# The low nibble of a TCAN ID is the device number, the rest is the base
+DEVICE_MASK = 0x00F
+BASE_MASK = 0x7F0
+
+AUTOCAL_COMMAND_VAL = 0xFF01
+
+
+class Record:
+    """
+    Base of the decoded frame records. Subclasses only add `__slots__`.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __iter__(self):
+        for name in self.__slots__:
+            yield getattr(self, name)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and tuple(other) == tuple(self)
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+    def as_dict(self):
+        return {
+            name: value.hex() if isinstance(value, bytes) else value
+            for name, value in zip(self.__slots__, self)
+        }
+
+
+class Codec:
+    """
+    Layout of the payload of one TCAN frame type.
+    """
+
+    def __init__(self, base: TCAN_ID, fmt: str, fields):
+        self.base = base
+        self.struct = struct.Struct(fmt)
+        self.fields = tuple(fields)
+        self.size = self.struct.size
+        name = "".join(part.capitalize() for part in base.name.removeprefix("CAN_ID_").split("_"))
+        self.record = type(name, (Record,), {"__slots__": self.fields})
+
+    def __repr__(self):
+        return f"Codec({self.base.name}, {self.struct.format!r})"
+
+    def arbitration_id(self, device: int) -> int:
+        return self.base + device
+
+    def pack(self, *values) -> bytes:
+        return self.struct.pack(*values)
+
+    def pack_into(self, buffer, *values):
+        self.struct.pack_into(buffer, 0, *values)
+
+    def unpack(self, data) -> tuple:
+        return self.struct.unpack_from(data)
+
+    def decode(self, data) -> Record:
+        return self.record(*self.struct.unpack_from(data))
+
+    def message(self, device: int, *values) -> can.Message:
+        """
+        A new message. Use an Encoder in loops.
+        """
+        return can.Message(
+            arbitration_id=self.base + device,
+            data=self.struct.pack(*values),
+            is_extended_id=False,
+        )
+
+    def encoder(self, device: int) -> "Encoder":
+        return Encoder(self, device)
+
+
+class Encoder:
+    """
+    A preallocated message for one codec and device whose payload is
+    rewritten in place by `encode` and `assign`.
+
+    The same message object is returned every time, which is what a cyclic
+    (BCM) task wants: `modify_data` picks up the newest values. Anything that
+    is sent later from another thread, e.g. through a transmit queue, must
+    get a `snapshot` instead, or it may go out half rewritten.
+    """
+
+    __slots__ = ("codec", "message", "_pack_into")
+
+    def __init__(self, codec: Codec, device: int):
+        self.codec = codec
+        self.message = can.Message(
+            arbitration_id=codec.base + device,
+            data=bytearray(codec.size),
+            is_extended_id=False,
+        )
+        self._pack_into = codec.struct.pack_into
+
+    def encode(self, *values) -> can.Message:
+        self._pack_into(self.message.data, 0, *values)
+        return self.message
+
+    def assign(self, data) -> can.Message:
+        """
+        Set the raw payload, zero padded to the frame size.
+        """
+        payload = self.message.data
+        length = len(data)
+        if length > len(payload):
+            raise ValueError(f"{length} bytes do not fit in a {self.codec.base.name} frame.")
+        payload[:length] = data
+        payload[length:] = bytes(len(payload) - length)
+        return self.message
+
+    def snapshot(self) -> can.Message:
+        """
+        A new message with the current payload.
+        """
+        message = self.message
+        return can.Message(
+            arbitration_id=message.arbitration_id,
+            data=bytes(message.data),
+            is_extended_id=False,
+        )
+
+
+def _codecs(layouts):
+    return {base: Codec(base, fmt, fields) for base, (fmt, fields) in layouts.items()}
+
+
+# Commands sent to the TCU. Besides the system mode and the axis setpoints the
+# payloads are not interpreted on this side and are kept as raw bytes.
+COMMAND_LAYOUTS = {
+    TCAN_ID.CAN_ID_CONTROLLER_COMMAND_SYS: (">B", ("mode",)),
+    TCAN_ID.CAN_ID_CONTROLLER_COMMAND_PWM: (">8s", ("data",)),
+    TCAN_ID.CAN_ID_CONTROLLER_COMMAND_SPST: (">8s", ("data",)),
+    TCAN_ID.CAN_ID_CONTROLLER_COMMAND_SPDT: (">8s", ("data",)),
+    TCAN_ID.CAN_ID_CONTROLLER_COMMAND_HC: (">8s", ("data",)),
+    TCAN_ID.CAN_ID_CONTROLLER_COMMAND_CUSTOM_1: (">4H", ("custom_1", "custom_2", "custom_3", "custom_4")),
+    TCAN_ID.CAN_ID_CONTROLLER_COMMAND_CAN_AXIS: (">4h", ("axis_1", "axis_2", "axis_3", "axis_4")),
+    TCAN_ID.CAN_ID_CONTROLLER_COMMAND_RDAC: (">8s", ("data",)),
+}
+
+# Status frames reported by the TCU
+STATUS_LAYOUTS = {
+    TCAN_ID.CAN_ID_TCU_HEARTBEAT: (">B", ("mode",)),
+    TCAN_ID.CAN_ID_TCU_STAT_PWM: (">4H", ("pwm_1", "pwm_2", "pwm_3", "pwm_4")),
+    TCAN_ID.CAN_ID_TCU_STAT_SPST: (">8B", tuple(f"spst_{i}" for i in range(1, 9))),
+    TCAN_ID.CAN_ID_TCU_STAT_SPDT: (">8B", tuple(f"spdt_{i}" for i in range(1, 9))),
+    TCAN_ID.CAN_ID_TCU_STAT_HC: (">4H", ("hc_1", "hc_2", "hc_3", "hc_4")),
+    TCAN_ID.CAN_ID_TCU_STAT_CUSTOM: (">4H", ("custom_1", "custom_2", "custom_3", "custom_4")),
+    TCAN_ID.CAN_ID_TCU_STAT_CAN_AXIS: (">4h", ("axis_1", "axis_2", "axis_3", "axis_4")),
+    TCAN_ID.CAN_ID_TCU_STAT_UUID: (">Q", ("uuid",)),
+    TCAN_ID.CAN_ID_TCU_STAT_GIT_SHA: (">8s", ("git_sha",)),
+    TCAN_ID.CAN_ID_TCU_STAT_AIN_A: (">4H", ("ain_a_1", "ain_a_2", "ain_a_3", "ain_a_4")),
+    TCAN_ID.CAN_ID_TCU_STAT_AIN_B: (">4H", ("ain_b_1", "ain_b_2", "ain_b_3", "ain_b_4")),
+    TCAN_ID.CAN_ID_TCU_STAT_AIN_C: (">4H", ("ain_c_1", "ain_c_2", "ain_c_3", "ain_c_4")),
+    TCAN_ID.CAN_ID_TCU_STAT_AIN_D: (">4H", ("ain_d_1", "ain_d_2", "ain_d_3", "ain_d_4")),
+    TCAN_ID.CAN_ID_MCAN_STATUS: (">8B", tuple(f"mcan_{i}" for i in range(1, 9))),
+}
+
+COMMAND_CODECS = _codecs(COMMAND_LAYOUTS)
+STATUS_CODECS = _codecs(STATUS_LAYOUTS)
+
+SYSTEM_MODE_COMMAND = COMMAND_CODECS[TCAN_ID.CAN_ID_CONTROLLER_COMMAND_SYS]
+CUSTOM_COMMAND = COMMAND_CODECS[TCAN_ID.CAN_ID_CONTROLLER_COMMAND_CUSTOM_1]
+AXIS_COMMAND = COMMAND_CODECS[TCAN_ID.CAN_ID_CONTROLLER_COMMAND_CAN_AXIS]
+
+HEARTBEAT_STATUS = STATUS_CODECS[TCAN_ID.CAN_ID_TCU_HEARTBEAT]
+AXIS_STATUS = STATUS_CODECS[TCAN_ID.CAN_ID_TCU_STAT_CAN_AXIS]
+
+
+def autocal_payload() -> bytes:
+    """
+    Custom command payload which starts the autocalibration.
+    """
+    return CUSTOM_COMMAND.pack(0, AUTOCAL_COMMAND_VAL, 0, 0)
+
+
+def decode(msg: can.Message) -> Record | None:
+    """
+    Decode a received status frame, None if it is not one (or too short).
+    """
+    if msg.is_extended_id:
+        return None
+    codec = STATUS_CODECS.get(msg.arbitration_id & BASE_MASK)
+    if codec is None or len(msg.data) < codec.size:
+        return None
+    return codec.decode(msg.data)
@@ -0,0 +1,132 @@
+"""
+file: src/telemetry.py
+description: decode TCU status frames into a latest-value cache
+"""
+
+from src.tcan_codec import BASE_MASK, DEVICE_MASK, STATUS_CODECS
+from src.tcan_commands import TCAN_ID
+
+import can
+
+
+def signal_name(base: TCAN_ID) -> str:
+    """
+    Short name of a status frame, e.g. CAN_ID_TCU_STAT_AIN_A -> ain_a.
+    """
+    name = base.name
+    for prefix in ("CAN_ID_TCU_STAT_", "CAN_ID_TCU_", "CAN_ID_"):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    return name.lower()
+
+
+class TelemetryValue:
+    """
+    Latest decoded value of one status frame of one device.
+    """
+    __slots__ = ("device", "base", "fields", "timestamp", "values", "count")
+
+    def __init__(self, device, base, fields):
+        self.device = device
+        self.base = base
+        self.fields = fields
+        self.timestamp = None
+        self.values = None
+        self.count = 0
+
+    def as_dict(self):
+        values = self.values
+        if values is not None:
+            values = {
+                field: value.hex() if isinstance(value, bytes) else value
+                for field, value in zip(self.fields, values)
+            }
+        return {
+            "timestamp": self.timestamp,
+            "count": self.count,
+            "values": values,
+        }
+
+
+class TelemetryCache:
+    """
+    Latest value of every (device, status frame) pair seen on the bus.
+    Lookups and updates are a single dict access.
+    """
+
+    def __init__(self):
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, device: int, base: TCAN_ID) -> TelemetryValue | None:
+        return self._values.get((device, base))
+
+    def slot(self, device: int, base: int, fields) -> TelemetryValue:
+        """
+        The record for (device, base), created on first use and updated in place.
+        """
+        key = (device, base)
+        value = self._values.get(key)
+        if value is None:
+            value = TelemetryValue(device, base, fields)
+            self._values[key] = value
+        return value
+
+    @property
+    def devices(self):
+        return sorted({device for device, _ in self._values})
+
+    def device_dict(self, device: int):
+        return {
+            signal_name(TCAN_ID(base)): value.as_dict()
+            for (dev, base), value in sorted(self._values.items())
+            if dev == device
+        }
+
+    def as_dict(self):
+        return {device: self.device_dict(device) for device in self.devices}
+
+
+class TelemetryDecoder(can.Listener):
+    """
+    Demultiplexes received frames by base ID and device number and decodes
+    the status frames into a TelemetryCache.
+    """
+
+    def __init__(self, cache: TelemetryCache, codecs=STATUS_CODECS):
+        self._cache = cache
+        self._codecs = {int(base): codec for base, codec in codecs.items()}
+        self._decoded = 0
+        self._malformed = 0
+
+    @property
+    def decoded(self):
+        return self._decoded
+
+    @property
+    def malformed(self):
+        return self._malformed
+
+    def on_message_received(self, msg: can.Message):
+        if msg.is_extended_id or msg.is_error_frame:
+            return
+        aid = msg.arbitration_id
+        base = aid & BASE_MASK
+        codec = self._codecs.get(base)
+        if codec is None:
+            return
+        if len(msg.data) < codec.size:
+            self._malformed += 1
+            return
+
+        value = self._cache.slot(aid & DEVICE_MASK, base, codec.fields)
+        value.values = codec.unpack(msg.data)
+        value.timestamp = msg.timestamp
+        value.count += 1
+        self._decoded += 1
+
+    def stop(self):
+        pass
@@ -0,0 +1,289 @@
+"""
+file: src/transport.py
+description: non-blocking asyncio transport for shared CAN busses
+"""
+
+from src.bus import SharedBus
+from src.metrics import Metrics
+
+import asyncio
+import can
+import errno
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+# Frames handed to the I/O thread per wakeup
+TX_BATCH_SIZE = 32
+
+# Pause before retrying a send the kernel refused with ENOBUFS
+ENOBUFS_BACKOFF_S = 0.001
+
+
+class TransportFull(Exception):
+    """
+    Raised by AsyncBus.send_nowait when the transmit queue is full.
+    """
+    pass
+
+
+class _RxBuffer(can.Listener):
+    """
+    Bounded receive buffer. When full the oldest frame is dropped and counted.
+    """
+
+    def __init__(self, maxsize):
+        self._queue = asyncio.Queue(maxsize)
+        self._overruns = 0
+
+    @property
+    def overruns(self):
+        return self._overruns
+
+    def on_message_received(self, msg: can.Message):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self._overruns += 1
+        self._queue.put_nowait(msg)
+
+    async def get(self):
+        return await self._queue.get()
+
+    def stop(self):
+        pass
+
+
+class _ReceiveCounter(can.Listener):
+    """
+    Counts received frames and error frames per ID.
+    """
+
+    def __init__(self, bus: str, received, errors):
+        self._bus = bus
+        self._received = received
+        self._errors = errors
+
+    def on_message_received(self, msg: can.Message):
+        if msg.is_error_frame:
+            self._errors.inc((self._bus, msg.arbitration_id))
+        else:
+            self._received.inc((self._bus, msg.arbitration_id))
+
+    def stop(self):
+        pass
+
+
+class AsyncBus:
+    """
+    Awaitable send and recv on top of a SharedBus.
+
+    Frames to send go into a bounded queue that a dedicated I/O thread drains,
+    so a full kernel TX queue or a slow adapter never blocks the event loop.
+    `send` waits for room in the queue, `send_nowait` raises TransportFull.
+
+    Received frames are dispatched by a python-can Notifier registered on the
+    loop (the socket is watched with add_reader where the interface allows).
+    Frames not picked up by `recv` fast enough are dropped oldest first.
+
+    python-can allows a single Notifier per bus, so create one AsyncBus per
+    SharedBus and attach further consumers with `add_listener`.
+
+    With a Metrics registry the frames sent, failed and received are counted
+    per bus and ID and every `bus.send` is timed.
+    """
+
+    def __init__(
+        self,
+        shared: SharedBus,
+        loop: asyncio.AbstractEventLoop | None = None,
+        tx_maxsize: int = 256,
+        rx_maxsize: int = 1024,
+        send_timeout: float = 0.1,
+        metrics: Metrics | None = None,
+    ):
+        self._shared = shared
+        self._loop = loop
+        self._tx_maxsize = tx_maxsize
+        self._rx_maxsize = rx_maxsize
+        self._send_timeout = send_timeout
+
+        self._tx = None
+        self._rx = None
+        self._listeners = []
+        self._notifier = None
+        self._writer = None
+        self._notifier_bus = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f"can-tx-{shared.spec.channel}",
+        )
+
+        self._sent = 0
+        self._dropped = 0
+        self._errors = 0
+        self._enobufs = 0
+
+        self._frames_sent = None
+        self._frames_failed = None
+        self._send_time = None
+        if metrics is not None:
+            channel = shared.spec.channel
+            self._frames_sent = metrics.counter(
+                "bench_can_frames_sent_total", "Frames sent.", ("bus", "id"),
+            )
+            self._frames_failed = metrics.counter(
+                "bench_can_frames_failed_total", "Frames the bus refused to send.", ("bus", "id"),
+            )
+            self._send_time = metrics.timing(
+                "bench_can_send_seconds", "Duration of bus.send, ENOBUFS retries included.", ("bus",),
+            ).get(channel)
+            self._listeners.append(_ReceiveCounter(
+                channel,
+                metrics.counter("bench_can_frames_received_total", "Frames received.", ("bus", "id")),
+                metrics.counter("bench_can_error_frames_total", "Error frames received.", ("bus", "id")),
+            ))
+
+    @property
+    def shared(self):
+        return self._shared
+
+    @property
+    def pending(self):
+        return self._tx.qsize() if self._tx is not None else 0
+
+    @property
+    def stats(self):
+        return {
+            "sent": self._sent,
+            "dropped": self._dropped,
+            "errors": self._errors,
+            "enobufs": self._enobufs,
+            "pending": self.pending,
+            "rx_overruns": self._rx.overruns if self._rx is not None else 0,
+        }
+
+    def start(self):
+        """
+        Start the writer and the receive notifier. Must run on the loop.
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        self._tx = asyncio.Queue(self._tx_maxsize)
+        self._rx = _RxBuffer(self._rx_maxsize)
+        self._start_notifier()
+        self._writer = self._loop.create_task(self._write())
+        return self
+
+    def _start_notifier(self):
+        bus = self._shared.bus
+        self._notifier = can.Notifier(bus, [self._rx, *self._listeners], timeout=0.1, loop=self._loop)
+        self._notifier_bus = bus
+
+    def _check_notifier(self):
+        # The shared bus may have reconnected under us
+        if self._shared.is_open and self._shared.bus is not self._notifier_bus:
+            logger.debug(f"Restarting notifier on '{self._shared.spec.channel}'")
+            self._notifier.stop()
+            self._start_notifier()
+
+    def add_listener(self, listener):
+        """
+        Add a python-can listener (or callable) called for every received frame.
+        """
+        self._listeners.append(listener)
+        if self._notifier is not None:
+            self._notifier.add_listener(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+        if self._notifier is not None:
+            self._notifier.remove_listener(listener)
+
+    async def send(self, msg: can.Message):
+        """
+        Queue msg for transmission, waiting while the queue is full.
+        """
+        await self._tx.put(msg)
+
+    async def send_many(self, msgs):
+        """
+        Queue several frames in order, only waiting while the queue is full.
+        """
+        put_nowait = self._tx.put_nowait
+        for msg in msgs:
+            try:
+                put_nowait(msg)
+            except asyncio.QueueFull:
+                await self._tx.put(msg)
+
+    def send_nowait(self, msg: can.Message):
+        """
+        Queue msg for transmission or raise TransportFull.
+        """
+        try:
+            self._tx.put_nowait(msg)
+        except asyncio.QueueFull:
+            self._dropped += 1
+            raise TransportFull(f"Transmit queue of '{self._shared.spec.channel}' is full")
+
+    async def recv(self) -> can.Message:
+        return await self._rx.get()
+
+    async def _write(self):
+        batch = []
+        while True:
+            batch.append(await self._tx.get())
+            while len(batch) < TX_BATCH_SIZE and not self._tx.empty():
+                batch.append(self._tx.get_nowait())
+            try:
+                await self._loop.run_in_executor(self._executor, self._send_batch, batch)
+            except Exception as e:
+                logger.error(f"CAN writer on '{self._shared.spec.channel}' failed: {e}")
+            batch.clear()
+            self._check_notifier()
+
+    def _send_batch(self, batch):
+        """
+        Runs on the I/O thread.
+        """
+        channel = self._shared.spec.channel
+        for msg in batch:
+            start = time.perf_counter()
+            deadline = time.monotonic() + self._send_timeout
+            while True:
+                try:
+                    self._shared.send(msg, self._send_timeout)
+                    self._sent += 1
+                    if self._frames_sent is not None:
+                        self._frames_sent.inc((channel, msg.arbitration_id))
+                    break
+                except (can.CanError, OSError) as e:
+                    if (
+                        isinstance(e, can.CanOperationError)
+                        and e.error_code == errno.ENOBUFS
+                        and time.monotonic() < deadline
+                    ):
+                        self._enobufs += 1
+                        time.sleep(ENOBUFS_BACKOFF_S)
+                        continue
+                    self._errors += 1
+                    if self._frames_failed is not None:
+                        self._frames_failed.inc((channel, msg.arbitration_id))
+                    logger.warning(f"Failed to send {msg.arbitration_id:#x} on '{self._shared.spec.channel}': {e}")
+                    break
+            if self._send_time is not None:
+                self._send_time.observe(time.perf_counter() - start)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        if self._notifier is not None:
+            self._notifier.stop()
+            self._notifier = None
+        self._executor.shutdown(wait=True)
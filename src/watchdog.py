@@ -0,0 +1,241 @@
+"""
+file: src/watchdog.py
+description: heartbeat watchdog of the JTECUs on a timer wheel
+
+Every heartbeat (CAN_ID_TCU_HEARTBEAT + device) moves the device's deadline
+to `timeout` seconds later. Deadlines live in a timer wheel of `resolution`
+second slots, so a heartbeat costs a couple of set and dict operations
+however many devices are watched, and a check only looks at the slots which
+came due since the previous one.
+
+A device is declared lost at most `resolution` seconds (plus the scheduling
+jitter of the check) after its deadline. The application acts on the loss in
+`on_timeout` and reports with `acted` once the action is done, the watchdog
+measures both steps.
+"""
+
+from src.histogram import Histogram, LATENCY_BUCKETS_S
+from src.tcan_codec import DEVICE_MASK, HEARTBEAT_STATUS
+
+import can
+import math
+import time
+
+from loguru import logger
+
+DEFAULT_HEARTBEAT_TIMEOUT_S = 1.0
+DEFAULT_RESOLUTION_S = 0.01
+
+
+class TimerWheel:
+    """
+    Deadlines of keys, bucketed in slots of `resolution` seconds. Scheduling,
+    rescheduling and cancelling are O(1).
+
+    The wheel holds `horizon` seconds worth of slots. Deadlines further out
+    share a slot with earlier ones and stay in it until their own turn.
+    """
+
+    def __init__(self, resolution: float, horizon: float, now: float):
+        if resolution <= 0 or horizon <= 0:
+            raise ValueError("Timer wheel resolution and horizon must be positive.")
+        self._resolution = resolution
+        self._slots = [set() for _ in range(math.ceil(horizon / resolution) + 2)]
+        self._deadlines = {}
+        # Next tick to expire
+        self._tick = math.floor(now / resolution)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def deadline(self, key):
+        entry = self._deadlines.get(key)
+        return entry[0] if entry is not None else None
+
+    def schedule(self, key, deadline: float):
+        # The slot of a tick expires once now >= tick * resolution >= deadline
+        tick = max(math.ceil(deadline / self._resolution), self._tick)
+        slots = self._slots
+        entry = self._deadlines.get(key)
+        if entry is not None and entry[1] != tick:
+            slots[entry[1] % len(slots)].discard(key)
+        slots[tick % len(slots)].add(key)
+        self._deadlines[key] = (deadline, tick)
+
+    def cancel(self, key):
+        entry = self._deadlines.pop(key, None)
+        if entry is not None:
+            self._slots[entry[1] % len(self._slots)].discard(key)
+
+    def expire(self, now: float) -> list:
+        """
+        Remove and return the (key, deadline) pairs due at now.
+        """
+        expired = []
+        slots = self._slots
+        deadlines = self._deadlines
+        current = math.floor(now / self._resolution)
+        while self._tick <= current:
+            tick = self._tick
+            slot = slots[tick % len(slots)]
+            if slot:
+                due = [key for key in slot if deadlines[key][1] <= tick]
+                for key in due:
+                    slot.discard(key)
+                    expired.append((key, deadlines.pop(key)[0]))
+            self._tick += 1
+        return expired
+
+
+class DeviceHeartbeat:
+    """
+    Heartbeat state of one device.
+    """
+
+    def __init__(self, device: int):
+        self.device = device
+        self.alive = None
+        self.last_seen = None
+        self.heartbeats = 0
+        self.timeouts = 0
+        self.recoveries = 0
+        self.detected = None
+
+    def as_dict(self, now: float):
+        return {
+            "alive": self.alive,
+            "heartbeats": self.heartbeats,
+            "since_last": now - self.last_seen if self.last_seen is not None else None,
+            "timeouts": self.timeouts,
+            "recoveries": self.recoveries,
+            "action_pending": self.detected is not None,
+        }
+
+
+class HeartbeatWatchdog(can.Listener):
+    """
+    Declares a device lost when no heartbeat arrived for `timeout` seconds
+    and calls on_timeout(device) once per loss.
+
+    Register it as a listener of the bus the heartbeats arrive on, `watch`
+    the devices which must be present and call `check` every `resolution`
+    seconds (`run` does so on a Scheduler). Everything runs on the event loop.
+
+    detection and action are the histograms of how late a loss was detected
+    after the deadline and of the time from detection to `acted`.
+    """
+
+    def __init__(
+        self,
+        on_timeout,
+        timeout: float = DEFAULT_HEARTBEAT_TIMEOUT_S,
+        resolution: float = DEFAULT_RESOLUTION_S,
+        detection: Histogram | None = None,
+        action: Histogram | None = None,
+        clock=time.monotonic,
+    ):
+        if timeout <= 0:
+            raise ValueError(f"Invalid heartbeat timeout: {timeout}")
+        self._on_timeout = on_timeout
+        self._timeout = timeout
+        self._resolution = resolution
+        self._clock = clock
+        self._wheel = TimerWheel(resolution, timeout + resolution, clock())
+        self._devices = {}
+        self._detection = detection if detection is not None else Histogram(LATENCY_BUCKETS_S)
+        self._action = action if action is not None else Histogram(LATENCY_BUCKETS_S)
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @property
+    def detection(self):
+        return self._detection
+
+    @property
+    def action(self):
+        return self._action
+
+    def _device(self, device: int) -> DeviceHeartbeat:
+        state = self._devices.get(device)
+        if state is None:
+            state = self._devices[device] = DeviceHeartbeat(device)
+        return state
+
+    def watch(self, device: int):
+        """
+        Expect heartbeats of device from now on.
+        """
+        self._device(device)
+        self._wheel.schedule(device, self._clock() + self._timeout)
+
+    def feed(self, device: int):
+        state = self._devices.get(device)
+        if state is None:
+            return
+        now = self._clock()
+        state.last_seen = now
+        state.heartbeats += 1
+        if not state.alive:
+            if state.alive is False:
+                state.recoveries += 1
+                logger.info(f"Heartbeat of device {device} is back")
+            state.alive = True
+        self._wheel.schedule(device, now + self._timeout)
+
+    def on_message_received(self, msg: can.Message):
+        if msg.is_extended_id or msg.is_error_frame:
+            return
+        if msg.arbitration_id & ~DEVICE_MASK == HEARTBEAT_STATUS.base:
+            self.feed(msg.arbitration_id & DEVICE_MASK)
+
+    def stop(self):
+        pass
+
+    def check(self):
+        """
+        Declare the devices whose deadline passed lost.
+        """
+        now = self._clock()
+        for device, deadline in self._wheel.expire(now):
+            state = self._devices[device]
+            state.alive = False
+            state.timeouts += 1
+            state.detected = now
+            self._detection.observe(now - deadline)
+            logger.warning(f"No heartbeat from device {device} for {self._timeout} s")
+            try:
+                self._on_timeout(device)
+            except Exception as e:
+                logger.error(f"Heartbeat timeout action of device {device} failed: {e}")
+
+    def acted(self, device: int):
+        """
+        The action on the loss of device is done. Ignored if none is pending.
+        """
+        state = self._devices.get(device)
+        if state is None or state.detected is None:
+            return
+        self._action.observe(self._clock() - state.detected)
+        state.detected = None
+
+    async def run(self, scheduler):
+        await scheduler.run("heartbeat_watchdog", self._resolution, self.check)
+
+    def as_dict(self):
+        now = self._clock()
+        return {
+            "timeout": self._timeout,
+            "resolution": self._resolution,
+            "devices": {str(device): state.as_dict(now) for device, state in sorted(self._devices.items())},
+            "detection_delay": self._detection.as_dict(),
+            "detection_to_action": self._action.as_dict(),
+        }
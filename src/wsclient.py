@@ -0,0 +1,117 @@
+"""
+file: src/wsclient.py
+description: minimal blocking WebSocket client for binary message streams
+"""
+
+import base64
+import hashlib
+import os
+import socket
+import struct
+
+GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class WebSocketClient:
+    """
+    Just enough of RFC 6455 to stream binary messages to the control server
+    over a single connection: no extensions, no fragmentation.
+
+    timeout bounds the connect and the handshake. Afterwards the socket
+    blocks, `recv` waits for the next message however long it takes.
+    """
+
+    def __init__(self, host: str, port: int, path: str, timeout: float = 5.0):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+        self._handshake(host, port, path)
+        self._sock.settimeout(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _handshake(self, host, port, path):
+        key = base64.b64encode(os.urandom(16))
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key.decode()}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            "\r\n"
+        )
+        self._sock.sendall(request.encode())
+
+        status = self._reader.readline()
+        if b" 101 " not in status:
+            raise ConnectionError(f"WebSocket upgrade refused: {status.decode(errors='replace').strip()}")
+        accept = None
+        while (line := self._reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"sec-websocket-accept":
+                accept = value.strip()
+        expected = base64.b64encode(hashlib.sha1(key + GUID).digest())
+        if accept != expected:
+            raise ConnectionError("Invalid WebSocket accept key.")
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack(">BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 0x80 | 127, length)
+        # Client frames must be masked
+        mask = os.urandom(4)
+        masked = bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+        self._sock.sendall(header + mask + masked)
+
+    def send(self, payload: bytes):
+        self._send_frame(OP_BINARY, payload)
+
+    def recv(self) -> bytes | None:
+        """
+        The next data message, or None once the server closed the connection.
+        """
+        while True:
+            header = self._reader.read(2)
+            if len(header) < 2:
+                return None
+            opcode = header[0] & 0x0F
+            length = header[1] & 0x7F
+            if length == 126:
+                (length,) = struct.unpack(">H", self._reader.read(2))
+            elif length == 127:
+                (length,) = struct.unpack(">Q", self._reader.read(8))
+            payload = self._reader.read(length)
+
+            if opcode == OP_CLOSE:
+                return None
+            if opcode == OP_PING:
+                self._send_frame(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            return payload
+
+    def close(self):
+        if self._sock is None:
+            return
+        try:
+            self._send_frame(OP_CLOSE, b"")
+        except OSError:
+            pass
+        self._reader.close()
+        self._sock.close()
+        self._sock = None
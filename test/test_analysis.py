@@ -0,0 +1,95 @@
+from src.capture import CaptureWriter
+from src.tcan_commands import SystemMode, TCAN_ID
+
+import can
+import pytest
+import struct
+
+analysis = pytest.importorskip("src.analysis")
+
+HEARTBEAT = TCAN_ID.CAN_ID_TCU_HEARTBEAT
+AIN_A = TCAN_ID.CAN_ID_TCU_STAT_AIN_A
+
+
+def write_capture(path, chunk_records=16):
+    with CaptureWriter(path, channels=["tcan", "mcan"], chunk_records=chunk_records) as writer:
+        for i in range(200):
+            t = i * 0.01
+            # Heartbeats of device 1 stop between 0.5 and 0.8 s
+            if not 50 <= i < 80:
+                mode = SystemMode.REMOTE if i >= 100 else SystemMode.MANUAL
+                writer.write(can.Message(arbitration_id=HEARTBEAT + 1, timestamp=t, data=[mode], is_extended_id=False))
+            writer.write(can.Message(
+                arbitration_id=AIN_A + 1,
+                timestamp=t + 0.001,
+                data=struct.pack(">4H", i, 1000, 2000 - i, 7),
+                is_extended_id=False,
+            ))
+            if i % 10 == 0:
+                writer.write(can.Message(arbitration_id=0x8000001, timestamp=t + 0.002, data=[1], is_extended_id=True), channel=1)
+        # AIN_A of device 1 goes quiet for the last second
+        writer.write(can.Message(arbitration_id=HEARTBEAT + 1, timestamp=3.0, data=[SystemMode.REMOTE], is_extended_id=False))
+
+
+def by_id(report):
+    return {(entry["channel"], entry["id"]): entry for entry in report["ids"]}
+
+
+def test_analyze(tmp_path):
+    path = tmp_path / "capture.bcap"
+    write_capture(path)
+    report = analysis.analyze(path, jobs=1, batch_records=40).as_dict(["tcan", "mcan"])
+
+    assert report["records"] == 200 + 171 + 20
+    ids = by_id(report)
+    heartbeat = ids[("tcan", f"{HEARTBEAT + 1:#x}")]
+    assert heartbeat["count"] == 171
+    assert heartbeat["gaps"] == 2
+    assert heartbeat["gap_list"][0]["start"] == pytest.approx(0.49)
+    assert heartbeat["gap_list"][0]["duration"] == pytest.approx(0.31)
+    assert heartbeat["period"]["min"] == pytest.approx(0.01)
+
+    ain = ids[("tcan", f"{AIN_A + 1:#x}")]
+    assert ain["gaps"] == 0
+    assert ain["rate"] == pytest.approx(100)
+    assert ain["silent_at_end"] == pytest.approx(1.009)
+    assert ids[("mcan", "0x8000001")]["extended"]
+
+    ranges = report["signals"]["1"]["ain_a"]
+    assert ranges["ain_a_1"]["min"] == 0 and ranges["ain_a_1"]["max"] == 199
+    assert ranges["ain_a_3"]["min"] == 1801
+    assert ranges["ain_a_4"] == {"min": 7, "max": 7, "mean": 7}
+
+    timeline = report["modes"]["1"]["reported"]
+    assert timeline["initial"] == "MANUAL"
+    assert [(t["from"], t["to"]) for t in timeline["transitions"]] == [("MANUAL", "REMOTE")]
+    assert timeline["transitions"][0]["timestamp"] == pytest.approx(1.0)
+
+
+def test_parallel_matches_serial(tmp_path):
+    path = tmp_path / "capture.bcap"
+    write_capture(path, chunk_records=7)
+    serial = analysis.analyze(path, jobs=1).as_dict()
+    parallel = analysis.analyze(path, jobs=2, batch_records=10).as_dict()
+    for entry in serial["ids"] + parallel["ids"]:
+        entry["period"].pop("stdev", None)
+        entry["period"].pop("mean", None)
+    assert parallel == serial
+
+
+def test_remote_frames_are_not_decoded(tmp_path):
+    path = tmp_path / "capture.bcap"
+    with CaptureWriter(path, channels=["tcan"]) as writer:
+        for i in range(10):
+            t = i * 0.01
+            writer.write(can.Message(arbitration_id=HEARTBEAT + 1, timestamp=t, data=[SystemMode.REMOTE], is_extended_id=False))
+            writer.write(can.Message(arbitration_id=AIN_A + 1, timestamp=t, data=struct.pack(">4H", 5, 5, 5, 5), is_extended_id=False))
+            remote = {"timestamp": t + 0.005, "is_remote_frame": True, "is_extended_id": False}
+            writer.write(can.Message(arbitration_id=HEARTBEAT + 1, dlc=1, **remote))
+            writer.write(can.Message(arbitration_id=AIN_A + 1, dlc=8, **remote))
+    report = analysis.analyze(path, jobs=1).as_dict(["tcan"])
+
+    assert report["signals"]["1"]["ain_a"]["ain_a_1"]["min"] == 5
+    timeline = report["modes"]["1"]["reported"]
+    assert timeline["initial"] == "REMOTE"
+    assert timeline["transitions"] == []
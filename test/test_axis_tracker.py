@@ -0,0 +1,59 @@
+from src.axis_tracker import AxisTracker
+from src.tcan_codec import AXIS_COMMAND, AXIS_STATUS
+
+import can
+
+
+def report(device, values, timestamp):
+    return can.Message(
+        arbitration_id=AXIS_STATUS.arbitration_id(device),
+        data=AXIS_STATUS.pack(*values),
+        timestamp=timestamp,
+        is_extended_id=False,
+    )
+
+
+def test_matches_first_reflecting_report():
+    now = [100.0]
+    tracker = AxisTracker(timeout=1.0, clock=lambda: now[0])
+    tracker.commanded(1, AXIS_COMMAND.pack(10, 0, 0, 0), 100.0)
+    tracker.on_message_received(report(1, (0, 0, 0, 0), 100.01))
+    tracker.on_message_received(report(1, (10, 0, 0, 0), 100.02))
+    tracker.on_message_received(report(1, (10, 0, 0, 0), 100.03))
+    # Another device's reports are ignored
+    tracker.on_message_received(report(2, (20, 0, 0, 0), 100.04))
+
+    # Overtaken before it was reflected
+    tracker.commanded(1, AXIS_COMMAND.pack(20, 0, 0, 0), 100.1)
+    tracker.commanded(1, AXIS_COMMAND.pack(30, 0, 0, 0), 100.2)
+    tracker.commanded(1, AXIS_COMMAND.pack(30, 0, 0, 0), 100.25)
+    tracker.on_message_received(report(1, (30, 0, 0, 0), 100.25))
+
+    stats = tracker.device_dict(1)
+    assert (stats["commands"], stats["applied"], stats["superseded"], stats["lost"]) == (3, 2, 1, 0)
+    assert abs(stats["latency"]["p50"] - 0.02) < 1e-9
+    assert abs(stats["latency"]["max"] - 0.05) < 1e-9
+    assert stats["reported"] == (30, 0, 0, 0)
+    assert tracker.device_dict(2) is None
+
+
+def test_unreflected_command_is_lost():
+    now = [0.0]
+    tracker = AxisTracker(timeout=0.5, clock=lambda: now[0])
+    tracker.commanded(3, [0, 5], 0.0)
+    now[0] = 0.4
+    assert tracker.device_dict(3)["pending"] == 1
+    now[0] = 0.6
+    stats = tracker.device_dict(3)
+    assert (stats["pending"], stats["lost"], stats["latency"]["count"]) == (0, 1, 0)
+
+    tolerant = AxisTracker(tolerance=2)
+    tolerant.commanded(3, AXIS_COMMAND.pack(100, 0, 0, 0), 1.0)
+    tolerant.on_message_received(report(3, (98, 1, 0, 0), 1.1))
+    assert tolerant.device_dict(3)["applied"] == 1
+
+
+def test_as_dict_is_json_friendly():
+    tracker = AxisTracker()
+    tracker.commanded(4, [0] * 8, 1.0)
+    assert list(tracker.as_dict()) == ["4"]
@@ -0,0 +1,66 @@
+from src.bus import BusRegistry, is_disconnect
+from src.configuration.v1 import CanBusSpec
+
+import can
+import errno
+
+SPEC = CanBusSpec("virtual", "test_bus")
+
+def test_acquire_shares_bus():
+    registry = BusRegistry()
+    a = registry.acquire(SPEC)
+    b = registry.acquire(SPEC)
+    assert a is b
+    assert a.refs == 2
+    registry.shutdown()
+
+def test_release_closes_unpinned():
+    registry = BusRegistry()
+    with registry.acquire(SPEC) as bus:
+        assert bus.is_open
+    assert SPEC not in registry
+    assert not bus.is_open
+
+def test_pinned_stays_open():
+    registry = BusRegistry()
+    pinned = registry.pin(SPEC)
+    with registry.acquire(SPEC) as bus:
+        assert bus is pinned
+    assert SPEC in registry
+    assert pinned.is_open
+    registry.shutdown()
+    assert not pinned.is_open
+
+def test_send_through_shared_bus():
+    registry = BusRegistry()
+    receiver = can.interface.Bus(interface="virtual", channel=SPEC.channel)
+    with registry.acquire(SPEC) as bus:
+        bus.send(can.Message(arbitration_id=0x501, data=[1], is_extended_id=False))
+    msg = receiver.recv(1.0)
+    receiver.shutdown()
+    assert msg is not None
+    assert msg.arbitration_id == 0x501
+
+def test_is_disconnect():
+    assert is_disconnect(can.CanOperationError("gone", errno.ENODEV))
+    assert is_disconnect(OSError(errno.ENETDOWN, "down"))
+    assert not is_disconnect(can.CanOperationError("full", errno.ENOBUFS))
+    assert not is_disconnect(ValueError())
+
+def test_periodic_modify_data():
+    registry = BusRegistry()
+    receiver = can.interface.Bus(interface="virtual", channel="test_periodic")
+    spec = CanBusSpec("virtual", "test_periodic")
+    with registry.acquire(spec) as bus:
+        msg = can.Message(arbitration_id=0x501, data=[0], is_extended_id=False)
+        task = bus.send_periodic(msg, 0.01)
+        assert receiver.recv(1.0).data[0] == 0
+        task.message.data[0] = 1
+        task.modify_data()
+        for _ in range(10):
+            if receiver.recv(1.0).data[0] == 1:
+                break
+        else:
+            assert False, "modified frame never sent"
+        task.stop()
+    receiver.shutdown()
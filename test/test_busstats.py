@@ -0,0 +1,48 @@
+from src.busstats import BusStatistics, STANDARD_ID_SLOTS
+
+import can
+
+def frame(arbitration_id, timestamp, data=(1, 2), extended=False):
+    return can.Message(
+        arbitration_id=arbitration_id,
+        timestamp=timestamp,
+        data=data,
+        is_extended_id=extended,
+    )
+
+def test_period_and_payload():
+    stats = BusStatistics("tcan")
+    for i in range(5):
+        stats.on_message_received(frame(0x701, i * 0.1, data=[i]))
+    mean, jitter = stats.period(0x701)
+    assert abs(mean - 0.1) < 1e-9
+    assert jitter < 1e-6
+    assert stats.count(0x701) == 5
+    assert stats.payload(0x701) == bytes([4])
+    assert stats.bits == 5 * (47 + 8)
+
+def test_extended_slots_are_bounded():
+    stats = BusStatistics("tcan", extended_slots=2)
+    for arbitration_id in (0x8000001, 0x8000002, 0x8000003):
+        stats.on_message_received(frame(arbitration_id, 0.0, extended=True))
+    ids = list(stats.ids())
+    assert ids == [(0x8000001, True, STANDARD_ID_SLOTS), (0x8000002, True, STANDARD_ID_SLOTS + 1)]
+    assert stats.untracked == 1
+    assert stats.frames == 3
+
+def test_error_frames():
+    stats = BusStatistics("tcan")
+    stats.on_message_received(can.Message(is_error_frame=True))
+    assert stats.errors == 1
+    assert stats.frames == 0
+
+def test_remote_and_fd_frames_keep_their_slot():
+    stats = BusStatistics("tcan")
+    stats.on_message_received(frame(0x700, 0.0, data=[9] * 8))
+    stats.on_message_received(can.Message(arbitration_id=0x700, timestamp=0.1, dlc=8, is_remote_frame=True, is_extended_id=False))
+    stats.on_message_received(can.Message(arbitration_id=0x702, timestamp=0.1, data=range(16), is_fd=True, is_extended_id=False))
+    stats.on_message_received(frame(0x701, 0.2, data=[7, 7]))
+    assert stats.payload(0x700) == b""
+    assert stats.payload(0x701) == bytes([7, 7])
+    assert stats.payload(0x702) == bytes(range(8))
+    assert stats.bits == 4 * 47 + 8 * (8 + 16 + 2)
@@ -0,0 +1,64 @@
+from src.capture import CaptureReader, CaptureWriter, FOOTER, to_message
+
+import can
+
+def frame(arbitration_id, timestamp, extended=False):
+    return can.Message(
+        arbitration_id=arbitration_id,
+        timestamp=timestamp,
+        data=[arbitration_id & 0xFF, 1, 2],
+        is_extended_id=extended,
+    )
+
+def write_capture(path, chunk_records=4):
+    with CaptureWriter(path, channels=["tcan", "mcan"], chunk_records=chunk_records) as writer:
+        for i in range(20):
+            writer.write(frame(0x760 if i % 2 else 0x701, float(i)), channel=i % 2)
+        writer.write(frame(0x8000001, 20.0, extended=True))
+    return writer
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "capture.bcap"
+    write_capture(path)
+    with CaptureReader(path) as reader:
+        assert reader.complete
+        assert reader.channels == ["tcan", "mcan"]
+        assert reader.records == 21
+        assert len(reader.chunks) == 6
+        records = list(reader)
+        assert [r.timestamp for r in records] == [float(i) for i in range(21)]
+        msg = to_message(records[-1])
+        assert msg.is_extended_id
+        assert msg.arbitration_id == 0x8000001
+        assert bytes(msg.data) == bytes([1, 1, 2])
+
+def test_query_uses_index(tmp_path):
+    path = tmp_path / "capture.bcap"
+    write_capture(path)
+    with CaptureReader(path) as reader:
+        assert list(reader.candidate_chunks(ids=[0x8000001])) == [5]
+        assert list(reader.candidate_chunks(ids=[0x760], t0=9.5, t1=12.0)) == [2, 3]
+        records = list(reader.query(ids=[0x760], t0=9.5, t1=12.0))
+        assert [r.timestamp for r in records] == [11.0]
+
+def test_recover_without_footer(tmp_path):
+    path = tmp_path / "capture.bcap"
+    write_capture(path)
+    data = path.read_bytes()
+    # Drop the index and footer as if the recorder was killed
+    index_offset = FOOTER.unpack_from(data, len(data) - FOOTER.size)[0]
+    path.write_bytes(data[:index_offset])
+    with CaptureReader(path) as reader:
+        assert not reader.complete
+        assert reader.records == 21
+        assert list(reader.candidate_chunks(ids=[0x8000001])) == [5]
+
+def test_long_fd_frames_are_skipped(tmp_path):
+    path = tmp_path / "capture.bcap"
+    with CaptureWriter(path) as writer:
+        writer.write(frame(0x701, 0.0))
+        writer.write(can.Message(arbitration_id=0x702, timestamp=1.0, data=range(12), is_fd=True, is_extended_id=False))
+        writer.write(can.Message(arbitration_id=0x703, timestamp=2.0, data=range(8), is_fd=True, is_extended_id=False))
+    assert writer.skipped == 1
+    with CaptureReader(path) as reader:
+        assert [r.arbitration_id for r in reader] == [0x701, 0x703]
@@ -0,0 +1,66 @@
+from src.cache import FileCache
+from src.commands import COMMANDS, LazyGroup
+
+import click
+import os
+import pathlib
+import subprocess
+import sys
+
+BENCH = pathlib.Path(__file__).parent.parent / "bin" / "bench"
+
+
+def test_file_cache_invalidated_by_change(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("one")
+    calls = []
+
+    def compute(path):
+        calls.append(path)
+        return path.read_text()
+
+    assert FileCache(tmp_path / "cache.json").get("text", source, compute) == "one"
+    # A new instance reads the persisted value
+    assert FileCache(tmp_path / "cache.json").get("text", source, compute) == "one"
+    assert len(calls) == 1
+
+    source.write_text("three")
+    assert FileCache(tmp_path / "cache.json").get("text", source, compute) == "three"
+    assert len(calls) == 2
+
+
+def test_file_cache_skips_unserializable_values(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("x")
+    cache = FileCache(tmp_path / "cache.json")
+    assert cache.get("object", source, lambda path: {1, 2}) == {1, 2}
+    assert not (tmp_path / "cache.json").exists()
+
+
+def test_lazy_help_matches_commands():
+    group = LazyGroup(lazy_commands=COMMANDS)
+    for name, (_, short_help) in COMMANDS.items():
+        command = group.get_command(None, name)
+        assert command.name == name
+        assert command.get_short_help_str() == short_help
+
+
+def test_lazy_group_loads_on_lookup():
+    group = LazyGroup(lazy_commands=COMMANDS)
+    assert group.list_commands(None) == sorted(COMMANDS)
+    assert "config" not in group.commands
+    assert isinstance(group.get_command(None, "config"), click.Command)
+    assert group.get_command(None, "missing") is None
+
+
+def test_help_does_not_import_heavy_modules(tmp_path):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", str(BENCH), "--help"],
+        env={**os.environ, "BENCH_CACHE": str(tmp_path / "cache.json")},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+    assert "replay" in result.stdout
+    imported = {line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines()}
+    assert not imported & {"asyncio", "can", "loguru", "tomllib", "yaml", "src.commands.serve"}
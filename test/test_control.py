@@ -0,0 +1,78 @@
+import control
+
+import asyncio
+import pytest
+
+from microdot.test_client import TestClient
+
+def make_context():
+    ctx = control.Context(
+        interface="virtual",
+        channel="test_control",
+        jtecu_id=1,
+        host="localhost",
+        port=0,
+    )
+    control.app.context = ctx
+    return ctx
+
+def test_axis_stream_updates_state_and_acks():
+    ctx = make_context()
+    acks = []
+
+    def client():
+        ack = yield control.AXIS_STREAM_SEQUENCED.pack(7, bytes(range(8)))
+        acks.append(ack)
+        ack = yield control.AXIS_STREAM_TIMESTAMPED.pack(8, 1234.5, bytes([8] * 8))
+        acks.append(ack)
+        ack = yield bytes([9] * 8)
+
+    async def main():
+        await TestClient(control.app).websocket("/ws/axis", client)
+
+    asyncio.run(main())
+    assert bytes(ctx.axis_data) == bytes([9] * 8)
+    seq, latency_us = control.AXIS_STREAM_ACK.unpack(acks[0])
+    assert seq == 7
+    assert latency_us < 1_000_000
+    seq, latency_us, client_time = control.AXIS_STREAM_TIMESTAMPED_ACK.unpack(acks[1])
+    assert (seq, client_time) == (8, 1234.5)
+    # Both setpoints coalesced into a single pending axis command
+    assert ctx.command_queue.qsize() == 1
+
+def test_parse_stream_line():
+    assert control.parse_stream_line("  # comment") is None
+    assert control.parse_stream_line("") is None
+    assert control.parse_stream_line("mode remote").path == "/enter_mode/1"
+    command = control.parse_stream_line("steering -2")
+    assert command.path == "/set_axis"
+    assert bytes(command.axis[:2]) == (-2).to_bytes(2, "big", signed=True)
+    assert control.parse_stream_line("sleep 0.5").delay == 0.5
+    for line in ("steering 2000", "mode turbo", "axis 1 2"):
+        with pytest.raises(ValueError):
+            control.parse_stream_line(line)
+
+def test_metrics_route():
+    make_context()
+
+    async def main():
+        client = TestClient(control.app)
+        await client.post("/set_axis", body=[1, 2, 3])
+        return await client.get("/metrics")
+
+    response = asyncio.run(main())
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert 'bench_http_request_seconds_count{handler="set_axis"} 1' in response.text
+    assert 'bench_frame_encode_seconds_count{frame="axis"} 1' in response.text
+    assert "bench_command_queue_depth 1" in response.text
+
+def test_heartbeat_timeout_actions():
+    ctx = make_context()
+    ctx.emergency(1)
+    assert ctx.teleo_mode == control.SystemMode.EMERGENCY
+    assert ctx.command_queue.get_nowait() == control.SystemModeCommand(1, control.SystemMode.EMERGENCY)
+
+    ctx.stop_axis(1)
+    assert ctx.axis_stopped
+    ctx.set_axis_data(bytearray(8))
+    assert not ctx.axis_stopped
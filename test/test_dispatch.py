@@ -0,0 +1,68 @@
+from src.dispatch import (
+    AxisCommand,
+    CommandQueue,
+    Dispatcher,
+    SystemModeCommand,
+    autocal,
+    to_message,
+)
+from src.tcan_commands import SystemMode
+
+import asyncio
+import pytest
+
+def drain(queue):
+    commands = []
+    while not queue.empty():
+        try:
+            commands.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            break
+    return commands
+
+def test_axis_commands_coalesce_per_device():
+    queue = CommandQueue()
+    for value in range(10):
+        queue.put_nowait(AxisCommand(1, bytes([value])))
+    queue.put_nowait(AxisCommand(2, bytes([42])))
+    assert drain(queue) == [AxisCommand(1, bytes([9])), AxisCommand(2, bytes([42]))]
+    assert queue.coalesced == 9
+
+def test_emergency_jumps_ahead_and_drops_stale_mode():
+    queue = CommandQueue()
+    queue.put_nowait(autocal(1))
+    queue.put_nowait(SystemModeCommand(1, SystemMode.REMOTE))
+    queue.put_nowait(SystemModeCommand(1, SystemMode.EMERGENCY))
+    assert drain(queue) == [SystemModeCommand(1, SystemMode.EMERGENCY), autocal(1)]
+
+def test_fifo_lane_is_bounded():
+    queue = CommandQueue(maxsize=2)
+    queue.put_nowait(autocal(1))
+    queue.put_nowait(autocal(1))
+    with pytest.raises(asyncio.QueueFull):
+        queue.put_nowait(autocal(1))
+    assert queue.rejected == 1
+
+def test_to_message():
+    msg = to_message(autocal(3))
+    assert msg.arbitration_id == 0x553
+    assert bytes(msg.data) == bytes([0, 0, 0xFF, 0x01, 0, 0, 0, 0])
+    assert list(to_message(SystemModeCommand(1, SystemMode.REMOTE)).data) == [1]
+
+def test_dispatcher_routes_by_type():
+    async def main():
+        dispatcher = Dispatcher(CommandQueue())
+        handled = []
+
+        @dispatcher.handler(AxisCommand)
+        async def on_axis(command):
+            handled.append(command)
+
+        task = asyncio.create_task(dispatcher.run())
+        dispatcher.queue.put_nowait(AxisCommand(1, b"\x01"))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        task.cancel()
+        return handled
+
+    assert asyncio.run(main()) == [AxisCommand(1, b"\x01")]
@@ -0,0 +1,58 @@
+from src.bus import BusRegistry
+from src.configuration.v1 import CanBusSpec
+from src.filters import compile_filters, matches, tcan_ids
+from src.tcan_codec import STATUS_LAYOUTS
+from src.tcan_commands import TCAN_ID
+
+import can
+import random
+
+
+def accepted(filters, extended=False):
+    return {i for i in range(1 << (29 if extended else 11)) if matches(filters, i, extended)}
+
+
+def test_exact_and_small():
+    ids = tcan_ids(STATUS_LAYOUTS, [3])
+    filters = compile_filters(ids)
+    assert accepted(filters) == ids
+    assert len(filters) <= 4
+
+    assert compile_filters(range(0x700, 0x800)) == [{"can_id": 0x700, "can_mask": 0x700, "extended": False}]
+    assert compile_filters([0x123]) == [{"can_id": 0x123, "can_mask": 0x7FF, "extended": False}]
+    assert compile_filters([]) == []
+
+
+def test_limit_accepts_superset():
+    rng = random.Random(7)
+    ids = set(rng.sample(range(2048), 600))
+    filters = compile_filters(ids, max_filters=16)
+    assert len(filters) <= 16
+    assert ids <= accepted(filters)
+
+
+def test_extended():
+    ids = {0x18FEF100 + i for i in range(8)}
+    filters = compile_filters(ids, extended=True)
+    assert filters == [{"can_id": 0x18FEF100, "can_mask": 0x1FFFFFF8, "extended": True}]
+
+
+def test_registry_subscription_filters_open_busses():
+    registry = BusRegistry()
+    spec = CanBusSpec("virtual", "test_filters")
+    shared = registry.acquire(spec)
+    peer = can.interface.Bus(interface="virtual", channel="test_filters")
+
+    registry.subscribe([TCAN_ID.CAN_ID_TCU_HEARTBEAT + 1])
+    for arbitration_id in (0x701, 0x702, 0x561, 0x701):
+        peer.send(can.Message(arbitration_id=arbitration_id, data=[0], is_extended_id=False))
+    received = [shared.recv(0.1) for _ in range(3)]
+
+    registry.subscribe([0x561])
+    peer.send(can.Message(arbitration_id=0x561, data=[0], is_extended_id=False))
+    later = shared.recv(0.5)
+
+    peer.shutdown()
+    registry.shutdown()
+    assert [msg.arbitration_id if msg else None for msg in received] == [0x701, 0x701, None]
+    assert later.arbitration_id == 0x561
@@ -0,0 +1,141 @@
+from src.capture import CaptureReader
+from src import importer
+from src.importer import import_logs, plan
+
+import can
+import os
+import pytest
+
+
+def frames(count=600):
+    return [
+        can.Message(
+            arbitration_id=0x700 + i % 3 if i % 5 else 0x18FF0001,
+            timestamp=1.7e9 + i * 0.001,
+            data=bytes([i & 0xFF, i >> 8, 1, 2, 3][: 1 + i % 5]),
+            is_extended_id=not i % 5,
+            channel=i % 2,
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def fd_limit():
+    """
+    Allow only a few more file descriptors than are open now.
+    """
+    resource = pytest.importorskip("resource")
+    if not os.path.isdir("/proc/self/fd"):
+        pytest.skip("Needs /proc/self/fd")
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    limit = max(int(fd) for fd in os.listdir("/proc/self/fd")) + 24
+    resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+    yield limit
+    resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+def write_log(path, writer, messages, **kwargs):
+    with writer(path, **kwargs) as log:
+        for msg in messages:
+            log.on_message_received(msg)
+
+
+def read_capture(path):
+    with CaptureReader(path) as reader:
+        return reader.channels, [
+            (r.timestamp, r.arbitration_id, r.flags & 1, r.channel, r.data[: r.dlc])
+            for r in reader
+        ]
+
+
+def expected(messages, offset=0.0):
+    return [
+        (pytest.approx(m.timestamp - offset, abs=1e-5), m.arbitration_id, int(m.is_extended_id), m.channel, bytes(m.data))
+        for m in messages
+    ]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_import_candump(tmp_path, jobs):
+    messages = frames()
+    for msg in messages:
+        msg.channel = f"can{msg.channel}"
+    write_log(tmp_path / "trace.log", can.CanutilsLogWriter, messages)
+    assert len(plan(tmp_path / "trace.log", segment_bytes=2048)) > 4
+
+    statistics = import_logs([tmp_path / "trace.log"], tmp_path / "out.bcap", jobs=jobs, segment_bytes=2048)
+    assert statistics.frames == len(messages)
+    channels, records = read_capture(tmp_path / "out.bcap")
+    assert channels == ["can0", "can1"]
+    for msg in messages:
+        msg.channel = int(msg.channel[3:])
+    assert records == expected(messages)
+
+
+def test_import_asc(tmp_path):
+    messages = frames()
+    write_log(tmp_path / "trace.asc", can.ASCWriter, messages)
+    assert len(plan(tmp_path / "trace.asc", segment_bytes=2048)) > 4
+
+    import_logs([tmp_path / "trace.asc"], tmp_path / "out.bcap", jobs=2, segment_bytes=2048, rename={"can0": "tcan"})
+    channels, records = read_capture(tmp_path / "out.bcap")
+    assert channels == ["tcan", "can1"]
+    # ASC timestamps are relative to the first frame
+    assert records == expected(messages, offset=messages[0].timestamp)
+
+
+def test_import_blf_objects_across_containers(tmp_path):
+    messages = frames(2000)
+    # Small containers, so that objects run over into the next one
+    write_log(tmp_path / "trace.blf", can.BLFWriter, messages, max_container_size=500)
+    assert len(plan(tmp_path / "trace.blf", segment_bytes=1000)) > 10
+
+    import_logs([tmp_path / "trace.blf"], tmp_path / "out.bcap", jobs=2, segment_bytes=1000)
+    _, records = read_capture(tmp_path / "out.bcap")
+    assert records == expected(messages)
+
+
+def test_merge_in_timestamp_order(tmp_path):
+    messages = interleaved_logs(tmp_path)
+
+    import_logs([tmp_path / "a.log", tmp_path / "b.log"], tmp_path / "out.bcap", jobs=1, segment_bytes=1024)
+    channels, records = read_capture(tmp_path / "out.bcap")
+    assert channels == ["tcan", "mcan"]
+    assert [r[0] for r in records] == sorted(r[0] for r in records)
+    assert len(records) == len(messages)
+
+
+def interleaved_logs(tmp_path):
+    messages = frames()
+    for msg in messages:
+        msg.channel = "tcan" if msg.arbitration_id == 0x701 else "mcan"
+    write_log(tmp_path / "a.log", can.CanutilsLogWriter, [m for m in messages if m.channel == "tcan"])
+    write_log(tmp_path / "b.log", can.CanutilsLogWriter, [m for m in messages if m.channel == "mcan"])
+    return messages
+
+
+def test_many_sequential_segments(tmp_path, fd_limit):
+    messages = frames()
+    for msg in messages:
+        msg.channel = "can0"
+    write_log(tmp_path / "trace.log", can.CanutilsLogWriter, messages)
+    assert len(plan(tmp_path / "trace.log", segment_bytes=200)) > fd_limit
+
+    import_logs([tmp_path / "trace.log"], tmp_path / "out.bcap", jobs=1, segment_bytes=200)
+    _, records = read_capture(tmp_path / "out.bcap")
+    assert [r[0] for r in records] == [pytest.approx(m.timestamp, abs=1e-5) for m in messages]
+
+
+def test_many_overlapping_segments_merge_in_passes(tmp_path, fd_limit, monkeypatch):
+    monkeypatch.setattr(importer, "MERGE_FAN_IN", 4)
+    messages = interleaved_logs(tmp_path)
+    paths = [tmp_path / "a.log", tmp_path / "b.log"]
+    assert sum(len(plan(path, segment_bytes=200)) for path in paths) > fd_limit
+
+    import_logs(paths, tmp_path / "out.bcap", jobs=1, segment_bytes=200)
+    channels, records = read_capture(tmp_path / "out.bcap")
+    assert channels == ["tcan", "mcan"]
+    for msg in messages:
+        msg.channel = channels.index(msg.channel)
+    assert records == expected(messages)
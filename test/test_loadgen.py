@@ -0,0 +1,80 @@
+from src.bus import BusRegistry
+from src.configuration.v1 import CanBusSpec
+from src.loadgen import LoadGenerator, Profile, Stream, frame_bits
+from src.transport import AsyncBus
+
+import asyncio
+import can
+import pytest
+
+
+def test_profile_targets():
+    profile = Profile.from_dict({
+        "bitrate": 250000,
+        "streams": [
+            {"name": "a", "ids": [0x123, {"first": 0x200, "last": 0x203}], "rate": 100},
+            {"name": "b", "ids": 0x18FF0001, "load": 0.5, "dlc": 4},
+        ],
+    })
+    a, b = profile.streams
+    assert a.rate == 100 and a.bits == frame_bits(8, False) == 111
+    assert b.bits == 67 + 32
+    assert b.rate == pytest.approx(0.5 * 250000 / 99)
+    assert profile.load == pytest.approx(0.5 + 100 * 111 / 250000)
+
+    with pytest.raises(ValueError):
+        Profile.from_dict({"streams": [{"ids": [1], "rate": 10, "load": 0.1}]})
+    with pytest.raises(ValueError):
+        Profile.from_dict({"streams": [{"ids": [0x800], "extended": False, "rate": 10}]})
+    with pytest.raises(ValueError):
+        Profile.from_dict({"streams": [{"ids": [1], "rate": 10, "payload": "constant", "data": [0] * 9}]})
+
+
+def test_stream_schedule():
+    stream = Stream("s", [0x100, 0x101], rate=100, payload="id", dlc=2, burst=10)
+    assert stream.due(0) == 10
+    assert stream.due(0.099) == 10
+    assert stream.due(0.1) == 20
+    frames = stream.frames(0.0)
+    assert [msg.arbitration_id for msg in frames[:3]] == [0x100, 0x101, 0x100]
+    assert bytes(frames[1].data) == b"\x01\x01"
+    assert stream.frames(0.05) == []
+
+    ramp = Stream("r", [0x100], rate=100, ramp=2.0)
+    assert ramp.scheduled(1.0) == pytest.approx(25)
+    assert ramp.scheduled(3.0) == pytest.approx(200)
+
+    behind = Stream("b", [0x100], rate=1000)
+    assert len(behind.frames(10.0, max_backlog=50)) == 50
+    assert behind.skipped == 10001 - 50
+
+
+def test_generate_on_virtual_bus():
+    async def main():
+        registry = BusRegistry()
+        spec = CanBusSpec("virtual", "test_loadgen")
+        peer = can.interface.Bus(interface="virtual", channel="test_loadgen")
+        transport = AsyncBus(registry.acquire(spec)).start()
+        profile = Profile.from_dict({
+            "streams": [
+                {"name": "fast", "ids": [0x100, 0x101], "rate": 2000, "payload": "counter"},
+                {"name": "burst", "ids": [0x08000001], "rate": 200, "burst": 20},
+            ],
+        })
+        stats = await LoadGenerator(transport, profile).run(0.25)
+        await transport.close()
+        received = []
+        while (msg := peer.recv(0)) is not None:
+            received.append(msg)
+        peer.shutdown()
+        registry.shutdown()
+        return stats, received
+
+    stats, received = asyncio.run(main())
+    assert stats["errors"] == 0 and stats["skipped"] == 0
+    assert stats["sent"] == stats["queued"] == len(received)
+    assert 400 < stats["sent"] < 700
+    fast = [msg for msg in received if msg.arbitration_id == 0x100]
+    counters = [int.from_bytes(msg.data, "big") for msg in fast]
+    assert counters == list(range(0, 2 * len(fast), 2))
+    assert all(msg.is_extended_id for msg in received if msg.arbitration_id == 0x08000001)
@@ -0,0 +1,50 @@
+from src.bus import BusRegistry
+from src.configuration.v1 import CanBusSpec
+from src.metrics import Metrics, Stopwatch
+from src.transport import AsyncBus
+
+import asyncio
+import can
+
+
+def test_render():
+    metrics = Metrics()
+    frames = metrics.counter("frames_total", "Frames.", ("bus", "id"))
+    frames.inc(("tcan", 0x561))
+    frames.inc(("tcan", 0x561), 2)
+    timing = metrics.timing("op_seconds", "Op.", ("op",), bounds=(0.001, 0.01))
+    timing.observe(0.005, ("a",))
+    with Stopwatch(timing.get("b")):
+        pass
+    metrics.gauge("depth", "Depth.", lambda: 4)
+    assert metrics.counter("frames_total", "Frames.", ("bus", "id")) is frames
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE frames_total counter" in lines
+    assert 'frames_total{bus="tcan",id="0x561"} 3' in lines
+    assert 'op_seconds_bucket{op="a",le="0.001"} 0' in lines
+    assert 'op_seconds_bucket{op="a",le="0.01"} 1' in lines
+    assert 'op_seconds_bucket{op="a",le="+Inf"} 1' in lines
+    assert 'op_seconds_count{op="b"} 1' in lines
+    assert "depth 4" in lines
+
+
+def test_transport_counts_frames():
+    async def main():
+        metrics = Metrics()
+        registry = BusRegistry()
+        transport = AsyncBus(registry.acquire(CanBusSpec("virtual", "test_metrics")), metrics=metrics).start()
+        peer = can.interface.Bus(interface="virtual", channel="test_metrics")
+        await transport.send(can.Message(arbitration_id=0x560, data=[1], is_extended_id=False))
+        peer.send(can.Message(arbitration_id=0x761, data=[2], is_extended_id=False))
+        await asyncio.wait_for(transport.recv(), 1.0)
+        while transport.pending or not metrics["bench_can_frames_sent_total"].value(("test_metrics", 0x560)):
+            await asyncio.sleep(0.01)
+        await transport.close()
+        peer.shutdown()
+        registry.shutdown()
+        return metrics
+
+    metrics = asyncio.run(main())
+    assert metrics["bench_can_frames_received_total"].value(("test_metrics", 0x761)) == 1
+    assert metrics["bench_can_send_seconds"].get("test_metrics").count == 1
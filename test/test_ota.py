@@ -0,0 +1,109 @@
+from src.bus import BusRegistry
+from src.configuration.v1 import CanBusSpec
+from src.ota import (
+    BEGIN, DATA_HEADER, END, FRAME_PAYLOAD, OP_BEGIN, OP_END, RESPONSE,
+    STATUS_ACK, STATUS_DONE, STATUS_ERROR, STATUS_NAK, STATUS_READY,
+    Flasher, FirmwareImage, OtaError,
+)
+from src.transport import AsyncBus
+
+import asyncio
+import can
+import os
+import pytest
+import threading
+import zlib
+
+DEVICE = 3
+
+class FakeDevice(threading.Thread):
+    """
+    Minimal OTA target: NAKs block 2 the first time and checks the CRC.
+    """
+
+    def __init__(self, channel):
+        super().__init__(daemon=True)
+        self.bus = can.interface.Bus(interface="virtual", channel=channel)
+        self.image = bytearray()
+        self.blocks = {}
+        self.pending = {}
+        self.naked = False
+        self.running = True
+
+    def respond(self, status, block=0):
+        self.bus.send(can.Message(arbitration_id=0x410 + DEVICE, data=RESPONSE.pack(status, block), is_extended_id=False))
+
+    def run(self):
+        while self.running:
+            msg = self.bus.recv(0.1)
+            if msg is None:
+                continue
+            if msg.arbitration_id == 0x400 + DEVICE:
+                if msg.data[0] == OP_BEGIN:
+                    _, self.size, self.block_frames = BEGIN.unpack_from(msg.data)
+                    self.respond(STATUS_READY)
+                elif msg.data[0] == OP_END:
+                    _, crc = END.unpack_from(msg.data)
+                    image = b"".join(self.blocks[b] for b in sorted(self.blocks))
+                    self.respond(STATUS_DONE if zlib.crc32(image) == crc else STATUS_ERROR)
+            elif msg.arbitration_id == 0x420 + DEVICE:
+                block, index = DATA_HEADER.unpack_from(msg.data)
+                payload = bytes(msg.data[DATA_HEADER.size:])
+                frames = self.pending
+                frames.setdefault(block, {})[index] = payload
+                block_size = self.block_frames * FRAME_PAYLOAD
+                expected = min(block_size, self.size - block * block_size)
+                data = b"".join(frames[block][i] for i in sorted(frames[block]))
+                if len(data) == expected:
+                    del frames[block]
+                    if block == 2 and not self.naked:
+                        self.naked = True
+                        self.respond(STATUS_NAK, block)
+                    else:
+                        self.blocks[block] = data
+                        self.respond(STATUS_ACK, block)
+
+def test_flash_with_retransmit(tmp_path):
+    path = tmp_path / "firmware.bin"
+    firmware = os.urandom(1000)
+    path.write_bytes(firmware)
+
+    device = FakeDevice("test_ota")
+    device.start()
+
+    async def main():
+        registry = BusRegistry()
+        transport = AsyncBus(registry.acquire(CanBusSpec("virtual", "test_ota"))).start()
+        with FirmwareImage(path, block_frames=16) as image:
+            stats = await Flasher(transport, DEVICE, window=4, timeout=1.0).flash(image)
+        await transport.close()
+        registry.shutdown()
+        return stats
+
+    stats = asyncio.run(main())
+    device.running = False
+    device.join()
+    device.bus.shutdown()
+
+    assert b"".join(device.blocks[b] for b in sorted(device.blocks)) == firmware
+    assert stats.blocks == 13
+    assert stats.retransmits == 1
+    assert stats.bytes == 1000
+
+
+def test_flash_without_device_times_out(tmp_path):
+    path = tmp_path / "firmware.bin"
+    path.write_bytes(os.urandom(100))
+
+    async def main():
+        registry = BusRegistry()
+        transport = AsyncBus(registry.acquire(CanBusSpec("virtual", "test_ota_silent"))).start()
+        try:
+            with FirmwareImage(path, block_frames=16) as image:
+                with pytest.raises(OtaError, match="Timed out"):
+                    await Flasher(transport, DEVICE, timeout=0.05, retries=2).flash(image)
+        finally:
+            await transport.close()
+            registry.shutdown()
+
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+from src.queue import Backpressure, Queue
+
+import asyncio
+import pytest
+import queue
+import threading
+
+def test_sync_to_async_batches():
+    async def main():
+        q = Queue(asyncio.get_running_loop())
+
+        def produce():
+            for start in range(0, 1000, 100):
+                q.sync_put_many(range(start, start + 100))
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        received = []
+        while len(received) < 1000:
+            received.extend(await q.async_get_many(64))
+        thread.join()
+        return received
+
+    assert asyncio.run(main()) == list(range(1000))
+
+def test_async_to_sync():
+    async def main():
+        q = Queue(asyncio.get_running_loop(), maxsize=4)
+        received = []
+
+        def consume():
+            while len(received) < 100:
+                received.extend(q.sync_get_many(10, timeout=1.0))
+
+        thread = threading.Thread(target=consume)
+        thread.start()
+        for i in range(100):
+            await q.async_put(i)
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+        return received
+
+    assert asyncio.run(main()) == list(range(100))
+
+def test_sync_put_nowait_is_threadsafe():
+    async def main():
+        q = Queue(asyncio.get_running_loop())
+        threading.Thread(target=q.sync_put_nowait, args=("item",)).start()
+        return await asyncio.wait_for(q.async_get(), 1.0)
+
+    assert asyncio.run(main()) == "item"
+
+def test_bounded_block_raises_when_full():
+    loop = asyncio.new_event_loop()
+    q = Queue(loop, maxsize=2)
+    assert q.sync_put_many([1, 2, 3], timeout=0) == 2
+    with pytest.raises(queue.Full):
+        q.sync_put_nowait(4)
+    assert q.sync_get() == 1
+    loop.close()
+
+def test_drop_policies():
+    loop = asyncio.new_event_loop()
+    newest = Queue(loop, maxsize=3, policy=Backpressure.DROP_NEWEST)
+    newest.sync_put_many(range(5))
+    assert newest.sync_get_many(10) == [0, 1, 2]
+    assert newest.dropped == 2
+
+    oldest = Queue(loop, maxsize=3, policy=Backpressure.DROP_OLDEST)
+    oldest.sync_put_many(range(5))
+    oldest.sync_put_nowait(5)
+    assert oldest.sync_get_many(10) == [3, 4, 5]
+    assert oldest.dropped == 3
+    loop.close()
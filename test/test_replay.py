@@ -0,0 +1,56 @@
+from src.capture import CaptureReader, CaptureWriter
+from src.replay import Replayer, remap_device
+
+import can
+
+def write_capture(path):
+    with CaptureWriter(path, chunk_records=3) as writer:
+        for i in range(10):
+            writer.write(can.Message(
+                arbitration_id=0x561 if i % 2 else 0x701,
+                timestamp=100.0 + i * 0.002,
+                data=[i],
+                is_extended_id=False,
+            ))
+
+def replay(path, **kwargs):
+    sender = can.interface.Bus(interface="virtual", channel="test_replay")
+    receiver = can.interface.Bus(interface="virtual", channel="test_replay")
+    with CaptureReader(path) as reader:
+        stats = Replayer(reader, sender, **kwargs).run()
+    received = []
+    while (msg := receiver.recv(0)) is not None:
+        received.append(msg)
+    sender.shutdown()
+    receiver.shutdown()
+    return stats, received
+
+def test_replay_timing(tmp_path):
+    path = tmp_path / "capture.bcap"
+    write_capture(path)
+    stats, received = replay(path)
+    assert stats.sent == 10
+    assert len(received) == 10
+    assert stats.duration >= 0.018
+    assert stats.timing_error.count == 10
+
+def test_replay_filter_and_remap(tmp_path):
+    path = tmp_path / "capture.bcap"
+    write_capture(path)
+    stats, received = replay(path, speed=0, ids=[0x561], remap={(0x561, False): 0x562})
+    assert stats.sent == 5
+    assert {msg.arbitration_id for msg in received} == {0x562}
+    assert [msg.data[0] for msg in received] == [1, 3, 5, 7, 9]
+
+def test_remap_device():
+    assert remap_device(0x561, 2) == 0x562
+    assert remap_device(0x08000001, 2) == 0x08000001
+    assert remap_device(0x561, 2, extended=True) == 0x561
+
+def test_remap_keeps_extended_ids_apart(tmp_path):
+    path = tmp_path / "capture.bcap"
+    with CaptureWriter(path) as writer:
+        for i, extended in enumerate((False, True)):
+            writer.write(can.Message(arbitration_id=0x561, timestamp=100.0 + i * 0.001, data=[i], is_extended_id=extended))
+    _, received = replay(path, speed=0, remap={(0x561, False): 0x562})
+    assert [(msg.arbitration_id, msg.is_extended_id) for msg in received] == [(0x562, False), (0x561, True)]
@@ -0,0 +1,70 @@
+from src.histogram import Histogram
+from src.scheduler import Scheduler
+
+import asyncio
+import time
+
+def test_histogram_percentile():
+    hist = Histogram([1, 2, 3])
+    for value in [0.5, 1.5, 1.5, 2.5, 10]:
+        hist.observe(value)
+    assert hist.count == 5
+    assert hist.counts == [1, 2, 1, 1]
+    assert hist.percentile(50) == 2
+    assert hist.percentile(100) == 10
+    assert hist.min == 0.5
+
+def test_fixed_rate_does_not_drift():
+    period = 0.01
+    runs = 20
+
+    async def main():
+        scheduler = Scheduler()
+        done = asyncio.Event()
+        count = 0
+        elapsed = None
+
+        def work():
+            nonlocal count, elapsed
+            count += 1
+            if count == runs:
+                elapsed = time.monotonic() - start
+                done.set()
+            # Work taking a large fraction of the period must not add drift
+            time.sleep(period / 2)
+
+        start = time.monotonic()
+        task = asyncio.create_task(scheduler.run("work", period, work))
+        await done.wait()
+        task.cancel()
+        return scheduler.stats["work"], elapsed
+
+    stats, elapsed = asyncio.run(main())
+    # The loop may fit one more run in before the task is cancelled
+    assert runs <= stats.runs <= runs + 1
+    assert stats.period_histogram.count == stats.runs - 1
+    assert elapsed < runs * period + 5 * period
+
+def test_missed_deadlines_are_counted():
+    period = 0.005
+
+    async def main():
+        scheduler = Scheduler()
+        count = 0
+        done = asyncio.Event()
+
+        def work():
+            nonlocal count
+            count += 1
+            if count == 1:
+                time.sleep(period * 4.5)
+            elif count == 3:
+                done.set()
+
+        task = asyncio.create_task(scheduler.run("slow", period, work))
+        await done.wait()
+        task.cancel()
+        return scheduler.stats["slow"]
+
+    stats = asyncio.run(main())
+    assert stats.missed >= 3
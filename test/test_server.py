@@ -0,0 +1,77 @@
+from src.bus import BusRegistry
+from src.configuration.v1 import CanBusSpec
+from src.server import BusServer, Frame, Merger
+
+import asyncio
+import can
+
+BUSSES = {
+    "tcan": CanBusSpec("virtual", "test_server_tcan"),
+    "mcan": CanBusSpec("virtual", "test_server_mcan"),
+}
+
+
+def message(arbitration_id, timestamp=0.0):
+    return can.Message(arbitration_id=arbitration_id, timestamp=timestamp, data=[0], is_extended_id=False)
+
+
+def test_merger_orders_by_timestamp():
+    now = [0.0]
+    released = []
+    merger = Merger(["a", "b"], released.append, window=1.0, clock=lambda: now[0])
+    merger.push(Frame("a", message(1, 2.0)))
+    merger.push(Frame("a", message(2, 4.0)))
+    # Held until b shows it has nothing earlier
+    assert released == []
+    merger.push(Frame("b", message(3, 3.0)))
+    assert [frame.message.timestamp for frame in released] == [2.0, 3.0]
+
+    # a idle: the frame of b is released once the window expired
+    merger.push(Frame("b", message(4, 5.0)))
+    assert len(released) == 3
+    now[0] = 1.5
+    merger.flush()
+    assert [frame.message.timestamp for frame in released] == [2.0, 3.0, 4.0, 5.0]
+
+    merger.push(Frame("a", message(5, 1.0)))
+    assert merger.late == 1
+    assert released[-1].message.arbitration_id == 5
+
+
+def test_serves_every_bus():
+    async def main():
+        registry = BusRegistry()
+        peers = {name: can.interface.Bus(interface="virtual", channel=spec.channel) for name, spec in BUSSES.items()}
+        async with BusServer(registry, BUSSES, reorder_window=0.2) as server:
+            everything = server.subscribe()
+            filtered = server.subscribe(ids={0x701}, busses=["mcan"])
+            slow = server.subscribe(maxsize=2)
+
+            for i in range(5):
+                peers["tcan"].send(message(0x701))
+                peers["mcan"].send(message(0x701))
+                peers["mcan"].send(message(0x702))
+
+            frames = [await asyncio.wait_for(everything.get(), 1.0) for _ in range(15)]
+            matched = [await asyncio.wait_for(filtered.get(), 1.0) for _ in range(5)]
+
+            await server.send("tcan", message(0x123))
+            sent = await asyncio.to_thread(peers["tcan"].recv, 1.0)
+            stats = server.as_dict()
+            dropped = slow.dropped
+        for peer in peers.values():
+            peer.shutdown()
+        registry.shutdown()
+        return frames, matched, filtered.qsize(), sent, stats, dropped
+
+    frames, matched, remaining, sent, stats, dropped = asyncio.run(main())
+    timestamps = [frame.message.timestamp for frame in frames]
+    assert timestamps == sorted(timestamps)
+    assert {frame.bus for frame in frames} == {"tcan", "mcan"}
+    assert all(frame.bus == "mcan" and frame.message.arbitration_id == 0x701 for frame in matched)
+    assert remaining == 0
+    assert sent.arbitration_id == 0x123
+    assert stats["busses"]["tcan"]["received"] == 5
+    assert stats["busses"]["mcan"]["received"] == 10
+    # The slow subscriber only lost its own frames
+    assert dropped == 13
@@ -0,0 +1,89 @@
+from src.shmring import HEADER, MAGIC, OWNER, OWNER_OFFSET, RingInUse, RingReader, RingWriter
+
+from multiprocessing import shared_memory
+
+import can
+import os
+import pytest
+import subprocess
+import sys
+
+
+def message(arbitration_id, timestamp):
+    return can.Message(arbitration_id=arbitration_id, timestamp=timestamp, data=[1, 2, 3], is_extended_id=False)
+
+
+@pytest.fixture
+def ring_name():
+    return f"bench-test-{os.getpid()}"
+
+
+def test_read_follows_writer(ring_name):
+    with RingWriter(ring_name, capacity=8, channels=["tcan", "mcan"]) as writer:
+        with RingReader(ring_name) as reader:
+            assert reader.channels == ["tcan", "mcan"]
+            assert reader.read() == []
+            writer.write(message(0x701, 1.0), channel=1)
+            writer.write(message(0x702, 2.0))
+            records = reader.read()
+            assert [(r.arbitration_id, r.channel, r.timestamp) for r in records] == [(0x701, 1, 1.0), (0x702, 0, 2.0)]
+            writer.write(message(0x703, 3.0))
+            [(channel, msg)] = reader.messages()
+            assert msg.arbitration_id == 0x703
+            assert bytes(msg.data) == b"\x01\x02\x03"
+            assert reader.overruns == 0
+            assert not reader.closed
+        assert writer.head == 3
+    assert not os.path.exists(f"/dev/shm/{ring_name}")
+
+
+def test_overrun_is_counted(ring_name):
+    with RingWriter(ring_name, capacity=4) as writer:
+        reader = RingReader(ring_name)
+        for i in range(10):
+            writer.write(message(0x500 + i, float(i)))
+        records = reader.read()
+        assert [r.arbitration_id for r in records] == [0x506, 0x507, 0x508, 0x509]
+        assert reader.overruns == 6
+
+        latest = RingReader(ring_name, latest=True)
+        assert latest.read() == []
+        writer.write(message(0x600, 10.0))
+        assert [r.arbitration_id for r in latest.read()] == [0x600]
+        latest.close()
+
+        writer.close()
+        assert reader.closed
+        reader.close()
+
+
+def test_stale_segment_is_replaced(ring_name):
+    # Left behind by a server which did not shut down cleanly
+    stale = shared_memory.SharedMemory(ring_name, create=True, size=16)
+    stale.close()
+    with RingWriter(ring_name, capacity=4, channels=["tcan"]):
+        with RingReader(ring_name) as reader:
+            assert reader.channels == ["tcan"]
+            assert reader.read() == []
+
+
+def test_live_ring_is_not_taken_over(ring_name):
+    with RingWriter(ring_name, capacity=4, channels=["tcan"]) as writer:
+        with pytest.raises(RingInUse, match=str(os.getpid())):
+            RingWriter(ring_name, capacity=4, channels=["mcan"])
+        writer.write(message(0x701, 1.0))
+        with RingReader(ring_name) as reader:
+            assert reader.channels == ["tcan"]
+            assert len(reader.read()) == 1
+
+
+def test_ring_of_a_dead_writer_is_replaced(ring_name):
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    stale = shared_memory.SharedMemory(ring_name, create=True, size=4096)
+    stale.buf[:8] = MAGIC
+    stale.buf[HEADER.size - 1] = 1
+    OWNER.pack_into(stale.buf, OWNER_OFFSET, int(dead.stdout))
+    stale.close()
+    with RingWriter(ring_name, capacity=4, channels=["tcan"]):
+        with RingReader(ring_name) as reader:
+            assert reader.channels == ["tcan"]
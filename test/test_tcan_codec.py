@@ -0,0 +1,47 @@
+from src.dispatch import SystemModeCommand, autocal, to_message
+from src.tcan_codec import AXIS_COMMAND, AXIS_STATUS, SYSTEM_MODE_COMMAND, autocal_payload, decode
+from src.tcan_commands import SystemMode
+
+import can
+
+
+def test_encoder_reuses_message():
+    encoder = AXIS_COMMAND.encoder(3)
+    first = encoder.encode(-100, 1, 0, 0)
+    assert first.arbitration_id == 0x563
+    assert bytes(first.data) == bytes([0xFF, 0x9C, 0, 1, 0, 0, 0, 0])
+    data = first.data
+    second = encoder.assign(b"\x01\x02")
+    assert second is first and second.data is data
+    assert bytes(second.data) == bytes([1, 2, 0, 0, 0, 0, 0, 0])
+
+
+def test_encoder_snapshot_is_independent():
+    encoder = AXIS_COMMAND.encoder(3)
+    encoder.encode(1, 2, 3, 4)
+    snapshot = encoder.snapshot()
+    assert snapshot is not encoder.message
+    encoder.assign(b"\xFF")
+    assert snapshot.arbitration_id == 0x563 and not snapshot.is_extended_id
+    assert bytes(snapshot.data) == AXIS_COMMAND.pack(1, 2, 3, 4)
+
+
+def test_command_payloads():
+    assert autocal_payload() == bytes([0, 0, 0xFF, 0x01, 0, 0, 0, 0])
+    assert autocal(1).data == autocal_payload()
+    msg = to_message(SystemModeCommand(2, SystemMode.REMOTE))
+    assert msg.arbitration_id == 0x502
+    assert bytes(msg.data) == SYSTEM_MODE_COMMAND.pack(SystemMode.REMOTE) == b"\x01"
+
+
+def test_decode_status_record():
+    msg = can.Message(arbitration_id=0x761, data=AXIS_STATUS.pack(-5, 6, 7, 8), is_extended_id=False)
+    record = decode(msg)
+    assert type(record).__name__ == "TcuStatCanAxis"
+    assert record.axis_1 == -5
+    assert tuple(record) == (-5, 6, 7, 8)
+    assert record.as_dict()["axis_4"] == 8
+    assert not hasattr(record, "__dict__")
+
+    assert decode(can.Message(arbitration_id=0x761, data=[0], is_extended_id=False)) is None
+    assert decode(can.Message(arbitration_id=0x561, data=[0] * 8, is_extended_id=False)) is None
@@ -0,0 +1,35 @@
+from src.tcan_commands import TCAN_ID
+from src.telemetry import TelemetryCache, TelemetryDecoder
+
+import can
+
+def frame(arbitration_id, data):
+    return can.Message(arbitration_id=arbitration_id, data=data, is_extended_id=False, timestamp=1.5)
+
+def test_decode_axis_status():
+    cache = TelemetryCache()
+    decoder = TelemetryDecoder(cache)
+    decoder.on_message_received(frame(0x761, [0xFF, 0x9C, 0, 1, 0, 0, 0, 0]))
+    value = cache.get(1, TCAN_ID.CAN_ID_TCU_STAT_CAN_AXIS)
+    assert value.values == (-100, 1, 0, 0)
+    assert value.timestamp == 1.5
+    assert cache.device_dict(1)["can_axis"]["values"]["axis_1"] == -100
+
+def test_demux_by_device():
+    cache = TelemetryCache()
+    decoder = TelemetryDecoder(cache)
+    decoder.on_message_received(frame(0x701, [1]))
+    decoder.on_message_received(frame(0x702, [2]))
+    decoder.on_message_received(frame(0x702, [0]))
+    assert cache.get(1, TCAN_ID.CAN_ID_TCU_HEARTBEAT).values == (1,)
+    assert cache.get(2, TCAN_ID.CAN_ID_TCU_HEARTBEAT).values == (0,)
+    assert cache.get(2, TCAN_ID.CAN_ID_TCU_HEARTBEAT).count == 2
+    assert cache.devices == [1, 2]
+
+def test_ignores_commands_and_short_frames():
+    cache = TelemetryCache()
+    decoder = TelemetryDecoder(cache)
+    decoder.on_message_received(frame(0x561, [0] * 8))
+    decoder.on_message_received(frame(0x7B1, [0, 1]))
+    assert len(cache) == 0
+    assert decoder.malformed == 1
@@ -0,0 +1,72 @@
+from src.bus import BusRegistry
+from src.configuration.v1 import CanBusSpec
+from src.transport import AsyncBus, TransportFull
+
+import asyncio
+import can
+import pytest
+
+def test_send_and_recv():
+    async def main():
+        registry = BusRegistry()
+        a = AsyncBus(registry.acquire(CanBusSpec("virtual", "test_transport"))).start()
+        peer = can.interface.Bus(interface="virtual", channel="test_transport")
+        await a.send(can.Message(arbitration_id=0x560, data=[1, 2], is_extended_id=False))
+        received = await asyncio.get_running_loop().run_in_executor(None, peer.recv, 1.0)
+        peer.send(can.Message(arbitration_id=0x761, data=[3], is_extended_id=False))
+        echoed = await asyncio.wait_for(a.recv(), 1.0)
+        await a.close()
+        peer.shutdown()
+        registry.shutdown()
+        return received, echoed
+
+    received, echoed = asyncio.run(main())
+    assert received.arbitration_id == 0x560
+    assert echoed.arbitration_id == 0x761
+
+def test_send_nowait_full():
+    async def main():
+        registry = BusRegistry()
+        transport = AsyncBus(
+            registry.acquire(CanBusSpec("virtual", "test_transport_full")),
+            tx_maxsize=1,
+        ).start()
+        msg = can.Message(arbitration_id=0x500, data=[0], is_extended_id=False)
+        transport.send_nowait(msg)
+        with pytest.raises(TransportFull):
+            transport.send_nowait(msg)
+        dropped = transport.stats["dropped"]
+        await transport.close()
+        registry.shutdown()
+        return dropped
+
+    assert asyncio.run(main()) == 1
+
+def test_send_error_does_not_drop_the_rest_of_the_batch():
+    async def main():
+        registry = BusRegistry()
+        shared = registry.acquire(CanBusSpec("virtual", "test_transport_error"))
+        peer = can.interface.Bus(interface="virtual", channel="test_transport_error")
+        send = shared.send
+
+        def failing_send(msg, timeout=None):
+            if msg.arbitration_id == 0x500:
+                raise can.CanError("bus off")
+            send(msg, timeout)
+
+        shared.send = failing_send
+        transport = AsyncBus(shared).start()
+        for arbitration_id in (0x500, 0x501, 0x502):
+            transport.send_nowait(can.Message(arbitration_id=arbitration_id, data=[0], is_extended_id=False))
+        loop = asyncio.get_running_loop()
+        received = [await loop.run_in_executor(None, peer.recv, 1.0) for _ in range(2)]
+        await transport.close()
+        stats = transport.stats
+        peer.shutdown()
+        registry.shutdown()
+        return received, stats
+
+    received, stats = asyncio.run(main())
+    assert [msg.arbitration_id for msg in received] == [0x501, 0x502]
+    assert stats["errors"] == 1
+    assert stats["sent"] == 2
@@ -0,0 +1,56 @@
+from src.tcan_codec import HEARTBEAT_STATUS
+from src.watchdog import HeartbeatWatchdog, TimerWheel
+
+import can
+
+
+def heartbeat(device):
+    return can.Message(arbitration_id=HEARTBEAT_STATUS.arbitration_id(device), data=[1], is_extended_id=False)
+
+
+def test_timer_wheel():
+    wheel = TimerWheel(0.01, 0.1, now=0.0)
+    wheel.schedule("a", 0.05)
+    wheel.schedule("b", 0.05)
+    wheel.schedule("a", 0.08)
+    # Beyond the horizon, shares a slot with earlier deadlines
+    wheel.schedule("c", 0.5)
+    wheel.cancel("b")
+    assert wheel.expire(0.07) == []
+    assert wheel.expire(0.08) == [("a", 0.08)]
+    assert wheel.expire(0.49) == []
+    assert wheel.expire(0.6) == [("c", 0.5)]
+    assert len(wheel) == 0
+
+
+def test_watchdog_detects_loss_and_recovery():
+    now = [0.0]
+    lost = []
+    watchdog = HeartbeatWatchdog(lost.append, timeout=0.5, resolution=0.01, clock=lambda: now[0])
+    watchdog.watch(1)
+    for t in (0.1, 0.4, 0.8):
+        now[0] = t
+        watchdog.on_message_received(heartbeat(1))
+        # Not watched
+        watchdog.on_message_received(heartbeat(2))
+        watchdog.check()
+    now[0] = 1.295
+    watchdog.check()
+    assert lost == []
+
+    now[0] = 1.305
+    watchdog.check()
+    assert lost == [1]
+    now[0] = 1.31
+    watchdog.acted(1)
+    now[0] = 2.0
+    watchdog.check()
+    assert lost == [1]
+
+    watchdog.on_message_received(heartbeat(1))
+    stats = watchdog.as_dict()
+    device = stats["devices"]["1"]
+    assert (device["alive"], device["heartbeats"], device["timeouts"], device["recoveries"]) == (True, 4, 1, 1)
+    assert abs(watchdog.detection.max - 0.005) < 1e-9
+    assert abs(watchdog.action.max - 0.005) < 1e-9
+    assert "2" not in stats["devices"]
@@ -0,0 +1,41 @@
+from src.wsclient import GUID, WebSocketClient
+
+import base64
+import hashlib
+import socket
+import threading
+import time
+
+
+def silent_server(listener, delay):
+    """
+    Accept the upgrade, stay quiet for delay seconds, then send one message.
+    """
+    conn, _ = listener.accept()
+    with conn:
+        reader = conn.makefile("rb")
+        key = None
+        while (line := reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"sec-websocket-key":
+                key = value.strip()
+        accept = base64.b64encode(hashlib.sha1(key + GUID).digest())
+        conn.sendall(
+            b"HTTP/1.1 101 Switching Protocols\r\n"
+            b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+        )
+        time.sleep(delay)
+        conn.sendall(bytes([0x82, 2]) + b"ok")
+        reader.read(1)
+
+
+def test_recv_outlives_the_connect_timeout():
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    server = threading.Thread(target=silent_server, args=(listener, 0.3), daemon=True)
+    server.start()
+    with WebSocketClient("127.0.0.1", port, "/ws", timeout=0.1) as client:
+        assert client.recv() == b"ok"
+    server.join(1.0)
+    listener.close()